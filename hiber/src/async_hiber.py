@@ -0,0 +1,256 @@
+import time
+import asyncio
+import datetime
+
+import serial
+
+from hiber import LPGAN_API_TxBytes, LPGAN_API_Rx, ModemState, TIME_DELTA
+from clock_sync import ClockSync
+from transport import valid_port
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+
+class AsyncHiber:
+    '''
+    asyncio driver for the Hiber modem.
+
+    Same commands as Hiber, but every round trip is awaitable so a single
+    event loop can drive many modems.  Commands to one modem are still
+    strictly write->response; a lock keeps concurrent callers from
+    interleaving on the same link.  Lines that are not API(...) responses
+    (boot banner, debug output) are skipped, and the late response of a
+    command that timed out is dropped instead of being taken by the next
+    command.
+    '''
+    def __init__(self, port=[], baudrate=19200, arduino=False, timeout=10):
+        if not isinstance(port, str) or not valid_port(port):
+            raise ValueError('Invalid COM Port')
+        if baudrate not in serial.Serial.BAUDRATES:
+            raise ValueError('Not a valid baudrate')
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.modem = ModemState()
+        self.clock_sync = ClockSync(TIME_DELTA)
+
+        self._arduino = arduino
+        self._reader = None
+        self._writer = None
+        self._lock = None
+        # Responses still owed to commands that timed out
+        self._abandoned = 0
+
+    @classmethod
+    def from_streams(cls, reader, writer, arduino=False, timeout=10):
+        '''
+        Build a driver on already open asyncio streams.
+
+        Args:
+            reader: asyncio.StreamReader
+            writer: asyncio.StreamWriter
+        '''
+        self = cls.__new__(cls)
+        self.port = None
+        self.baudrate = None
+        self.timeout = timeout
+        self.modem = ModemState()
+        self.clock_sync = ClockSync(TIME_DELTA)
+        self._arduino = arduino
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+        self._abandoned = 0
+        return self
+
+    async def start(self, ready_timeout=2.0, probe_interval=0.1):
+        '''
+        Open the serial port through pyserial-asyncio and wait for the modem.
+
+        Args:
+            ready_timeout: Max seconds to wait for the modem
+            probe_interval: Seconds between readiness probes
+        Returns:
+            True if the modem answered before the deadline (see wait_ready)
+        '''
+        if serial_asyncio is None:
+            raise ImportError('AsyncHiber.start requires pyserial-asyncio')
+        self._reader, self._writer = await serial_asyncio.open_serial_connection(
+            url=self.port,
+            baudrate=self.baudrate,
+            bytesize=8,
+            parity='N',
+            stopbits=1,
+        )
+        self._lock = asyncio.Lock()
+        return await self.wait_ready(ready_timeout, probe_interval)
+
+    async def wait_ready(self, timeout=2.0, probe_interval=0.1):
+        '''
+        Probe with get_firmware_version until the modem answers, then drain
+        the answers to the other probes, as Hiber.wait_ready does.
+        '''
+        probe = LPGAN_API_TxBytes.get_firmware_version()
+        if self._arduino:
+            probe = LPGAN_API_TxBytes.ard_frame(probe)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + timeout
+        wait = probe_interval
+        outstanding = 0
+        ready = False
+        async with self._lock:
+            while not ready and loop.time() < deadline:
+                self._writer.write(probe)
+                await self._writer.drain()
+                outstanding += 1
+                ready = await self._read_probe_answer(max(min(wait, deadline - loop.time()), probe_interval))
+                if ready:
+                    outstanding -= 1
+                wait *= 2
+            if ready and outstanding:
+                # Answers to earlier probes may still be on the way
+                spacing = loop.time() - started + probe_interval
+                while outstanding and await self._read_probe_answer(spacing):
+                    outstanding -= 1
+        return ready
+
+    async def _read_probe_answer(self, timeout):
+        '''
+        True once an API(...) line arrives within `timeout` seconds.
+        '''
+        try:
+            line = await asyncio.wait_for(self._read_api_line(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return bool(line)
+
+    async def _read_api_line(self):
+        while True:
+            line = await self._reader.readline()
+            if not line or line.startswith(b"API("):
+                return line
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+            self._reader = None
+
+    async def command(self, name, *args):
+        '''
+        Send one LPGAN command and decode its response.
+
+        Args:
+            name: LPGAN_API_TxBytes/LPGAN_API_Rx method name, e.g. 'get_location'
+            args: Arguments for the LPGAN_API_TxBytes encoder
+        Returns:
+            Result of the matching LPGAN_API_Rx decoder
+        '''
+        message = getattr(LPGAN_API_TxBytes, name)(*args)
+        if self._arduino:
+            message = LPGAN_API_TxBytes.ard_frame(message)
+        async with self._lock:
+            self._writer.write(message)
+            await self._writer.drain()
+            abandoned = self._abandoned
+            try:
+                result = await asyncio.wait_for(self._read_response(), self.timeout)
+            except asyncio.TimeoutError:
+                # Not counted again if a late line was dropped meanwhile:
+                # it may have been this command's own response
+                if self._abandoned >= abandoned:
+                    self._abandoned += 1
+                raise
+        return getattr(LPGAN_API_Rx, name)(result.decode())
+
+    async def _read_response(self):
+        '''
+        Next API(...) line (b'' at end of stream), after dropping the late
+        responses of timed-out commands.
+        '''
+        while True:
+            line = await self._read_api_line()
+            if not line or not self._abandoned:
+                return line
+            self._abandoned -= 1
+
+    async def initalization(self):
+        '''
+        Hiber Modem initialization sequence.
+        '''
+        await self.toggle_payload_over_debug(True)
+        await self.get_modem_info()
+        await self.get_firmware_version()
+        await self.sync_time()
+
+    async def sync_time(self):
+        '''
+        Sample the modem clock and reset it if the predicted offset is
+        beyond TIME_DELTA (see ClockSync).
+        '''
+        sent = time.monotonic()
+        result = await self.get_datetime()
+        received = time.monotonic()
+        modem_time = datetime.datetime.strptime(result.datetime, '%Y-%m-%dT%H:%M:%SZ')
+        self.clock_sync.add_sample(sent, received, modem_time)
+        if self.clock_sync.needs_correction():
+            await self.command('set_datetime', self.clock_sync.corrected_time())
+            self.clock_sync.corrected()
+
+    async def set_gps_mode(self, enabled):
+        return await self.command('set_gps_mode', enabled)
+
+    async def do_gps_fix(self, input_string=None):
+        return await self.command('do_gps_fix', input_string)
+
+    async def get_firmware_version(self):
+        result = await self.command('get_firmware_version')
+        self.modem.update(result)
+        return result
+
+    async def get_modem_info(self):
+        result = await self.command('get_modem_info')
+        self.modem.update(result)
+        return result
+
+    async def set_modem_number(self, modem_number):
+        return await self.command('set_modem_number', modem_number)
+
+    async def get_location(self):
+        return await self.command('get_location')
+
+    async def set_location(self, latitude, longitude, altitude):
+        result = await self.command('set_location', latitude, longitude, altitude)
+        self.modem.update(result)
+        return result
+
+    async def get_datetime(self):
+        return await self.command('get_datetime')
+
+    async def set_datetime(self, dt):
+        result = await self.command('set_datetime', dt)
+        self.modem.update(result)
+        self.clock_sync.reset()
+        return result
+
+    async def get_next_alarm(self):
+        return await self.command('get_next_alarm')
+
+    async def get_next_pass(self):
+        result = await self.command('get_next_pass')
+        self.modem.update(result)
+        return result
+
+    async def go_to_sleep(self):
+        return await self.command('go_to_sleep')
+
+    async def toggle_payload_over_debug(self, is_enabled):
+        return await self.command('toggle_payload_over_debug', is_enabled)
+
+    async def set_payload(self, payload):
+        return await self.command('set_payload', payload)
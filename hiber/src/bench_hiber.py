@@ -0,0 +1,237 @@
+'''
+Benchmark suite for the Hiber command path.
+
+Measures:
+    encode:     cost of every LPGAN_API_Tx (and LPGAN_API_TxBytes) method
+    decode:     cost of every LPGAN_API_Rx method on realistic responses
+    bulk_parse: throughput of parsing a large generated response log
+    replay:     throughput of replaying a generated traffic capture
+    round_trip: end-to-end Hiber command latency against SimulatedSerial
+                (and a PtyModem when the platform has ptys)
+
+Results are written as JSON so runs can be compared between releases.
+
+Usage:
+    python bench_hiber.py [-o bench_results.json] [--quick]
+'''
+import os
+import sys
+import json
+import random
+import time
+import timeit
+import argparse
+import datetime
+import platform
+import tempfile
+
+import serial
+
+from hiber import Hiber, LPGAN_API_Tx, LPGAN_API_TxBytes, LPGAN_API_Rx
+from lpgan_sim import SimulatedModem, SimulatedSerial, PtyModem
+from capture import TX, RX, TrafficCapture
+from replay import replay
+
+
+ENCODE_ARGS = {
+    'set_gps_mode': (True,),
+    'do_gps_fix': ('12345,223452',),
+    'get_firmware_version': (),
+    'get_modem_info': (),
+    'set_modem_number': ('ABCD 1234',),
+    'get_location': (),
+    'set_location': (47.686449, -122.254220, 1.5),
+    'get_datetime': (),
+    'set_datetime': (datetime.datetime(2019, 10, 25, 10, 59, 48),),
+    'get_next_alarm': (),
+    'get_next_pass': (),
+    'go_to_sleep': (),
+    'toggle_payload_over_debug': (True,),
+    'set_payload': (20,),
+}
+
+DECODE_LINES = {
+    'set_gps_mode': 'API(600: 0)\r\n',
+    'do_gps_fix': 'API(600)\r\n',
+    'get_firmware_version': 'API(600: cn-release-v1.0.0-1-gd193bbe4)\r\n',
+    'get_modem_info': 'API(600: GAMMA; 2; 1; 27AA 0DD8; 665456088)\r\n',
+    'set_modem_number': 'API(600)\r\n',
+    'get_location': 'API(600: 0.000000; 0.000000; 136121891; -2147483648; 0.000000)\r\n',
+    'set_location': 'API(600: 54.333229; 4.212332; -157938633; -2147483648; 0.000000)\r\n',
+    'get_datetime': 'API(600: 2019-02-25T16:14:40Z)\r\n',
+    'set_datetime': 'API(600: 2019-02-25T16:13:38Z) Current date: 2019-02-25T16:13:38Z\r\n',
+    'get_next_alarm': 'API(600: 3; 39)\r\n',
+    'get_next_pass': 'API(600: 1298)\r\n',
+    'go_to_sleep': 'API(602: 36; 3)\r\n',
+    'toggle_payload_over_debug': 'API(600: 1)\r\n',
+    'set_payload': 'API(600: 140)\r\n',
+}
+
+ROUND_TRIP_COMMANDS = ('get_next_pass', 'get_location', 'get_next_alarm', 'get_datetime')
+
+
+def per_call(func, number, repeat=5):
+    '''
+    Best-of-repeat seconds per call.
+    '''
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bench_encode(number, encoder_class=LPGAN_API_Tx):
+    results = {}
+    for name, args in ENCODE_ARGS.items():
+        encoder = getattr(encoder_class, name)
+        results[name] = per_call(lambda: encoder(*args), number)
+    return results
+
+
+def bench_decode(number):
+    results = {}
+    for name, line in DECODE_LINES.items():
+        decoder = getattr(LPGAN_API_Rx, name)
+        results[name] = per_call(lambda: decoder(line), number)
+    return results
+
+
+def generate_log(lines, seed=0):
+    '''
+    Response log as bytes, cycling through the DECODE_LINES shapes.
+
+    Countdowns, alarms, locations and timestamps change from line to line
+    as in live modem output, so the benchmark measures parsing rather
+    than repeated identical lines.
+    '''
+    rng = random.Random(seed)
+    shapes = [lambda i, line=line.encode(): line for line in DECODE_LINES.values()]
+    shapes += [
+        lambda i: b"API(600: %d)\r\n" % (i % 5400),
+        lambda i: b"API(600: %d; %d)\r\n" % (i % 8, i % 3600),
+        lambda i: b"API(600: %.6f; %.6f; %d; -2147483648; %.6f)\r\n" % (
+            rng.uniform(-90, 90), rng.uniform(-180, 180), i, rng.uniform(0, 100)),
+        lambda i: b"API(600: 2019-02-25T%02d:%02d:%02dZ)\r\n" % (i // 3600 % 24, i // 60 % 60, i % 60),
+    ]
+    return b"".join(shapes[i % len(shapes)](i) for i in range(lines))
+
+
+def bench_bulk_parse(lines):
+    log = generate_log(lines)
+    parse = LPGAN_API_Rx.parse
+
+    start = time.perf_counter()
+    count = 0
+    for line in log.splitlines():
+        parse(line)
+        count += 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        'lines': count,
+        'bytes': len(log),
+        'seconds': elapsed,
+        'lines_per_second': count / elapsed,
+        'megabytes_per_second': len(log) / elapsed / 1e6,
+    }
+
+
+def bench_replay(exchanges):
+    commands = [(name.encode() + b"\r\n", line.encode()) for name, line in DECODE_LINES.items()]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.hcap')
+        with TrafficCapture(path) as capture:
+            for i in range(exchanges):
+                command, response = commands[i % len(commands)]
+                capture.record(TX, command)
+                capture.record(RX, response)
+        size = os.path.getsize(path)
+
+        start = time.perf_counter()
+        count = sum(1 for _ in replay(path))
+        elapsed = time.perf_counter() - start
+
+    return {
+        'lines': count,
+        'bytes': size,
+        'seconds': elapsed,
+        'lines_per_second': count / elapsed,
+        'megabytes_per_second': size / elapsed / 1e6,
+    }
+
+
+def _latencies(h, count):
+    results = {}
+    for name in ROUND_TRIP_COMMANDS:
+        samples = []
+        for _ in range(count):
+            start = time.perf_counter()
+            h._command(name)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        results[name] = {
+            'mean': sum(samples) / len(samples),
+            'p50': samples[len(samples) // 2],
+            'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        }
+    return results
+
+
+def bench_round_trip(count):
+    results = {}
+
+    h = Hiber('COM1', 19200)
+    h._ser = SimulatedSerial(SimulatedModem())
+    h._ser.open()
+    results['simulated_serial'] = _latencies(h, count)
+
+    if hasattr(os, 'openpty'):
+        with PtyModem() as pty:
+            h = Hiber('COM1', 19200)
+            h._ser = serial.Serial(pty.port, 19200, timeout=2)
+            try:
+                results['pty'] = _latencies(h, count)
+            finally:
+                h._ser.close()
+    return results
+
+
+def run(quick=False):
+    scale = 10 if quick else 1
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'units': 'seconds',
+        },
+        'encode': bench_encode(20000 // scale),
+        'encode_bytes': bench_encode(20000 // scale, LPGAN_API_TxBytes),
+        'decode': bench_decode(20000 // scale),
+        'bulk_parse': bench_bulk_parse(1000000 // scale),
+        'replay': bench_replay(200000 // scale),
+        'round_trip': bench_round_trip(200 // scale),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-o', '--output', default='bench_results.json')
+    parser.add_argument('--quick', action='store_true', help='Smaller run for smoke testing')
+    args = parser.parse_args()
+
+    results = run(args.quick)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    for group in ('encode', 'encode_bytes', 'decode'):
+        for name, seconds in results[group].items():
+            print(f"{group:<12} {name:<26} {seconds * 1e9:8.0f} ns")
+    bulk = results['bulk_parse']
+    print(f"bulk    {bulk['lines_per_second']:,.0f} lines/s  {bulk['megabytes_per_second']:.1f} MB/s")
+    rep = results['replay']
+    print(f"replay  {rep['lines_per_second']:,.0f} lines/s  {rep['megabytes_per_second']:.1f} MB/s")
+    for link, commands in results['round_trip'].items():
+        for name, stats in commands.items():
+            print(f"rtt     {link:<16} {name:<16} p50 {stats['p50'] * 1e6:8.0f} us  p99 {stats['p99'] * 1e6:8.0f} us")
+
+
+if __name__ == "__main__":
+    main()
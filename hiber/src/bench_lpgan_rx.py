@@ -0,0 +1,97 @@
+'''
+Benchmark of the LPGAN_API_Rx response parser.
+
+Compares LPGAN_API_Rx.parse against the original find/strip/split
+implementation of parse_api_message, kept here as the reference both with
+its per-call print (sent to os.devnull) and without it.
+"uniq" rows parse countdown, alarm, location and datetime lines that all
+differ, as a modem's live output does.
+
+Usage:
+    python bench_lpgan_rx.py [-n NUMBER]
+'''
+import argparse
+import contextlib
+import os
+import timeit
+
+from hiber import LPGAN_API_Rx
+
+
+SAMPLES = [
+    'API(600)\r\n',
+    'API(600: 1298)\r\n',
+    'API(600: 3; 39)\r\n',
+    'API(600: GAMMA; 2; 1; 27AA 0DD8; 665456088)\r\n',
+    'API(600: 54.333229; 4.212332; -157938633; -2147483648; 0.000000)\r\n',
+    'API(600: 2019-02-25T16:13:38Z) Current date: 2019-02-25T16:13:38Z\r\n',
+    'API(525)\r\n',
+]
+
+
+def legacy_parse_api_message(message, verbose=False):
+    if message.startswith("API"):
+        message = message[:message.find(')')]
+        result = message[message.find("API(") + 4 :].strip().strip(")").split(":",1)
+        if len(result) > 1:
+            result[1] = result[1].split(";")
+            result[1] = [result.lstrip() for result in result[1]]
+        else:
+            result = [result[0], []]
+    else:
+        raise ValueError("Invalid API Rx string")
+    if verbose:
+        print(result)
+    return [result[0], result[1]]
+
+
+def legacy_parse_api_message_verbose(message):
+    return legacy_parse_api_message(message, True)
+
+
+def unique_samples(count):
+    shapes = [
+        'API(600: %d)\r\n',
+        'API(600: 3; %d)\r\n',
+        'API(600: 54.%06d; 4.212332; -157938633; -2147483648; 0.000000)\r\n',
+        'API(600: 2019-02-25T16:%02d:38Z)\r\n',
+    ]
+    return [shapes[i % len(shapes)] % (i // len(shapes) % 60 if i % len(shapes) == 3 else i)
+            for i in range(count)]
+
+
+def bench(func, samples, number):
+    def run():
+        for sample in samples:
+            func(sample)
+    return min(timeit.repeat(run, number=number, repeat=9)) / (number * len(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('-n', '--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    bytes_samples = [sample.encode() for sample in SAMPLES]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        legacy_verbose = bench(legacy_parse_api_message_verbose, SAMPLES, args.number)
+    results = [
+        ('legacy+print', legacy_verbose),
+        ('legacy str', bench(legacy_parse_api_message, SAMPLES, args.number)),
+        ('parse str', bench(LPGAN_API_Rx.parse, SAMPLES, args.number)),
+        ('parse bytes', bench(LPGAN_API_Rx.parse, bytes_samples, args.number)),
+    ]
+    unique = unique_samples(20000)
+    unique_bytes = [sample.encode() for sample in unique]
+    results += [
+        ('legacy uniq', bench(legacy_parse_api_message, unique, 1)),
+        ('parse uniq', bench(LPGAN_API_Rx.parse, unique, 1)),
+        ('bytes uniq', bench(LPGAN_API_Rx.parse, unique_bytes, 1)),
+    ]
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f"{name:<12} {seconds * 1e9:8.0f} ns/line  {baseline / seconds:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+'''
+Raw traffic capture for the Hiber link.
+
+CaptureLink sits between Hiber and its transport and appends every chunk
+written or read to a TrafficCapture file:
+
+    file header:  magic b"HCAP" | version (u8) | flags (u8) | 2 pad | start wall time (f64)
+    record:       monotonic ns since start (u64) | direction (u8) | length (u16) | data
+
+All integers are little endian.  Chunks longer than 65535 bytes are split
+over several records.  iter_records() reads a capture back through mmap;
+replay.py decodes it.
+'''
+import os
+import mmap
+import time
+import struct
+import threading
+from collections import namedtuple
+
+
+TX = 0
+RX = 1
+
+MAGIC = b"HCAP"
+VERSION = 1
+FLAG_FRAMED = 0x01      # captured below the framed Arduino passthrough
+
+FILE_HEADER = struct.Struct('<4sBBxxd')
+RECORD_HEADER = struct.Struct('<QBH')
+MAX_CHUNK = 0xFFFF
+
+CaptureHeader = namedtuple('CaptureHeader', ['version', 'flags', 'start_time'])
+CaptureRecord = namedtuple('CaptureRecord', ['timestamp', 'direction', 'data'])
+
+
+class TrafficCapture:
+    '''
+    Append-only binary log of Tx/Rx chunks.
+
+    Writes go through a buffered file under a lock, so the reader thread
+    and the command path can both record.  Call close() (or flush()) to get
+    everything on disk.
+
+    Args:
+        path: Capture file (overwritten)
+        framed: Set FLAG_FRAMED (link uses the framed Arduino passthrough)
+        buffer_size: File buffer size in bytes
+        clock: Monotonic clock in nanoseconds
+    '''
+    def __init__(self, path, framed=False, buffer_size=65536, clock=time.monotonic_ns):
+        self.path = path
+        self.records = 0
+        self.bytes = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(FILE_HEADER.pack(MAGIC, VERSION, FLAG_FRAMED if framed else 0, time.time()))
+        self._t0 = clock()
+
+    def record(self, direction, data):
+        '''
+        Append one chunk (nothing is written for empty data).
+
+        Args:
+            direction: TX or RX
+            data: bytes-like
+        '''
+        if not data:
+            return
+        t = self._clock() - self._t0
+        pack = RECORD_HEADER.pack
+        with self._lock:
+            write = self._file.write
+            for start in range(0, len(data), MAX_CHUNK):
+                chunk = data[start:start + MAX_CHUNK]
+                write(pack(t, direction, len(chunk)))
+                write(chunk)
+                self.records += 1
+            self.bytes += len(data)
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureLink:
+    '''
+    Transport adapter that records all traffic of `link` to `capture`.
+
+    Args:
+        link: Underlying transport
+        capture: TrafficCapture
+    '''
+    def __init__(self, link, capture):
+        self.link = link
+        self.capture = capture
+
+    @property
+    def port(self):
+        return self.link.port
+
+    @property
+    def timeout(self):
+        return self.link.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.link.timeout = value
+
+    @property
+    def is_open(self):
+        return self.link.is_open
+
+    @property
+    def in_waiting(self):
+        return self.link.in_waiting
+
+    def open(self):
+        self.link.open()
+
+    def close(self):
+        self.link.close()
+
+    def write(self, data):
+        n = self.link.write(data)
+        self.capture.record(TX, data)
+        return n
+
+    def read(self, size=1):
+        data = self.link.read(size)
+        self.capture.record(RX, data)
+        return data
+
+    def readline(self):
+        data = self.link.readline()
+        self.capture.record(RX, data)
+        return data
+
+    def reset_input_buffer(self):
+        self.link.reset_input_buffer()
+
+
+def _check_header(buf):
+    if len(buf) < FILE_HEADER.size:
+        raise ValueError("Not a Hiber capture file")
+    magic, version, flags, start_time = FILE_HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError("Not a Hiber capture file")
+    if version != VERSION:
+        raise ValueError("Unsupported capture version %d" % version)
+    return CaptureHeader(version, flags, start_time)
+
+
+def read_header(path):
+    '''
+    CaptureHeader(version, flags, start_time) of a capture file.
+    '''
+    with open(path, 'rb') as f:
+        return _check_header(f.read(FILE_HEADER.size))
+
+
+def iter_records(path):
+    '''
+    Generator over the records of a capture file, read through mmap.
+
+    A record cut short at the end of the file (capture still running or
+    interrupted) ends the iteration.
+
+    Yields:
+        CaptureRecord(timestamp seconds since start, direction, data bytes)
+    '''
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("Not a Hiber capture file")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            _check_header(mm)
+            unpack = RECORD_HEADER.unpack_from
+            header = RECORD_HEADER.size
+            offset = FILE_HEADER.size
+            end = len(mm)
+            while offset + header <= end:
+                t, direction, length = unpack(mm, offset)
+                offset += header
+                if offset + length > end:
+                    break
+                yield CaptureRecord(t / 1e9, direction, mm[offset:offset + length])
+                offset += length
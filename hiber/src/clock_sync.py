@@ -0,0 +1,158 @@
+'''
+Modem clock synchronisation.
+
+Each get_datetime exchange is timestamped on a monotonic clock.  The modem
+time is compared with the host time at the midpoint of the exchange, which
+removes the round trip from the offset.  Host wall time is read next to
+the monotonic clock for every exchange, so a stepped host clock (e.g. an
+NTP sync after boot) is picked up at once.  Offset and drift are fitted across
+samples, and set_datetime is only needed once the predicted error passes the
+threshold.  The value sent is the host time plus the expected one-way
+latency.
+
+The modem keeps UTC (its timestamps end in 'Z'); naive modem datetimes are
+read and produced as UTC whatever the host's local timezone.
+'''
+import time
+import logging
+import datetime
+from collections import deque
+
+
+log = logging.getLogger(__name__)
+
+# Change of (wall - monotonic) treated as a step of the host clock, seconds
+STEP_TOLERANCE = 1.0
+
+
+class ClockSync:
+    '''
+    Offset/drift estimator for one modem.
+
+    Offsets are modem minus host, in seconds.  Modem datetimes are naive
+    UTC, as parsed from get_datetime.
+
+    Args:
+        threshold: Max tolerated offset in seconds before a correction
+        max_samples: Samples kept for the fit
+        min_span: Seconds the samples must span before drift is estimated
+        clock: Monotonic clock
+        wall_clock: Host wall clock (seconds since the epoch)
+    '''
+    def __init__(self, threshold=15, max_samples=32, min_span=60.0,
+                 clock=time.monotonic, wall_clock=time.time):
+        self.threshold = threshold
+        self.min_span = min_span
+        self.samples = deque(maxlen=max_samples)
+        self.drift = 0.0
+        self.corrections = 0
+        self._clock = clock
+        self._wall_clock = wall_clock
+        self._base = None
+        self._t0 = None
+        self._offset0 = 0.0
+
+    def _wall_base(self):
+        '''
+        Current host wall time minus monotonic time.
+        '''
+        return self._wall_clock() - self._clock()
+
+    def wall(self, mono):
+        '''
+        Host wall time (epoch seconds) at monotonic time `mono`, mapped
+        with a fresh reading of both clocks.
+        '''
+        return self._wall_base() + mono
+
+    def add_sample(self, sent, received, modem_time):
+        '''
+        Record one get_datetime exchange.
+
+        Args:
+            sent: Monotonic time the command was written
+            received: Monotonic time the response arrived
+            modem_time: Modem datetime (naive UTC) from the response
+        Returns:
+            Offset of this sample in seconds
+        '''
+        base = self._wall_base()
+        if self._base is not None and abs(base - self._base) > STEP_TOLERANCE:
+            # Earlier offsets were measured against the old host time
+            log.info("Host clock stepped by %.1f s, dropping clock samples", base - self._base)
+            self.reset()
+        self._base = base
+        mid = (sent + received) / 2.0
+        # The modem reports whole seconds; +0.5 centres the truncation error
+        if modem_time.tzinfo is None:
+            modem_time = modem_time.replace(tzinfo=datetime.timezone.utc)
+        offset = modem_time.timestamp() + 0.5 - (base + mid)
+        self.samples.append((mid, offset, received - sent))
+        self._fit()
+        return offset
+
+    def _fit(self):
+        best_rtt = min(rtt for _, _, rtt in self.samples)
+        usable = [(t, o) for t, o, rtt in self.samples if rtt <= 2 * best_rtt + 0.001]
+        n = len(usable)
+        mean_t = sum(t for t, _ in usable) / n
+        mean_o = sum(o for _, o in usable) / n
+        if n >= 2 and usable[-1][0] - usable[0][0] >= self.min_span:
+            var = sum((t - mean_t) ** 2 for t, _ in usable)
+            cov = sum((t - mean_t) * (o - mean_o) for t, o in usable)
+            self.drift = cov / var
+        self._t0 = mean_t
+        self._offset0 = mean_o
+
+    def offset(self, at=None):
+        '''
+        Predicted modem offset at monotonic time `at` (default now).
+
+        None before the first sample.
+        '''
+        if self._t0 is None:
+            return None
+        if at is None:
+            at = self._clock()
+        return self._offset0 + self.drift * (at - self._t0)
+
+    def needs_correction(self, at=None):
+        offset = self.offset(at)
+        return offset is not None and abs(offset) > self.threshold
+
+    def latency(self):
+        '''
+        Expected one-way latency: half the best round trip seen.
+        '''
+        if not self.samples:
+            return 0.0
+        return min(rtt for _, _, rtt in self.samples) / 2.0
+
+    def corrected_time(self):
+        '''
+        Value to send with set_datetime right now.
+
+        Host time plus the one-way latency, rounded to the nearest second
+        (the modem keeps whole seconds), as a naive UTC datetime.
+        '''
+        target = self.wall(self._clock()) + self.latency()
+        return datetime.datetime.fromtimestamp(round(target), datetime.timezone.utc).replace(tzinfo=None)
+
+    def corrected(self):
+        '''
+        Note that set_datetime was applied: offsets restart from zero, the
+        drift estimate is kept.
+        '''
+        self.samples.clear()
+        self._t0 = self._clock()
+        self._offset0 = 0.0
+        self.corrections += 1
+
+    def reset(self):
+        '''
+        Forget all samples and the offset, e.g. after the modem clock was set
+        to an arbitrary value.  The drift estimate is kept.
+        '''
+        self.samples.clear()
+        self._t0 = None
+        self._offset0 = 0.0
@@ -0,0 +1,295 @@
+'''
+Fleet manager for many modems on one gateway.
+
+Ports are sharded over worker processes, each running one Hiber per modem
+and a poll schedule (get_next_pass, get_location, get_next_alarm).  Every
+modem's latest values are published in a StatusTable: one row of float64
+per modem in a multiprocessing.shared_memory block, so any process can
+read the whole fleet without asking the workers.
+
+Rows are guarded by a per-row sequence counter (seqlock): the owning
+worker makes it odd while writing and even again when done, and readers
+retry until they see the same even value before and after copying.
+'''
+import time
+import heapq
+import logging
+import multiprocessing
+from array import array
+from multiprocessing import shared_memory
+
+from hiber import Hiber
+from history import TelemetryHistory
+
+
+log = logging.getLogger(__name__)
+
+NAN = float('nan')
+
+STATUS_COLUMNS = TelemetryHistory.COLUMNS + ('polls', 'errors', 'online')
+
+DEFAULT_POLLS = {
+    'get_next_pass': 60.0,
+    'get_location': 60.0,
+    'get_next_alarm': 60.0,
+}
+# Seconds between attempts to open a modem that could not be opened
+RECONNECT_INTERVAL = 30.0
+# Consecutive failed polls after which a modem is closed and reconnected
+MAX_POLL_FAILURES = 3
+# Schedule entry for opening a modem
+_CONNECT = ''
+
+
+class StatusTable:
+    '''
+    Shared-memory table of the latest modem values, one row per modem.
+
+    Missing values are NaN; `timestamp` is the time.time() of the last
+    successful poll.
+
+    Args:
+        rows: Number of modems
+        name: Shared memory block name (None creates a new block)
+        create: Create the block instead of attaching to `name`
+    '''
+    COLUMNS = STATUS_COLUMNS
+    WIDTH = len(STATUS_COLUMNS) + 1     # + sequence counter
+
+    def __init__(self, rows, name=None, create=True):
+        self.rows = rows
+        size = rows * self.WIDTH * 8
+        self._shm = shared_memory.SharedMemory(name, create, size)
+        self.name = self._shm.name
+        self._view = self._shm.buf[:size].cast('d')
+        if create:
+            empty = array('d', [0.0] + [NAN] * len(self.COLUMNS))
+            for row in range(rows):
+                self._row_slice(row, empty)
+
+    @classmethod
+    def attach(cls, name, rows):
+        '''
+        Open an existing table, e.g. from another process.
+        '''
+        return cls(rows, name, create=False)
+
+    def _row_slice(self, row, values):
+        base = row * self.WIDTH
+        self._view[base:base + self.WIDTH] = values
+
+    def write(self, row, values):
+        '''
+        Publish the full row `row` (single writer per row).
+
+        Args:
+            values: Mapping of column -> value; missing columns become NaN
+        '''
+        view = self._view
+        base = row * self.WIDTH
+        seq = view[base]
+        view[base] = seq + 1
+        view[base + 1:base + self.WIDTH] = array('d', [values.get(name, NAN) for name in self.COLUMNS])
+        view[base] = seq + 2
+
+    def read(self, row):
+        '''
+        Consistent copy of row `row` as a dict.
+        '''
+        view = self._view
+        base = row * self.WIDTH
+        while True:
+            seq = view[base]
+            if seq % 2:
+                continue
+            values = view[base + 1:base + self.WIDTH].tolist()
+            if view[base] == seq:
+                return dict(zip(self.COLUMNS, values))
+
+    def snapshot(self):
+        return [self.read(row) for row in range(self.rows)]
+
+    def close(self):
+        self._view.release()
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+def _poll_loop(table_name, rows, shard, polls, hiber_kwargs, stop, reconnect_interval=RECONNECT_INTERVAL):
+    '''
+    Worker process: poll the modems in `shard` until `stop` is set.
+
+    A modem that cannot be opened or does not answer start() is marked
+    offline, counted as an error and retried every reconnect_interval
+    seconds.  A modem whose polls fail MAX_POLL_FAILURES times in a row is
+    closed and reconnected the same way.  The rest of the shard keeps
+    being polled.
+
+    Args:
+        shard: List of (row, port)
+        polls: Dict of Hiber query method -> interval in seconds
+        reconnect_interval: Seconds between attempts to open a modem
+    '''
+    table = StatusTable.attach(table_name, rows)
+    ports = dict(shard)
+    modems = {}
+    states = {}
+    failures = {}
+    schedule = []
+
+    def disconnect(row, now):
+        hiber = modems.pop(row, None)
+        if hiber is not None:
+            try:
+                hiber.close()
+            except Exception as e:
+                log.warning("Cannot close %s: %s", ports[row], e)
+        states[row]['online'] = 0.0
+        schedule[:] = [entry for entry in schedule if entry[1] != row]
+        heapq.heapify(schedule)
+        heapq.heappush(schedule, (now + reconnect_interval, row, _CONNECT))
+
+    def connect(row, now):
+        state = states[row]
+        failures[row] = 0
+        try:
+            hiber = Hiber(ports[row], **hiber_kwargs)
+        except Exception as e:
+            state['errors'] += 1
+            log.warning("Cannot open %s: %s", ports[row], e)
+            disconnect(row, now)
+        else:
+            modems[row] = hiber
+            try:
+                started = hiber.start()
+            except Exception as e:
+                started = False
+                log.warning("Cannot start %s: %s", ports[row], e)
+            else:
+                if not started:
+                    log.warning("%s did not answer", ports[row])
+            if started:
+                state['online'] = 1.0
+                for command in polls:
+                    heapq.heappush(schedule, (now, row, command))
+            else:
+                state['errors'] += 1
+                disconnect(row, now)
+        table.write(row, state)
+
+    try:
+        now = time.monotonic()
+        for row, port in shard:
+            states[row] = {'polls': 0, 'errors': 0, 'online': 0.0}
+            connect(row, now)
+
+        while schedule and not stop.is_set():
+            due, row, command = heapq.heappop(schedule)
+            delay = due - time.monotonic()
+            if delay > 0 and stop.wait(delay):
+                break
+            if command == _CONNECT:
+                connect(row, time.monotonic())
+                continue
+            state = states[row]
+            try:
+                record = getattr(modems[row], command)()
+            except Exception as e:
+                state['errors'] += 1
+                state['online'] = 0.0
+                failures[row] += 1
+                log.warning("%s on %s failed: %s", command, ports[row], e)
+                if failures[row] >= MAX_POLL_FAILURES:
+                    log.warning("Reconnecting %s after %d failed polls", ports[row], failures[row])
+                    disconnect(row, time.monotonic())
+                    table.write(row, state)
+                    continue
+            else:
+                state.update(record._asdict())
+                state['timestamp'] = time.time()
+                state['polls'] += 1
+                state['online'] = 1.0
+                failures[row] = 0
+            table.write(row, state)
+            heapq.heappush(schedule, (max(due + polls[command], time.monotonic()), row, command))
+    finally:
+        for hiber in modems.values():
+            hiber.close()
+        table.close()
+
+
+class FleetManager:
+    '''
+    Poll many modems from a few worker processes.
+
+    Args:
+        ports: Modem port names; row i of the status table is ports[i]
+        workers: Worker processes (default: one per modem, at most CPU count)
+        polls: Dict of query -> interval in seconds, merged over DEFAULT_POLLS
+        hiber_kwargs: Extra keyword arguments for each Hiber
+    '''
+    def __init__(self, ports, workers=None, polls=None, hiber_kwargs=None):
+        self.ports = list(ports)
+        if workers is None:
+            workers = min(len(self.ports), multiprocessing.cpu_count())
+        self.workers = max(1, min(workers, len(self.ports)))
+        self.polls = dict(DEFAULT_POLLS)
+        if polls:
+            self.polls.update(polls)
+        self.hiber_kwargs = dict(hiber_kwargs or {})
+        self.table = None
+        self._stop = None
+        self._processes = []
+
+    def shards(self):
+        '''
+        Round-robin split of (row, port) over the workers.
+        '''
+        shards = [[] for _ in range(self.workers)]
+        for row, port in enumerate(self.ports):
+            shards[row % self.workers].append((row, port))
+        return shards
+
+    def start(self):
+        self.table = StatusTable(len(self.ports))
+        self._stop = multiprocessing.Event()
+        for shard in self.shards():
+            process = multiprocessing.Process(
+                target=_poll_loop,
+                args=(self.table.name, len(self.ports), shard, self.polls, self.hiber_kwargs, self._stop),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+        return self
+
+    def stop(self, timeout=10.0):
+        if self._stop is None:
+            return
+        self._stop.set()
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._stop = None
+        self.table.close()
+        self.table.unlink()
+        self.table = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def status(self):
+        '''
+        Latest values of every modem, with its port, read from shared memory.
+        '''
+        rows = self.table.snapshot()
+        for port, row in zip(self.ports, rows):
+            row['port'] = port
+        return rows
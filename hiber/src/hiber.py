@@ -1,8 +1,28 @@
 import re
 import time
+import struct
+import queue
+import logging
 import datetime
+import threading
 import serial
-from collections import namedtuple
+from enum import IntEnum
+from collections import namedtuple, deque
+
+from history import TelemetryHistory
+from state_cache import StateCache
+from clock_sync import ClockSync
+from identity_cache import IdentityCache
+from pacing import WritePacer
+from transport import valid_port, open_transport
+from capture import TrafficCapture, CaptureLink
+from metrics import CommandMetrics
+
+
+log = logging.getLogger(__name__)
+
+
+_MODEM_NUMBER_RE = re.compile(r"^\w\w\w\w \w\w\w\w$")
 
 
 class LPGAN_API_Tx:
@@ -43,8 +63,7 @@ class LPGAN_API_Tx:
             raise ValueError(
                 "modem_number must be string value with format 'XXXX XXXX'"
             )
-        pattern = re.compile(r"^\w\w\w\w \w\w\w\w$")
-        if not pattern.match(modem_number):
+        if not _MODEM_NUMBER_RE.match(modem_number):
             raise ValueError("modem_number must have format 'XXXX XXXX'")
         return f"set_modem_number({modem_number})\r\n"
 
@@ -103,6 +122,144 @@ class LPGAN_API_Tx:
         return f'set_payload("{payload}")\r\n'
 
 
+class LPGAN_API_TxBytes:
+    '''
+    LPGAN_API_Tx that returns bytes ready for the serial port.
+
+    Constant commands are encoded once at import, parametrized commands are
+    formatted straight into bytes.  Validation matches LPGAN_API_Tx.
+    '''
+    ARD_PREFIX = b"Modem:"
+    ARD_SUFFIX = b"\r\n"
+
+    _GET_FIRMWARE_VERSION = b"get_firmware_version\r\n"
+    _GET_MODEM_INFO = b"get_modem_info\r\n"
+    _GET_LOCATION = b"get_location\r\n"
+    _GET_DATETIME = b"get_datetime\r\n"
+    _GET_NEXT_ALARM = b"get_next_alarm\r\n"
+    _GET_NEXT_PASS = b"get_next_pass\r\n"
+    _GO_TO_SLEEP = b"go_to_sleep\r\n"
+    _DO_GPS_FIX = b"do_gps_fix\r\n"
+    _SET_GPS_MODE = {True: b"set_gps_mode(true)\r\n", False: b"set_gps_mode(false)\r\n"}
+    _TOGGLE_PAYLOAD_OVER_DEBUG = {
+        True: b"toggle_payload_over_debug(true)\r\n",
+        False: b"toggle_payload_over_debug(false)\r\n",
+    }
+
+    @classmethod
+    def set_gps_mode(cls, enabled):
+        if not isinstance(enabled, bool):
+            raise ValueError("enabled must be a boolean value")
+        return cls._SET_GPS_MODE[enabled]
+
+    @classmethod
+    def do_gps_fix(cls, input_string=None):
+        if input_string is None:
+            return cls._DO_GPS_FIX
+        if not isinstance(input_string, str):
+            raise ValueError("input_string must be a string")
+        return b'do_gps_fix("%s")\r\n' % input_string.encode()
+
+    @classmethod
+    def get_firmware_version(cls):
+        return cls._GET_FIRMWARE_VERSION
+
+    @classmethod
+    def get_modem_info(cls):
+        return cls._GET_MODEM_INFO
+
+    @staticmethod
+    def set_modem_number(modem_number):
+        if not isinstance(modem_number, str):
+            raise ValueError(
+                "modem_number must be string value with format 'XXXX XXXX'"
+            )
+        if not _MODEM_NUMBER_RE.match(modem_number):
+            raise ValueError("modem_number must have format 'XXXX XXXX'")
+        return b"set_modem_number(%s)\r\n" % modem_number.encode()
+
+    @classmethod
+    def get_location(cls):
+        return cls._GET_LOCATION
+
+    @staticmethod
+    def set_location(latitude, longitude, elevation):
+        try:
+            return b'set_location("%.6f","%.6f","%.1f")\r\n' % (latitude, longitude, elevation)
+        except TypeError as e:
+            raise ValueError(str(e)) from None
+
+    @classmethod
+    def get_datetime(cls):
+        return cls._GET_DATETIME
+
+    @staticmethod
+    def set_datetime(dt):
+        if not isinstance(dt, datetime.datetime):
+            raise ValueError("dt must be a datetime.datetime object")
+        return b'set_datetime("%04d-%02d-%02dT%02d:%02d:%02dZ")\r\n' % (
+            dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second
+        )
+
+    @classmethod
+    def get_next_alarm(cls):
+        return cls._GET_NEXT_ALARM
+
+    @classmethod
+    def get_next_pass(cls):
+        return cls._GET_NEXT_PASS
+
+    @classmethod
+    def go_to_sleep(cls):
+        return cls._GO_TO_SLEEP
+
+    @classmethod
+    def toggle_payload_over_debug(cls, is_enabled):
+        if not isinstance(is_enabled, bool):
+            raise ValueError("is_enable must be a boolean value")
+        return cls._TOGGLE_PAYLOAD_OVER_DEBUG[is_enabled]
+
+    @staticmethod
+    def set_payload(payload):
+        if not isinstance(payload, int):
+            raise ValueError("payload must be an integer (number of bytes to be sent)")
+        return b'set_payload("%d")\r\n' % payload
+
+    @classmethod
+    def ard_frame(cls, command):
+        '''
+        Wrap an encoded command for the Arduino passthrough (see Hiber.ard_write).
+        '''
+        return b"".join((cls.ARD_PREFIX, command, cls.ARD_SUFFIX))
+
+    @classmethod
+    def join(cls, messages, arduino=False):
+        '''
+        Join encoded commands into one buffer for a single write().
+
+        Args:
+            messages: Iterable of encoded commands (bytes)
+            arduino: Add Arduino "Modem:" framing to each command
+        '''
+        if not arduino:
+            return b"".join(messages)
+        prefix, suffix = cls.ARD_PREFIX, cls.ARD_SUFFIX
+        return b"".join([part for message in messages for part in (prefix, message, suffix)])
+
+    @classmethod
+    def encode_batch(cls, commands, arduino=False):
+        '''
+        Encode several commands into one buffer for a single write().
+
+        Args:
+            commands: Iterable of (name, args) tuples
+            arduino: Add Arduino "Modem:" framing to each command
+        Returns:
+            bytes
+        '''
+        return cls.join([getattr(cls, name)(*args) for name, args in commands], arduino)
+
+
 ERROR_CODES = {
     "125": "Buffer Overflow",
     "126": "Space found in command name",
@@ -148,38 +305,362 @@ ERROR_CODES = {
 }
 
 
+class ErrorCode(IntEnum):
+    '''
+    LPGAN API status codes.  The hundreds digit gives the class:
+    1xx command parsing, 2xx/3xx argument conversion, 4xx command
+    execution, 5xx link, 6xx runtime.
+    '''
+    PARSE_BUFFER_OVERFLOW = 125
+    SPACE_IN_COMMAND_NAME = 126
+    NO_COMMAND_NAME = 127
+    UNEXPECTED_CHAR_IN_COMMAND_NAME = 128
+    INVALID_HEX_VALUE = 129
+    UNEXPECTED_CHAR_AFTER_SPACE = 130
+    UNEXPECTED_CHAR_BEFORE_HEX = 131
+    UNEXPECTED_WHITESPACE_AFTER_HEX = 132
+    UNEXPECTED_CHAR_IN_KEYWORD = 133
+    UNEXPECTED_CHAR_AFTER_KEYWORD = 134
+    UNEXPECTED_CHAR_PARSING_KEYWORD = 135
+    ARGUMENT_COUNT_EXCEEDED = 136
+    UNEXPECTED_CHAR_PARSING_CHAR = 137
+    UNEXPECTED_CHAR_IN_CHAR = 138
+    UNEXPECTED_END_OF_COMMAND = 139
+    UNEXPECTED_CHAR = 140
+    INTERNAL_STRING_STATE = 141
+    INTERNAL_NUMBER_STATE = 142
+    INTERNAL_KEYWORD_STATE = 143
+    INTERNAL_ARGUMENT_STATE = 144
+    INTERNAL_ARGUMENTS_FINISHED_STATE = 145
+    INTERNAL_STATE = 146
+    INTERNAL_HEX_NUMBER_STATE = 147
+    DEBUG_PARSING = 150
+    HEX_VALUE_NOT_VALID = 225
+    UNKNOWN_ESCAPE_CHARACTER = 226
+    UNKNOWN_KEYWORD = 325
+    DEBUG_CONVERSION = 350
+    UNKNOWN_COMMAND = 425
+    WRONG_ARGUMENT_COUNT = 426
+    BUFFER_OVERFLOW = 525
+    OK = 600
+    SLEEPING = 602
+    CANNOT_SLEEP = 603
+    INVALID_INPUT = 625
+    HELP_UNKNOWN_COMMAND = 626
+    GPS_DISABLED = 632
+    GPS_ENABLED = 633
+    NOT_IMPLEMENTED = 634
+    NOT_GOING_TO_SLEEP = 635
+    GENERIC_ERROR = 636
+
+
+class HiberError(ValueError):
+    '''
+    Modem answered with an error status (or an unreadable line).
+
+    Subclasses ValueError, which the decoders raised before the hierarchy
+    existed.  str(e) is the ERROR_CODES message.
+
+    Args:
+        code: Status code (ErrorCode for known codes, int otherwise, None
+            if the line could not be parsed)
+        message: Text; looked up from the code when omitted
+        command: LPGAN command name the response belonged to
+        line: Raw response line
+    '''
+    def __init__(self, code=None, message=None, command=None, line=None):
+        if message is None:
+            message = ERROR_CODES.get(str(code), "Unknown error code %s" % code)
+        super().__init__(message)
+        self.code = code
+        self.command = command
+        self.line = line
+
+
+class ResponseFormatError(HiberError):
+    '''Line is not an API(...) response.'''
+
+
+class ParseError(HiberError):
+    '''1xx: the modem could not parse the command.'''
+
+
+class ConversionError(HiberError):
+    '''2xx/3xx: an argument could not be converted.'''
+
+
+class CommandError(HiberError):
+    '''4xx: unknown command or wrong argument count.'''
+
+
+class ModemRuntimeError(HiberError):
+    '''6xx: the command was understood but not carried out.'''
+
+
+class TransientError(HiberError):
+    '''The same command may succeed if sent again later.'''
+
+
+class BufferOverflowError(TransientError):
+    '''125/525: input arrived faster than the modem could take it.'''
+
+
+class ParseBufferOverflowError(BufferOverflowError, ParseError):
+    '''125: overflow in the command parser.'''
+
+
+class SleepRefusedError(ModemRuntimeError, Warning):
+    '''603/635: go_to_sleep was refused; also a Warning, as before.'''
+
+
+_RANGE_ERRORS = {1: ParseError, 2: ConversionError, 3: ConversionError, 4: CommandError, 6: ModemRuntimeError}
+
+_SPECIAL_ERRORS = {
+    ErrorCode.PARSE_BUFFER_OVERFLOW: ParseBufferOverflowError,
+    ErrorCode.BUFFER_OVERFLOW: BufferOverflowError,
+    ErrorCode.CANNOT_SLEEP: SleepRefusedError,
+    ErrorCode.NOT_GOING_TO_SLEEP: SleepRefusedError,
+}
+
+# code -> (ErrorCode, message, exception class), built once
+ERROR_TABLE = {
+    int(code): (
+        code,
+        ERROR_CODES[str(int(code))],
+        _SPECIAL_ERRORS.get(code, _RANGE_ERRORS.get(code // 100, HiberError)),
+    )
+    for code in ErrorCode
+}
+
+
+def error_for(code, command=None, line=None):
+    '''
+    Exception instance for status `code`.
+
+    Unknown codes get the class of their range (HiberError outside the
+    known ranges) and an "Unknown error code" message.
+
+    Args:
+        code: Status code as int
+        command: LPGAN command name
+        line: Raw response line
+    Returns:
+        HiberError subclass instance (not raised)
+    '''
+    entry = ERROR_TABLE.get(code)
+    if entry is None:
+        cls = _RANGE_ERRORS.get(code // 100, HiberError)
+        return cls(code, "Unknown error code %d" % code, command, line)
+    code, message, cls = entry
+    return cls(code, message, command, line)
+
+
+ApiResponse = namedtuple('ApiResponse', ['code', 'fields'])
+# Result of Hiber.upload_payload
+PayloadTransfer = namedtuple('PayloadTransfer', ['ack', 'bytes_sent', 'chunks', 'seconds', 'throughput'])
+
+_new_tuple = tuple.__new__
+_lstrip = str.lstrip
+_lstrip_bytes = bytes.lstrip
+# Status codes of successful responses, looked up before int() on the hot path
+_OK_CODES = {'600': 600, '601': 601, '602': 602}
+_OK_CODES_BYTES = {code.encode(): value for code, value in _OK_CODES.items()}
+
+
+def _status_code(code, message):
+    code = code.strip()
+    if not code.isdigit():
+        raise ResponseFormatError(message="Invalid API Rx string", line=message)
+    return int(code)
+
+
+def _parse_bytes(message):
+    # bytes version of LPGAN_API_Rx.parse
+    if message.__class__ is not bytes:
+        message = bytes(message)
+    end = message.find(b')', 4)
+    if end < 0 or not message.startswith(b'API('):
+        raise ResponseFormatError(message="Invalid API Rx string", line=message)
+    code, found, fields = message[4:end].partition(b':')
+    code = _OK_CODES_BYTES.get(code) or _status_code(code, message)
+    if not found:
+        return _new_tuple(ApiResponse, (code, ()))
+    # bytes `in` is slow, so this counts separators instead
+    fields = fields.strip()
+    parts = fields.split(b'; ')
+    if fields.count(b';') >= len(parts) or fields.count(b';  ') or fields.count(b'; \t'):
+        parts = map(_lstrip_bytes, fields.split(b';'))
+    return _new_tuple(ApiResponse, (code, tuple(parts)))
+
+
+class _Record:
+    '''
+    Mixin for the response records.
+
+    Records are namedtuples (no per-instance dict) that behave like the old
+    dict results: record['field'], `in`, get(), keys()/values()/items(),
+    iteration over the field names and equality with a dict.  Attribute
+    access and index access (record[0]) work as for any namedtuple;
+    _asdict() gives a plain dict copy.
+    '''
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self._asdict() == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = tuple.__hash__
+
+    def __getnewargs__(self):
+        return tuple(tuple.__iter__(self))
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(tuple.__iter__(self))
+
+    def items(self):
+        return tuple(zip(self._fields, tuple.__iter__(self)))
+
+    def _asdict(self):
+        return dict(zip(self._fields, tuple.__iter__(self)))
+
+    def _replace(self, **kwargs):
+        values = self._asdict()
+        for key in kwargs:
+            if key not in values:
+                raise ValueError('Got unexpected field names: %r' % list(kwargs))
+        values.update(kwargs)
+        return self._make(values.values())
+
+
+class FirmwareVersion(_Record, namedtuple('FirmwareVersion', ['firmware_version'])):
+    __slots__ = ()
+
+
+class ModemInfo(_Record, namedtuple('ModemInfo', [
+        'HW_TYPE_STR', 'HW_TYPE_INT', 'FW_VERSION', 'MODEM_NO_STR', 'MODEM_NO_INT'])):
+    __slots__ = ()
+
+
+class Location(_Record, namedtuple('Location', [
+        'latitude', 'longitude', 'seconds_since_last_fix', 'seconds_until_next_fix', 'altitude'])):
+    __slots__ = ()
+
+
+class DateTime(_Record, namedtuple('DateTime', ['datetime'])):
+    __slots__ = ()
+
+
+class NextAlarm(_Record, namedtuple('NextAlarm', ['alarm_id', 'seconds_left_until_alarm'])):
+    __slots__ = ()
+
+
+class NextPass(_Record, namedtuple('NextPass', ['seconds_left_until_pass'])):
+    __slots__ = ()
+
+
+class SleepInfo(_Record, namedtuple('SleepInfo', ['seconds_left_until_alarm', 'alarm_id'])):
+    __slots__ = ()
+
+
+class PayloadDebug(_Record, namedtuple('PayloadDebug', ['toggle_enabled'])):
+    __slots__ = ()
+
+
+class PayloadAck(_Record, namedtuple('PayloadAck', ['payload_bytes'])):
+    __slots__ = ()
+
+
 class LPGAN_API_Rx:
+    # Names of the per-command response decoders
+    DECODERS = frozenset((
+        'set_gps_mode', 'do_gps_fix', 'get_firmware_version', 'get_modem_info',
+        'set_modem_number', 'get_location', 'set_location', 'get_datetime',
+        'set_datetime', 'get_next_alarm', 'get_next_pass', 'go_to_sleep',
+        'toggle_payload_over_debug', 'set_payload',
+    ))
+
     def __init__(self):
         pass
 
     @staticmethod
-    def parse_api_message(message, error_handling=False):
-        if message.startswith("API"):
-            message = message[:message.find(')')]
-            result = message[message.find("API(") + 4 :].strip().strip(")").split(":",1)
-            if len(result) > 1:
-                result[1] = result[1].split(";")
-                result[1] = [result.lstrip() for result in result[1]]
-            else:
-                result = [result[0], []]
-        elif message.startswith("Hiber API "):
-            pass
-        else:
-            raise ValueError("Invalid API Rx string")
-        print(result)
+    def parse(message):
+        '''
+        Parse a single API response line.
+
+        Anything after the closing parenthesis (e.g. "Current date: ...")
+        is ignored.  Fields are split on ';' with surrounding whitespace
+        removed, as the original parser did; the modem's own "; "
+        separator is split in one pass.  Nothing is printed.
 
+        Args:
+            message: Response line as str, bytes, bytearray or memoryview
+        Returns:
+            ApiResponse(code, fields): status code as int and tuple of fields
+            (str fields for str input, bytes fields otherwise)
+        '''
+        if message.__class__ is not str and not isinstance(message, str):
+            return _parse_bytes(message)
+        end = message.find(')', 4)
+        if end < 0 or not message.startswith('API('):
+            raise ResponseFormatError(message="Invalid API Rx string", line=message)
+        code, found, fields = message[4:end].partition(':')
+        code = _OK_CODES.get(code) or _status_code(code, message)
+        # tuple.__new__ skips the namedtuple's Python level __new__
+        if not found:
+            return _new_tuple(ApiResponse, (code, ()))
+        if ';' not in fields:
+            return _new_tuple(ApiResponse, (code, (fields.strip(),)))
+        fields = fields.strip()
+        parts = fields.split('; ')
+        if fields.count(';') >= len(parts) or ';  ' in fields or '; \t' in fields:
+            parts = map(_lstrip, fields.split(';'))
+        return _new_tuple(ApiResponse, (code, tuple(parts)))
+
+    @classmethod
+    def _ok_fields(cls, message, command=None):
+        code, fields = cls.parse(message)
+        if code != 600:
+            raise error_for(code, command, message)
+        return fields
+
+    @classmethod
+    def parse_api_message(cls, message, error_handling=False):
+        code, fields = cls.parse(message)
         if error_handling:
-            if "600" != result[0]:
-                print(result)
-                raise ValueError(ERROR_CODES[result[0]])
-            else:
-                return result[1]
+            if code != 600:
+                raise error_for(code, line=message)
+            return list(fields)
         else:
-            return [result[0], result[1]]
+            return [str(code), list(fields)]
 
     @classmethod
     def set_gps_mode(cls, message):
-        results = cls.parse_api_message(message, True)
+        results = cls._ok_fields(message, 'set_gps_mode')
         if results[0].strip() == "0":
             return False
         else:
@@ -187,104 +668,73 @@ class LPGAN_API_Rx:
 
     @classmethod
     def do_gps_fix(cls, message):
-        results = cls.parse_api_message(message, True)
+        results = cls._ok_fields(message, 'do_gps_fix')
     @classmethod
     def get_firmware_version(cls, message):
-        results = cls.parse_api_message(message, True)
-        return {'firmware_version':results[0]}
+        results = cls._ok_fields(message, 'get_firmware_version')
+        return FirmwareVersion(results[0])
 
     @classmethod
     def get_modem_info(cls, message):
-        print(message)
-        results = cls.parse_api_message(message, True)
-        print(results)
-        results = {
-            'HW_TYPE_STR':results[0],
-            'HW_TYPE_INT':int(results[1]),
-            'FW_VERSION':results[2],
-            'MODEM_NO_STR':results[3],
-            'MODEM_NO_INT':int(results[4])
-        }
-        return results
+        results = cls._ok_fields(message, 'get_modem_info')
+        return ModemInfo(
+            results[0], int(results[1]), results[2], results[3], int(results[4])
+        )
 
     @classmethod
     def set_modem_number(cls, message):
-        cls.parse_api_message(message, True)
+        cls._ok_fields(message, 'set_modem_number')
 
     @classmethod
     def get_location(cls, message):
-        results = cls.parse_api_message(message, True)
-        results = {
-            'latitude':float(results[0]),
-            'longitude':float(results[1]),
-            'seconds_since_last_fix':int(results[2]),
-            'seconds_until_next_fix':int(results[3]),
-            'altitude':float(results[4])
-        }
-
-        return results
+        results = cls._ok_fields(message, 'get_location')
+        return Location(
+            float(results[0]), float(results[1]), int(results[2]), int(results[3]), float(results[4])
+        )
 
     @classmethod
     def set_location(cls, message):
-        results = cls.parse_api_message(message, True)
-        results = {
-            'latitude':float(results[0]),
-            'longitude':float(results[1]),
-            'seconds_since_last_fix':int(results[2]),
-            'seconds_until_next_fix':int(results[3]),
-            'altitude':float(results[4])
-        }
-
-        return results
+        results = cls._ok_fields(message, 'set_location')
+        return Location(
+            float(results[0]), float(results[1]), int(results[2]), int(results[3]), float(results[4])
+        )
     @classmethod
     def get_datetime(cls, message):
-        results = cls.parse_api_message(message, True)
-        return {'datetime':results[0]}
+        results = cls._ok_fields(message, 'get_datetime')
+        return DateTime(results[0])
 
     @classmethod
     def set_datetime(cls, message):
-        results = cls.parse_api_message(message, True)
-        return {'datetime':results[0]}
+        results = cls._ok_fields(message, 'set_datetime')
+        return DateTime(results[0])
 
     @classmethod
     def get_next_alarm(cls, message):
-        results = cls.parse_api_message(message, True)
-        results = {
-            'alarm_id':int(results[0]),
-            'seconds_left_until_alarm':int(results[1])
-        }
-        return results
+        results = cls._ok_fields(message, 'get_next_alarm')
+        return NextAlarm(int(results[0]), int(results[1]))
 
     @classmethod
     def get_next_pass(cls, message):
-        results = cls.parse_api_message(message, True)
-        return {'seconds_left_until_pass':int(results[0])}
+        results = cls._ok_fields(message, 'get_next_pass')
+        return NextPass(int(results[0]))
         
 
     @classmethod
     def go_to_sleep(cls, message):
-        [error, results] = cls.parse_api_message(message, False)
-        if "603" == error:
-            raise Warning(error)
-        elif ("600" != error) and ("602" != error):
-            raise ValueError(ERROR_CODES[error])
-        results = {
-            'seconds_left_until_alarm':int(results[0]),
-            'alarm_id':int(results[1])
-        }
-        return results
+        code, results = cls.parse(message)
+        if (code != 600) and (code != 602):
+            raise error_for(code, 'go_to_sleep', message)
+        return SleepInfo(int(results[0]), int(results[1]))
 
     @classmethod
     def toggle_payload_over_debug(cls, message):
-        results = cls.parse_api_message(message, True)
-        return {'toggle_enabled':bool(results[0])}
+        results = cls._ok_fields(message, 'toggle_payload_over_debug')
+        return PayloadDebug(bool(results[0]))
 
     @classmethod
     def set_payload(cls, message):
-        results = cls.parse_api_message(message, True)
-        print(results)
-
-        return {'payload_bytes':int(results[0])}
+        results = cls._ok_fields(message, 'set_payload')
+        return PayloadAck(int(results[0]))
 
 
 modem_info = namedtuple(
@@ -305,70 +755,640 @@ modem_info = namedtuple(
     ]
 )
 
+class ModemState:
+    '''
+    Latest known modem values, one slot per field.
+
+    Supports state['field'] reads and writes for code written against the
+    old dict; as_dict() returns a plain dict copy.
+    '''
+    __slots__ = (
+        'firmware_version',
+        'HW_TYPE_STR',
+        'HW_TYPE_INT',
+        'FW_VERSION',
+        'MODEM_NO_STR',
+        'MODEM_NO_INT',
+        'seconds_since_last_fix',
+        'seconds_until_next_fix',
+        'seconds_left_until_alarm',
+        'seconds_left_until_pass',
+        'latitude',
+        'longitude',
+        'altitude',
+        'alarm_id',
+        'datetime',
+        'toggle_enabled',
+    )
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, None)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def keys(self):
+        return self.__slots__
+
+    def update(self, record):
+        '''
+        Copy every field of a response record (or dict) into the state.
+        '''
+        for key in record.keys():
+            setattr(self, key, record[key])
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"ModemState({self.as_dict()!r})"
+
+
+class LineReader(threading.Thread):
+    '''
+    Background reader that frames serial input into lines.
+
+    Drains everything in in_waiting with one read() into a reusable
+    bytearray, splits complete lines on CRLF and hands each non-empty frame
+    (bytes, without the terminator) to on_frame, by default `frames.put`.
+    Partial lines stay buffered until the rest arrives.
+    '''
+    def __init__(self, ser, on_frame=None, terminator=b"\r\n"):
+        super().__init__(daemon=True)
+        self.frames = queue.Queue()
+        self._on_frame = on_frame or self.frames.put
+        self._ser = ser
+        self._terminator = terminator
+        self._buffer = bytearray()
+        self._running = threading.Event()
+
+    def run(self):
+        self._running.set()
+        while self._running.is_set():
+            data = self._ser.read(self._ser.in_waiting or 1)
+            if data:
+                self.feed(data)
+
+    def feed(self, data):
+        '''
+        Add raw bytes and queue any lines they complete.
+        '''
+        buffer = self._buffer
+        terminator = self._terminator
+        scan = max(0, len(buffer) - len(terminator) + 1)
+        buffer += data
+        start = 0
+        end = buffer.find(terminator, scan)
+        while end >= 0:
+            if end > start:
+                self._on_frame(bytes(buffer[start:end]))
+            start = end + len(terminator)
+            end = buffer.find(terminator, start)
+        if start:
+            del buffer[:start]
+
+    def stop(self, timeout=None):
+        self._running.clear()
+        if self.is_alive():
+            self.join(timeout)
+
+
+RESPONSE = 'response'
+NOTIFICATION = 'notification'
+DEBUG = 'debug'
+
+
+class LineDispatcher:
+    '''
+    Demultiplexes incoming lines by kind.
+
+    RESPONSE:     API(...) command responses, queued on `responses` for the
+                  pending command.  Text after the closing parenthesis
+                  (e.g. "Current date: ...") is split off as a DEBUG line.
+    NOTIFICATION: Unsolicited modem output such as the "Hiber API ..." boot
+                  banner (see NOTIFICATION_PREFIXES).
+    DEBUG:        Anything else, e.g. payload echo after
+                  toggle_payload_over_debug.
+
+    Callbacks registered for a kind get each line (bytes).  Once start() is
+    called they run on a worker thread so a slow callback never delays the
+    responses; before that they run inline.
+    '''
+    NOTIFICATION_PREFIXES = (b"Hiber API",)
+
+    def __init__(self):
+        self.responses = queue.Queue()
+        self._callbacks = {RESPONSE: [], NOTIFICATION: [], DEBUG: []}
+        self._events = queue.Queue()
+        self._worker = None
+
+    @classmethod
+    def classify(cls, line):
+        if line.startswith(b"API("):
+            return RESPONSE
+        if line.startswith(cls.NOTIFICATION_PREFIXES):
+            return NOTIFICATION
+        return DEBUG
+
+    def register(self, kind, callback):
+        '''
+        Args:
+            kind: RESPONSE, NOTIFICATION or DEBUG
+            callback: Called with the line as bytes
+        '''
+        self._callbacks[kind].append(callback)
+
+    def dispatch(self, line):
+        kind = self.classify(line)
+        if kind is RESPONSE:
+            end = line.find(b")") + 1
+            if end and end < len(line):
+                trailing = line[end:].strip()
+                line = line[:end]
+                if trailing:
+                    self._emit(DEBUG, trailing)
+            self.responses.put(line)
+        self._emit(kind, line)
+
+    def _emit(self, kind, line):
+        if not self._callbacks[kind]:
+            return
+        if self._worker is None:
+            self._run_callbacks(kind, line)
+        else:
+            self._events.put((kind, line))
+
+    def _run_callbacks(self, kind, line):
+        for callback in self._callbacks[kind]:
+            try:
+                callback(line)
+            except Exception:
+                log.exception("%s callback failed", kind)
+
+    def _work(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                break
+            self._run_callbacks(*event)
+
+    def start(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._work, daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout=None):
+        if self._worker is not None:
+            self._events.put(None)
+            self._worker.join(timeout)
+            self._worker = None
+
+
+# Framed Arduino passthrough (Hiber(arduino='framed'))
+ARD_SYNC = 0xA5
+ARD_MODEM = 0x01        # host -> Arduino: modem command line, no CRLF
+ARD_WAKEUP = 0x02       # host -> Arduino: wakeup pin, b"\x00" or b"\x01"
+ARD_PAYLOAD = 0x03      # host -> Arduino: set_payload data, passed to the modem as is
+ARD_RESPONSE = 0x81     # Arduino -> host: one modem output line, no CRLF
+
+
+class ArdFrame:
+    '''
+    Length-prefixed binary frames for the Arduino passthrough.
+
+    Frame: SYNC (0xA5) | body length (u16 LE) | length check (u8) | body |
+    checksum (u8, sum of the body bytes).  The length check lets a decoder
+    reject a corrupt length at once instead of waiting for a body that
+    never comes; bodies are also capped at MAX_BODY bytes, well within an
+    Arduino's RAM.  The body is a run of records: type (u8) | data
+    length (u8) | data.  Several commands and wakeup changes travel in one
+    frame (one USB write); the Arduino answers each frame with a single
+    frame holding an ARD_RESPONSE record per modem line.
+    '''
+    HEADER = struct.Struct('<BHB')
+    MAX_BODY = 1024
+
+    @staticmethod
+    def length_check(length):
+        return (~((length & 0xFF) + (length >> 8))) & 0xFF
+
+    @classmethod
+    def encode(cls, records):
+        '''
+        Args:
+            records: Iterable of (type, data bytes) tuples
+        Returns:
+            Frame bytes
+        '''
+        body = bytearray()
+        for kind, data in records:
+            if len(data) > 0xFF:
+                raise ValueError("record longer than 255 bytes")
+            body.append(kind)
+            body.append(len(data))
+            body += data
+        if len(body) > cls.MAX_BODY:
+            raise ValueError("frame body longer than %d bytes" % cls.MAX_BODY)
+        return cls.HEADER.pack(ARD_SYNC, len(body), cls.length_check(len(body))) + body + bytes((sum(body) & 0xFF,))
+
+    @staticmethod
+    def records(body):
+        '''
+        Split a frame body into [(type, data bytes), ...].
+        '''
+        records = []
+        i, end = 0, len(body)
+        while i < end:
+            if i + 2 > end:
+                raise ValueError("truncated record header")
+            kind, size = body[i], body[i + 1]
+            i += 2
+            if i + size > end:
+                raise ValueError("truncated record")
+            records.append((kind, bytes(body[i:i + size])))
+            i += size
+        return records
+
+    @classmethod
+    def commands(cls, data, wakeup=None):
+        '''
+        Frame for CRLF terminated command lines, e.g. LPGAN_API_TxBytes.join(...).
+
+        Args:
+            data: Encoded command line(s)
+            wakeup: Optional wakeup pin state sent ahead of the commands
+        '''
+        records = []
+        if wakeup is not None:
+            records.append((ARD_WAKEUP, b"\x01" if wakeup else b"\x00"))
+        for line in data.split(b"\n"):
+            line = line.strip(b"\r")
+            if line:
+                records.append((ARD_MODEM, line))
+        return cls.encode(records)
+
+    @classmethod
+    def payload(cls, data):
+        '''
+        Frame carrying raw payload bytes in ARD_PAYLOAD records.
+        '''
+        return cls.encode((ARD_PAYLOAD, data[i:i + 0xFF]) for i in range(0, len(data), 0xFF))
+
+
+class ArdFrameDecoder:
+    '''
+    Incremental frame decoder.
+
+    Bytes before a sync byte, headers with a bad length check or an
+    oversized length and frames with a bad checksum are dropped (counted in
+    `errors`) and decoding resumes at the next sync byte.
+    '''
+    def __init__(self):
+        self._buf = bytearray()
+        self.errors = 0
+
+    def feed(self, data):
+        '''
+        Returns:
+            List of complete frames, each a list of (type, data) records
+        '''
+        buf = self._buf
+        buf += data
+        frames = []
+        header = ArdFrame.HEADER.size
+        while True:
+            start = buf.find(ARD_SYNC)
+            if start < 0:
+                self.errors += bool(buf)
+                buf.clear()
+                break
+            if start:
+                self.errors += 1
+                del buf[:start]
+            if len(buf) < header:
+                break
+            _, length, check = ArdFrame.HEADER.unpack_from(buf)
+            if check != ArdFrame.length_check(length) or length > ArdFrame.MAX_BODY:
+                self.errors += 1
+                del buf[:1]
+                continue
+            end = header + length
+            if len(buf) < end + 1:
+                break
+            body = buf[header:end]
+            try:
+                if sum(body) & 0xFF != buf[end]:
+                    raise ValueError("bad checksum")
+                frames.append(ArdFrame.records(body))
+            except ValueError:
+                self.errors += 1
+                # Resync from the byte after this sync byte
+                del buf[:1]
+                continue
+            del buf[:end + 1]
+        return frames
+
+
+class ArdFramedLink:
+    '''
+    Transport adapter for the framed Arduino passthrough.
+
+    Looks like the plain link to the rest of Hiber: each write() of command
+    lines goes out as one frame, and response records come back as CRLF
+    terminated lines from read()/readline().
+
+    Args:
+        link: Underlying transport (serial.Serial, SocketTransport, ...)
+    '''
+    def __init__(self, link):
+        self.link = link
+        self.decoder = ArdFrameDecoder()
+        self.frames_written = 0
+        self._lines = bytearray()
+        self._wakeup = None
+
+    @property
+    def port(self):
+        return self.link.port
+
+    @property
+    def timeout(self):
+        return self.link.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.link.timeout = value
+
+    @property
+    def is_open(self):
+        return self.link.is_open
+
+    def open(self):
+        self.link.open()
+
+    def close(self):
+        self.link.close()
+
+    def write(self, data):
+        wakeup, self._wakeup = self._wakeup, None
+        self.link.write(ArdFrame.commands(data, wakeup))
+        self.frames_written += 1
+        return len(data)
+
+    def write_payload(self, data):
+        '''
+        Send payload bytes (after an acknowledged set_payload) unaltered,
+        in as many frames as MAX_BODY requires.
+        '''
+        step = ArdFrame.MAX_BODY // 257 * 0xFF
+        for start in range(0, len(data), step):
+            self.link.write(ArdFrame.payload(data[start:start + step]))
+            self.frames_written += 1
+        return len(data)
+
+    def wakeup(self, state, defer=False):
+        '''
+        Set the wakeup pin, now or (defer=True) in the next command frame.
+        '''
+        if defer:
+            self._wakeup = state
+            return
+        self.link.write(ArdFrame.encode([(ARD_WAKEUP, b"\x01" if state else b"\x00")]))
+        self.frames_written += 1
+
+    def _feed(self, data):
+        for records in self.decoder.feed(data):
+            for kind, line in records:
+                if kind == ARD_RESPONSE:
+                    self._lines += line
+                    self._lines += b"\r\n"
+
+    def _fill(self):
+        '''
+        One read on the link (blocks up to its timeout); False on timeout.
+        '''
+        data = self.link.read(self.link.in_waiting or 1)
+        self._feed(data)
+        return bool(data)
+
+    @property
+    def in_waiting(self):
+        waiting = self.link.in_waiting
+        if waiting:
+            self._feed(self.link.read(waiting))
+        return len(self._lines)
+
+    def read(self, size=1):
+        while len(self._lines) < size and self._fill():
+            pass
+        data = bytes(self._lines[:size])
+        del self._lines[:size]
+        return data
+
+    def readline(self):
+        while self._lines.find(b"\n") < 0:
+            if not self._fill():
+                break
+        end = self._lines.find(b"\n")
+        end = len(self._lines) if end < 0 else end + 1
+        line = bytes(self._lines[:end])
+        del self._lines[:end]
+        return line
+
+    def reset_input_buffer(self):
+        self.link.reset_input_buffer()
+        self._lines.clear()
+
+
 TIME_DELTA = 15
+# Payload bytes written per link write, small enough for the modem's
+# receive buffer (larger bursts are answered with 125/525)
+PAYLOAD_CHUNK_SIZE = 64
+# Bits on the wire per byte (start + 8 data + stop)
+BITS_PER_BYTE = 10
 class Hiber:
-    def __init__(self, port=[], baudrate=19200, arduino=False):
-        # Serial Port setup
-        if not re.match(r'^COM[\d]+$', port):
+    def __init__(self, port=[], baudrate=19200, arduino=False, pipeline_window=1, history=0,
+                 cache=False, cache_ttl=None, identity_cache=None, pacing=False, pool=None,
+                 capture=None, metrics=False):
+        # Link setup: a port name ("COMn", "/dev/...", "socket://host:port")
+        # or a ready transport object (see transport.py)
+        if isinstance(port, str):
+            if not valid_port(port):
+                raise ValueError('Invalid COM Port')
+            if baudrate not in serial.Serial.BAUDRATES:
+                raise ValueError('Not a valid baudrate')
+            self._ser = open_transport(port, baudrate, 10, pool)
+        elif hasattr(port, 'readline') and hasattr(port, 'write'):
+            self._ser = port
+        else:
             raise ValueError('Invalid COM Port')
-        if baudrate not in serial.Serial.BAUDRATES:
-            raise ValueError('Not a valid baudrate')
-        self._ser = serial.Serial()
-        self._ser.port = port
-        self._ser.baudrate = baudrate
-        self._ser.bytesize = 8
-        self._ser.parity = 'N'
-        self._ser.stopbits = 1
-        self._ser.timeout = 10
-
-        self.modem = {
-            'firmware_version':[],
-            'HW_TYPE_STR':[],
-            'HW_TYPE_INT':[],
-            'FW_VERSION':[],
-            'MODEM_NO_STR':[],
-            'MODEM_NO_INT':[],
-            'seconds_since_last_fix':[],
-            'seconds_until_next_fix':[],
-            'seconds_left_until_alarm':[],
-            'seconds_left_until_pass':[],
-            'latitude':[],
-            'longitude':[],
-            'altitude':[],
-            'alarm_id':[],
-            'datetime':[],
-            'toggle_enabled':[]
-        }
-        # self.modem = modem_info(
-        #     firmware_version = [],
-        #     HW_TYPE_STR = [],
-        #     HW_TYPE_INT = [],
-        #     FW_VERSION = [],
-        #     MODEM_NO_STR = [],
-        #     MODEM_NO_INT = [],
-        #     seconds_since_last_fix = [],
-        #     seconds_until_next_fix = [],
-        #     seconds_left_until_alarm = [],
-        #     seconds_left_until_pass = [],
-        #     alarm_id = [],
-        #     datetime = [],
-        #     toggle_enabled = []
-        # )
-
+        self.baudrate = baudrate
+
+        self.modem = ModemState()
+        # Optional bounded history of polled values (capacity in samples)
+        self.history = TelemetryHistory(history) if history else None
+        # Optional cache for get_next_pass/get_next_alarm/get_location
+        self.cache = StateCache(cache_ttl) if cache else None
+        self.clock_sync = ClockSync(TIME_DELTA)
+        # Optional on-disk identity cache (path) for warm restarts
+        self.identity_cache = IdentityCache(identity_cache) if identity_cache else None
+        # Optional adaptive write pacing and overflow retries (True or a WritePacer)
+        if pacing is True:
+            pacing = WritePacer()
+        self.pacer = pacing or None
+
+        # Optional per-command instrumentation (True or a CommandMetrics)
+        if metrics is True:
+            metrics = CommandMetrics()
+        self.metrics = metrics or None
+        if self.metrics is not None:
+            self._ser = self.metrics.wrap(self._ser)
+        # Optional raw traffic capture (path or TrafficCapture), see capture.py
+        if isinstance(capture, str):
+            capture = TrafficCapture(capture, framed=arduino == 'framed')
+        self.capture = capture
+        if capture is not None:
+            self._ser = CaptureLink(self._ser, capture)
+        # arduino='framed': binary batched frames instead of "Modem:" lines
+        if arduino == 'framed':
+            self._ser = ArdFramedLink(self._ser)
+            arduino = False
         self._arduino = arduino
-
-    def start(self):
+        self.pipeline_window = pipeline_window
+        self.timeout = 10
+        self.dispatcher = LineDispatcher()
+        self._reader = None
+        # Responses still owed to commands that timed out
+        self._abandoned = 0
+
+    def start(self, reader=False, ready_timeout=2.0, probe_interval=0.1):
         '''
         Start sequence for Hiber modem.
+
+        Instead of a fixed wait after opening the port, the modem is probed
+        with get_firmware_version every probe_interval until it answers
+        with a valid API(...) line or ready_timeout passes.
+
+        Args:
+            reader: Read through a background LineReader thread
+            ready_timeout: Max seconds to wait for the modem
+            probe_interval: Seconds between readiness probes
+        Returns:
+            True if the modem answered before the deadline, False if it did
+            not or the port could not be opened
         '''
         try:
             self._ser.open()
-            time.sleep(2.0)
         except Exception as e:
-            print(e)
+            log.error("Could not open %s: %s", self._ser.port, e)
+            if not getattr(self._ser, 'is_open', True):
+                return False
+        ready = self.wait_ready(ready_timeout, probe_interval)
+        if reader:
+            self.start_reader()
+        return ready
+
+    def wait_ready(self, timeout=2.0, probe_interval=0.1):
+        '''
+        Probe until the modem answers, then drain the other probe answers.
+
+        The next probe is sent only after waiting for an answer to the
+        last one, and the wait doubles with every unanswered probe, so a
+        link slower than probe_interval still gets an answer through.
+        Probes left unanswered may be answered late: they are counted and,
+        once the modem is ready, their answers are read until all have
+        arrived or none comes within the time the first answer took (probes
+        sent while the modem was booting are never answered).
+        '''
+        probe = LPGAN_API_TxBytes.get_firmware_version()
+        started = time.monotonic()
+        deadline = started + timeout
+        saved_timeout = self._ser.timeout
+        wait = probe_interval
+        outstanding = 0
+        ready = False
+        try:
+            while not ready and time.monotonic() < deadline:
+                self._write(probe)
+                outstanding += 1
+                self._ser.timeout = max(min(wait, deadline - time.monotonic()), probe_interval)
+                line = self._ser.readline()
+                while line:
+                    if line.startswith(b"API("):
+                        outstanding -= 1
+                        ready = True
+                        break
+                    line = self._ser.readline()
+                wait *= 2
+            if ready and outstanding:
+                # Answers to earlier probes may still be on the way, at most
+                # as far apart as the first answer took to come
+                self._ser.timeout = time.monotonic() - started + probe_interval
+                while outstanding:
+                    line = self._ser.readline()
+                    if not line:
+                        break
+                    if line.startswith(b"API("):
+                        outstanding -= 1
+        finally:
+            self._ser.timeout = saved_timeout
+        return ready
+
+    def close(self):
+        '''
+        Stop the reader and close the link (and capture); pooled sockets go
+        back to their ConnectionPool instead.
+        '''
+        self.stop_reader()
+        link = self._ser
+        while hasattr(link, 'link'):
+            link = link.link
+        pool = getattr(link, 'pool', None)
+        if pool is not None:
+            pool.release(link)
+        else:
+            link.close()
+        if self.capture is not None:
+            self.capture.close()
+
+    def start_reader(self, poll_interval=0.05):
+        '''
+        Start the background LineReader.
 
-        # self.ard_write("get_firmware_version")
-        # print(self._ser.readline())
+        The serial read timeout drops to poll_interval so the thread can be
+        stopped promptly; commands wait on the frame queue with their own
+        deadline (self.timeout) instead.
+        '''
+        if self._reader is not None:
+            return
+        self._ser.timeout = poll_interval
+        self.dispatcher.start()
+        self._reader = LineReader(self._ser, self.dispatcher.dispatch)
+        self._reader.start()
+
+    def stop_reader(self):
+        if self._reader is None:
+            return
+        self._reader.stop()
+        self._reader = None
+        self.dispatcher.stop()
+        self._ser.timeout = self.timeout
+
+    def on(self, kind, callback):
+        '''
+        Register a callback for RESPONSE, NOTIFICATION or DEBUG lines.
+        '''
+        self.dispatcher.register(kind, callback)
 
     def ard_write(self, command):
         '''
@@ -384,137 +1404,477 @@ class Hiber:
             send_str: String sent to Arduino
         ''' 
         send_str = "Modem:" + command + "\r\n"
-        # print(send_str)
+        log.debug("ard_write %r", send_str)
         self._ser.write(send_str.encode())
         return send_str
 
-    def ard_wakeup(self, state):
+    def ard_wakeup(self, state, defer=False):
         '''
         Arduino wakeup pin set
 
-        For testing using the Arduino passthrough.  Arduinot takes
+        For testing using the Arduino passthrough.  Arduino takes
         the following command:
 
         Wakeup:(bool)\r\n: Wakeup pin state
 
+        In framed mode the pin change is an ARD_WAKEUP record instead, and
+        with defer=True it rides along in the next command frame.
+
         Args:
             state:  On=True, Off=False
+            defer: Framed mode only, send with the next command frame
+        '''
+        if not isinstance(state, bool):
+            raise ValueError("state must be a boolean value")
+        if isinstance(self._ser, ArdFramedLink):
+            self._ser.wakeup(state, defer)
+        else:
+            self._write_raw(b"Wakeup:1\r\n" if state else b"Wakeup:0\r\n")
+
+    def _write(self, message):
+        '''
+        Write an encoded command (bytes), framed when using the Arduino.
+        '''
+        if self._arduino:
+            message = LPGAN_API_TxBytes.ard_frame(message)
+        self._write_raw(message)
+
+    def _write_raw(self, data):
+        pacer = self.pacer
+        if pacer is None:
+            self._ser.write(data)
+            return
+        pacer.wait()
+        self._ser.write(data)
+        pacer.on_write(len(data))
+
+    def _readline(self, timeout=None):
+        if self._reader is None:
+            return self._ser.readline().decode()
+        try:
+            return self.dispatcher.responses.get(timeout=timeout).decode()
+        except queue.Empty:
+            return ''
+
+    def _read_response(self):
+        '''
+        Next API(...) line within self.timeout.
+
+        Without the background reader, lines are read here and anything
+        that is not a response is handed to the dispatcher callbacks.
+
+        A command that timed out may still be answered later.  Each timeout
+        is counted and that many late responses are dropped before the next
+        one is returned, so a timeout does not shift the responses of the
+        commands that follow.  A wait that dropped a late line and then
+        timed out is not counted again: the dropped line may have been its
+        own response if the abandoned one never arrived.
+        '''
+        dropped = False
+        while True:
+            line = self._next_response()
+            if not line:
+                if not dropped:
+                    self._abandoned += 1
+                return ''
+            if not self._abandoned:
+                return line
+            self._abandoned -= 1
+            dropped = True
+            log.warning("Dropped late response %s", line)
+
+    def _next_response(self):
+        if self._reader is not None:
+            return self._readline(self.timeout)
+        deadline = time.monotonic() + self.timeout
+        responses = self.dispatcher.responses
+        while responses.empty():
+            line = self._ser.readline().rstrip(b"\r\n")
+            if line:
+                self.dispatcher.dispatch(line)
+            elif time.monotonic() >= deadline or not self._ser.timeout:
+                return ''
+        return responses.get_nowait().decode()
+
+    def _command(self, name, *args):
+        '''
+        Single write->readline round trip.
+
+        With a pacer, commands answered with a transient overflow code are
+        retried (bounded backoff) before the error is raised.
+
+        Args:
+            name: LPGAN_API_TxBytes/LPGAN_API_Rx method name, e.g. 'get_location'
+            args: Arguments for the LPGAN_API_TxBytes encoder
+        Returns:
+            Result of the matching LPGAN_API_Rx decoder
         '''
+        message = getattr(LPGAN_API_TxBytes, name)(*args)
+        line = self._exchange(name, message)
+        pacer = self.pacer
+        if pacer is not None:
+            attempt = 0
+            while pacer.is_transient(line):
+                pacer.on_overflow()
+                if attempt >= pacer.max_retries:
+                    break
+                pacer.before_retry(attempt)
+                attempt += 1
+                line = self._exchange(name, message)
+            else:
+                pacer.on_success()
+        return getattr(LPGAN_API_Rx, name)(line)
+
+    def _exchange(self, name, message):
+        '''
+        Write one command and read its response line, timed from the
+        actual link write when metrics are enabled.
+        '''
+        self._write(message)
+        line = self._read_response()
+        metrics = self.metrics
+        if metrics is not None:
+            metrics.observe(name, metrics.last_write, line, metrics.first_byte)
+        return line
+
+    def pipeline(self, commands, window=None):
+        '''
+        Send several commands without waiting for each response.
+
+        Up to `window` commands are kept in flight and each group of new
+        commands goes out in a single write.  Responses arrive in the
+        order the commands were written, so each API(...) line is matched
+        to the oldest pending command and decoded with its LPGAN_API_Rx
+        decoder.  Every response is read even if one fails so the link stays
+        in step; the first error is raised once the queue has drained.
+        With a pacer, commands answered with an overflow code are queued
+        again after the pacer's bounded backoff, and batches are spaced by
+        the pacer's gap.
+
+        Args:
+            commands: Iterable of (name, args) tuples, e.g.
+                [('get_location', ()), ('set_gps_mode', (True,))]
+            window: Max commands in flight (default self.pipeline_window)
+        Returns:
+            List of decoded results, in command order
+        '''
+        if window is None:
+            window = self.pipeline_window
+        if window < 1:
+            raise ValueError('window must be at least 1')
+
+        results = []
+        todo = deque()
+        for name, args in commands:
+            todo.append((len(results), name, getattr(LPGAN_API_TxBytes, name)(*args), 0))
+            results.append(None)
+        pending = deque()
+        pacer = self.pacer
+        metrics = self.metrics
+        sent_times = deque()
+        error = None
+
+        def resolve():
+            nonlocal error
+            item = pending.popleft()
+            index, name, message, attempt = item
+            line = self._read_response()
+            if metrics is not None:
+                metrics.observe(name, sent_times.popleft(), line)
+            if pacer is not None:
+                if pacer.is_transient(line):
+                    pacer.on_overflow()
+                    if attempt < pacer.max_retries:
+                        pacer.before_retry(attempt)
+                        todo.append((index, name, message, attempt + 1))
+                        return
+                else:
+                    pacer.on_success()
+            try:
+                results[index] = getattr(LPGAN_API_Rx, name)(line)
+            except Exception as e:
+                if error is None:
+                    error = e
+
+        batch = []
+        while todo or pending:
+            if todo and len(pending) < window:
+                item = todo.popleft()
+                batch.append(item[2])
+                pending.append(item)
+                continue
+            if batch:
+                self._write_raw(LPGAN_API_TxBytes.join(batch, self._arduino))
+                if metrics is not None:
+                    sent_times.extend([metrics.last_write] * len(batch))
+                batch = []
+            resolve()
+
+        if error is not None:
+            raise error
+        return results
+
 
     def initalization(self):
         '''
         Hiber Modem initialization sequence.
+
+        With pipeline_window > 1 the payload toggle and get_modem_info are
+        pipelined.  With an identity cache, a known modem skips
+        get_firmware_version.  The time check stays a single round trip so
+        its latency can be measured.
         '''
         step_cnt = 0
-        print("**Initialization Start**")
+        log.info("Initialization start")
+
+        if self.pipeline_window > 1:
+            log.info("Start %d: Modem Toggle/Info (pipelined)", step_cnt)
+            _, info = self.pipeline([
+                ('toggle_payload_over_debug', (True,)),
+                ('get_modem_info', ()),
+            ])
+            self.modem.update(info)
+            step_cnt += 2
+        else:
+            log.info("Start %d: Modem Toggle Payload over Debug", step_cnt)
+            self._modem_toggle_payload_over_debug()
+            step_cnt += 1
 
-        print(f"Start {step_cnt}:  Modem Toggle Payload over Debug")
-        self._modem_toggle_payload_over_debug()
-        step_cnt += 1
+            log.info("Start %d: Modem Get Info", step_cnt)
+            self._modem_get_info()
+            step_cnt += 1
 
-        print(f"Start {step_cnt}:  Modem Get Info")
-        self._modem_get_info()
-        step_cnt += 1
-
-        print(f"Start {step_cnt}:  Modem Firmware Version")
-        self._modem_get_firmware_version()
+        if self._load_identity():
+            log.info("Start %d: Modem Firmware Version (cached)", step_cnt)
+        else:
+            log.info("Start %d: Modem Firmware Version", step_cnt)
+            self._modem_get_firmware_version()
+            if self.identity_cache is not None:
+                self.identity_cache.store(self.modem)
         step_cnt += 1
         
-        print(f"Start {step_cnt}:  Modem Get Time")
+        log.info("Start %d: Modem Get Time", step_cnt)
         self._modem_get_time()
         step_cnt += 1
 
-        # print(f"Start {step_cnt}:  Modem Set Time")
-        # self._modem_set_time()
-        # step_cnt += 1
+    def _load_identity(self):
+        '''
+        Fill firmware_version from the identity cache if the modem
+        reported by get_modem_info is known.
+        '''
+        if self.identity_cache is None:
+            return False
+        firmware_version = self.identity_cache.lookup(self.modem)
+        if firmware_version is None:
+            return False
+        self.modem.firmware_version = firmware_version
+        return True
 
     def _modem_toggle_payload_over_debug(self):
-        message = LPGAN_API_Tx.toggle_payload_over_debug(True)
-        if self._arduino:
-            self.ard_write(message)
-
-        result = self._ser.readline().decode()
-        LPGAN_API_Rx.toggle_payload_over_debug(result)
+        self._command('toggle_payload_over_debug', True)
     
     def _modem_get_info(self):
-        message = LPGAN_API_Tx.get_modem_info()
-        if self._arduino:
-            self.ard_write(message)
-        result = self._ser.readline().decode()
-        result = LPGAN_API_Rx.get_modem_info(result)
-
-        self.modem['HW_TYPE_STR'] = result['HW_TYPE_STR']
-        self.modem['HW_TYPE_INT'] = result['HW_TYPE_INT']
-        self.modem['FW_VERSION'] = result['FW_VERSION']
-        self.modem['MODEM_NO_STR'] = result['MODEM_NO_STR']
-        self.modem['MODEM_NO_INT'] = result['MODEM_NO_INT']
+        self.modem.update(self._command('get_modem_info'))
 
     def _modem_get_firmware_version(self):
-        message = LPGAN_API_Tx.get_firmware_version()
-        if self._arduino:
-            self.ard_write(message)
-        result = self._ser.readline().decode()
-        result = LPGAN_API_Rx.get_firmware_version(result)
-        self.modem['firmware_version'] = result['firmware_version']
+        self.modem.update(self._command('get_firmware_version'))
 
-    def _modem_set_time(self, dt=datetime.datetime.now()):
-        message = LPGAN_API_Tx.set_datetime(dt)
-        if self._arduino:
-            self.ard_write(message)
-        
-        result = self._ser.readline().decode()
-        result = LPGAN_API_Rx.set_datetime(result)
-        self.modem['datetime'] = result['datetime']
+    def _modem_set_time(self, dt=None):
+        if dt is None:
+            dt = self.clock_sync.corrected_time()
+        self.set_datetime(dt)
+        self.clock_sync.corrected()
 
     def _modem_get_time(self):
-        message = LPGAN_API_Tx.get_datetime()
-        if self._arduino:
-            self.ard_write(message)
-
-        result = self._ser.readline().decode()
-        now = datetime.datetime.now()
-        result = LPGAN_API_Rx.get_datetime(result);
-        dt_result = datetime.datetime.strptime(result['datetime'], '%Y-%m-%dT%H:%M:%SZ')
+        '''
+        Sample the modem clock and correct it if the predicted offset is
+        beyond TIME_DELTA.
+        '''
+        self.sample_time()
+        if self.clock_sync.needs_correction():
+            log.warning("Time difference (%.1f) > %d, resetting modem time",
+                        self.clock_sync.offset(), TIME_DELTA)
+            self._modem_set_time()
 
-        time_diff = dt_result - now
+    def sample_time(self):
+        '''
+        One timestamped get_datetime exchange, fed to self.clock_sync.
 
-        if (time_diff.total_seconds() > TIME_DELTA) or (time_diff.total_seconds()) < -TIME_DELTA:
-            print("->Time Difference ({time_diff.total_seconds()}) > {TIME_DELTA}, Resetting Modem Time")
-            self._modem_set_time()
+        Returns:
+            Offset (modem - host) of this sample in seconds
+        '''
+        message = LPGAN_API_TxBytes.get_datetime()
+        sent = time.monotonic()
+        self._write(message)
+        response = self._read_response()
+        received = time.monotonic()
+        result = LPGAN_API_Rx.get_datetime(response)
+        modem_time = datetime.datetime.strptime(result.datetime, '%Y-%m-%dT%H:%M:%SZ')
+        return self.clock_sync.add_sample(sent, received, modem_time)
 
     def set_location(self, latitude, longitude, altitude):
-        message = LPGAN_API_Tx.set_location(latitude, longitude, altitude)
-        if self._arduino:
-            self.ard_write(message)
-        result = self._ser.readline().decode()
-        result = LPGAN_API_Rx.set_location(result)
-
-        self.modem['latitude'] = result['latitude']
-        self.modem['longitude'] = result['longitude']
-        self.modem['altitude'] = result['altitude']
-        self.modem['seconds_until_next_fix'] = result['seconds_until_next_fix']
-        self.modem['seconds_since_last_fix'] = result['seconds_since_last_fix']
-
-    def get_location(self):
-        message = LPGAN_API_Tx.get_location()
-        if self._arduino:
-            self.ard_write(message)
-        result = self._ser.readline().decode()
-        result = LPGAN_API_Rx.get_location(result)
+        result = self._command('set_location', latitude, longitude, altitude)
+
+        self.modem.update(result)
+        self._record(result)
+        if self.cache is not None:
+            self.cache.put('get_location', result)
+
+    def set_datetime(self, dt):
+        result = self._command('set_datetime', dt)
+
+        self.modem.datetime = result.datetime
+        self.clock_sync.reset()
+        if self.cache is not None:
+            self.cache.invalidate()
 
         return result
 
-    def get_next_pass(self):
-        message = LPGAN_API_Tx.get_next_pass()
-        if self._arduino:
-            self.ard_write(message)
-        result = self._ser.readline().decode()
-        result = LPGAN_API_Rx.get_next_pass(result)
+    def go_to_sleep(self):
+        if self.cache is not None:
+            self.cache.invalidate()
+        result = self._command('go_to_sleep')
 
-        self.modem['seconds_left_until_pass'] = result['seconds_left_until_pass']
+        self.modem.update(result)
 
         return result
 
+    def set_payload(self, data):
+        '''
+        Hand one payload to the modem for the next pass.
+
+        Args:
+            data: Payload bytes
+        Returns:
+            PayloadAck
+        '''
+        return self.upload_payload(data).ack
+
+    def upload_payload(self, source, size=None, chunk_size=PAYLOAD_CHUNK_SIZE):
+        '''
+        Announce a payload with set_payload(n) and stream its n bytes.
+
+        Bytes-like sources are written as memoryview slices, file-like
+        sources are read into one reused buffer, so no chunk is copied.
+        Each chunk is given its wire time at self.baudrate before the next
+        one is written, so the modem buffer never takes a burst larger than
+        chunk_size; the write pacer's gap applies on top when enabled.
+
+        With arduino='framed' the chunks travel as ARD_PAYLOAD records.  The
+        line based Arduino passthrough cannot carry binary data, so it is
+        refused (ValueError) before anything is sent.
+
+        Args:
+            source: bytes, bytearray, memoryview or binary file object
+            size: Bytes to send from a file (default: up to its end;
+                required for unseekable streams)
+            chunk_size: Bytes per link write
+        Returns:
+            PayloadTransfer(ack, bytes_sent, chunks, seconds, throughput)
+        '''
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        if isinstance(self._ser, ArdFramedLink):
+            write = self._ser.write_payload
+        elif self._arduino:
+            raise ValueError("payloads need arduino='framed' behind an Arduino")
+        else:
+            write = self._ser.write
+        if hasattr(source, 'readinto'):
+            if size is None:
+                start = source.tell()
+                size = source.seek(0, 2) - start
+                source.seek(start)
+            chunks = self._file_chunks(source, size, chunk_size)
+        else:
+            view = memoryview(source).cast('B')
+            if size is None:
+                size = len(view)
+            elif size > len(view):
+                raise ValueError("size %d exceeds the %d byte source" % (size, len(view)))
+            chunks = (view[i:i + chunk_size] for i in range(0, size, chunk_size))
+
+        ack = self._command('set_payload', size)
+        if ack.payload_bytes != size:
+            raise ValueError("modem acknowledged %d of %d payload bytes" % (ack.payload_bytes, size))
+
+        pacer = self.pacer
+        byte_time = BITS_PER_BYTE / self.baudrate
+        sent = count = 0
+        start = time.perf_counter()
+        ready = start
+        for chunk in chunks:
+            if pacer is not None:
+                pacer.wait()
+            delay = ready - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            write(chunk)
+            ready = time.perf_counter() + len(chunk) * byte_time
+            if pacer is not None:
+                pacer.on_write(len(chunk))
+            sent += len(chunk)
+            count += 1
+        seconds = time.perf_counter() - start
+        if sent != size:
+            raise ValueError("payload source ended after %d of %d bytes" % (sent, size))
+        throughput = sent / seconds if seconds > 0 else 0.0
+        log.debug("payload of %d bytes sent in %d chunks, %.0f B/s", sent, count, throughput)
+        return PayloadTransfer(ack, sent, count, seconds, throughput)
+
+    @staticmethod
+    def _file_chunks(f, size, chunk_size):
+        '''
+        Views of one reused buffer holding successive reads of `f`.
+        '''
+        view = memoryview(bytearray(min(chunk_size, size) or 1))
+        left = size
+        while left:
+            n = f.readinto(view[:min(left, len(view))])
+            if not n:
+                return
+            left -= n
+            yield view[:n]
+
+    def get_location(self, refresh=False):
+        return self._query('get_location', refresh)
+
+    def get_next_pass(self, refresh=False):
+        result = self._query('get_next_pass', refresh)
+
+        self.modem.seconds_left_until_pass = result.seconds_left_until_pass
+
+        return result
+
+    def get_next_alarm(self, refresh=False):
+        result = self._query('get_next_alarm', refresh)
+
+        self.modem.update(result)
+
+        return result
+
+    def _query(self, name, refresh=False):
+        '''
+        Countdown query, served from the cache when enabled and fresh.
+
+        Args:
+            name: 'get_location', 'get_next_pass' or 'get_next_alarm'
+            refresh: Always ask the modem
+        '''
+        if self.cache is not None and not refresh:
+            result = self.cache.get(name)
+            if result is not None:
+                return result
+        result = self._command(name)
+        if self.cache is not None:
+            self.cache.put(name, result)
+        self._record(result)
+        return result
+
+    def _record(self, result):
+        if self.history is not None:
+            self.history.record(result)
+
 if __name__ == "__main__":
     test_lat = 47.686449
     test_lon = -122.254220
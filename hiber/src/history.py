@@ -0,0 +1,157 @@
+'''
+Bounded telemetry history for polled modem state.
+
+Samples are stored column-wise in preallocated array('d') buffers used as
+a ring: once full, the oldest sample is overwritten.  Memory use is fixed at
+capacity * len(COLUMNS) * 8 bytes.  Windows are exported as memoryview
+segments (no copy); NumPy views are available when NumPy is installed.
+'''
+import time
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+NAN = math.nan
+
+
+class TelemetryHistory:
+    '''
+    Ring buffer of timestamped modem samples.
+
+    Fields not present in a sample are stored as NaN.
+
+    Args:
+        capacity: Max number of samples kept
+    '''
+    COLUMNS = (
+        'timestamp',
+        'latitude',
+        'longitude',
+        'altitude',
+        'seconds_since_last_fix',
+        'seconds_until_next_fix',
+        'seconds_left_until_pass',
+        'alarm_id',
+        'seconds_left_until_alarm',
+    )
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1')
+        self.capacity = capacity
+        self._columns = {
+            name: array('d', bytes(8 * capacity)) for name in self.COLUMNS
+        }
+        self._fields = self.COLUMNS[1:]
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def record(self, values, timestamp=None):
+        '''
+        Store one sample.
+
+        Args:
+            values: Response record or dict; keys outside COLUMNS are ignored
+            timestamp: Seconds since the epoch (default time.time())
+        '''
+        index = self._next
+        columns = self._columns
+        columns['timestamp'][index] = time.time() if timestamp is None else timestamp
+        keys = values.keys()
+        for name in self._fields:
+            columns[name][index] = values[name] if name in keys else NAN
+        self._next = (index + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+
+    def _ranges(self):
+        '''
+        Chronological (start, stop) index ranges of the stored samples.
+        '''
+        start = (self._next - self._count) % self.capacity
+        if start + self._count <= self.capacity:
+            return [(start, start + self._count)]
+        return [(start, self.capacity), (0, self._next)]
+
+    def _slice(self, first, last):
+        '''
+        Ranges covering the chronological sample positions [first, last).
+        '''
+        ranges = []
+        offset = 0
+        for start, stop in self._ranges():
+            size = stop - start
+            lo = max(first - offset, 0)
+            hi = min(last - offset, size)
+            if lo < hi:
+                ranges.append((start + lo, start + hi))
+            offset += size
+        return ranges
+
+    def _position(self, timestamp, bisect):
+        '''
+        Chronological position of timestamp among stored samples.
+        '''
+        timestamps = memoryview(self._columns['timestamp'])
+        offset = 0
+        for start, stop in self._ranges():
+            segment = timestamps[start:stop]
+            if len(segment) and timestamp <= segment[-1]:
+                return offset + bisect(segment, timestamp)
+            offset += stop - start
+        return offset
+
+    def window(self, since=None, until=None, last=None):
+        '''
+        Export a window of samples without copying.
+
+        Args:
+            since: Oldest timestamp to include
+            until: Newest timestamp to include
+            last: Only the newest `last` samples of the window
+        Returns:
+            Dict of column name -> list of memoryview segments in
+            chronological order (two segments when the window wraps)
+        '''
+        first = 0 if since is None else self._position(since, bisect_left)
+        end = self._count if until is None else self._position(until, bisect_right)
+        if last is not None:
+            first = max(first, end - last)
+        ranges = self._slice(first, end)
+        return {
+            name: [memoryview(column)[start:stop] for start, stop in ranges]
+            for name, column in self._columns.items()
+        }
+
+    def to_numpy(self, since=None, until=None, last=None):
+        '''
+        Window as NumPy arrays.
+
+        Views into the buffers when the window does not wrap, otherwise one
+        concatenated copy per column.
+        '''
+        if np is None:
+            raise ImportError('TelemetryHistory.to_numpy requires numpy')
+        result = {}
+        for name, segments in self.window(since, until, last).items():
+            arrays = [np.frombuffer(segment, dtype=np.float64) for segment in segments]
+            if len(arrays) == 1:
+                result[name] = arrays[0]
+            elif arrays:
+                result[name] = np.concatenate(arrays)
+            else:
+                result[name] = np.empty(0, dtype=np.float64)
+        return result
+
+    def clear(self):
+        self._next = 0
+        self._count = 0
@@ -0,0 +1,66 @@
+'''
+On-disk cache of modem identity and firmware, keyed by MODEM_NO_STR.
+
+Lets a warm restart confirm the modem with get_modem_info alone instead of
+querying the firmware version again.
+'''
+import os
+import json
+import threading
+
+
+IDENTITY_FIELDS = ('HW_TYPE_STR', 'HW_TYPE_INT', 'FW_VERSION', 'MODEM_NO_INT')
+
+
+class IdentityCache:
+    '''
+    JSON file of {MODEM_NO_STR: {identity fields..., 'firmware_version'}}.
+
+    Args:
+        path: Cache file; created on first store
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def lookup(self, state):
+        '''
+        Cached firmware version if `state` matches a stored identity.
+
+        Args:
+            state: ModemState (or mapping) filled from get_modem_info
+        Returns:
+            firmware_version string, or None
+        '''
+        with self._lock:
+            entry = self._load().get(state['MODEM_NO_STR'])
+        if entry is None:
+            return None
+        for field in IDENTITY_FIELDS:
+            if entry.get(field) != state[field]:
+                return None
+        return entry.get('firmware_version')
+
+    def store(self, state):
+        '''
+        Save the identity and firmware version from `state`.
+        '''
+        entry = {field: state[field] for field in IDENTITY_FIELDS}
+        entry['firmware_version'] = state['firmware_version']
+        with self._lock:
+            entries = self._load()
+            entries[state['MODEM_NO_STR']] = entry
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(entries, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
@@ -0,0 +1,263 @@
+'''
+Parallel bulk parser for modem response logs.
+
+Log files are read in chunks of whole lines and the chunks are decoded on
+a process pool.  Every API(...) line goes through its LPGAN_API_Rx decoder:
+the command is taken from a name in front of the response
+("get_next_pass: API(600: 1298)") when it is one of LPGAN_API_Rx.DECODERS,
+otherwise it is inferred from the shape of the response; lines whose shape
+fits several commands are skipped.  Decoded records are written as
+columns, one table per command: a CSV file each, or arrays in one .npz file.
+
+Usage:
+    python logparse.py LOG [LOG ...] -o OUT [--format csv|npz] [--workers N]
+'''
+import os
+import re
+import sys
+import csv
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from hiber import LPGAN_API_Rx
+
+
+CHUNK_SIZE = 1 << 20
+
+_LINE_RE = re.compile(r'(?:(\w+)\W*?)?(API\(.*)')
+_INT_RE = re.compile(r'^-?\d+$')
+_NUMBER_RE = re.compile(r'^-?\d+(?:\.\d*)?$')
+_DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T')
+
+
+def guess_command(code, fields):
+    '''
+    Decoder name for a response without a command name, from its shape.
+
+    A single integer (get_next_pass, set_payload, set_gps_mode, ...) and
+    two fields with code 600 (get_next_alarm, or go_to_sleep in the
+    opposite order) could come from several commands; those lines need a
+    command name in the log or --command.
+
+    Args:
+        code: Status code (int)
+        fields: Response fields (str)
+    Returns:
+        LPGAN_API_Rx method name, or None if the shape is ambiguous
+    '''
+    if code == 602:
+        return 'go_to_sleep'
+    if code != 600:
+        return None
+    n = len(fields)
+    if n == 5:
+        return 'get_location' if _NUMBER_RE.match(fields[0]) else 'get_modem_info'
+    if n == 1:
+        field = fields[0]
+        if _DATETIME_RE.match(field):
+            return 'get_datetime'
+        if _INT_RE.match(field):
+            return None
+        return 'get_firmware_version'
+    return None
+
+
+def parse_chunk(data, command=None):
+    '''
+    Decode one chunk of log lines (runs in the worker processes).
+
+    Args:
+        data: Chunk of whole lines (bytes)
+        command: Decoder used for every line, instead of per-line detection
+    Returns:
+        (tables, stats): tables is {command: {field: [values]}}; stats
+        counts lines, decoded and skipped lines and error codes
+    '''
+    tables = {}
+    errors = {}
+    lines = decoded = 0
+    rx = LPGAN_API_Rx
+    for line in data.decode('ascii', 'replace').splitlines():
+        match = _LINE_RE.search(line)
+        if match is None:
+            continue
+        lines += 1
+        name, response = match.groups()
+        try:
+            code, fields = rx.parse(response)
+        except ValueError:
+            errors['invalid'] = errors.get('invalid', 0) + 1
+            continue
+        if code not in (600, 602):
+            errors[code] = errors.get(code, 0) + 1
+            continue
+        if command is not None:
+            name = command
+        elif name not in rx.DECODERS:
+            name = guess_command(code, fields)
+            if name is None:
+                continue
+        try:
+            record = getattr(rx, name)(response)
+        except (ValueError, IndexError):
+            errors['invalid'] = errors.get('invalid', 0) + 1
+            continue
+        if record is None or not hasattr(record, '_fields'):
+            continue
+        table = tables.get(name)
+        if table is None:
+            table = tables[name] = {field: [] for field in record._fields}
+        for field, value in record.items():
+            table[field].append(value)
+        decoded += 1
+    return tables, {'lines': lines, 'decoded': decoded, 'skipped': lines - decoded, 'errors': errors}
+
+
+def iter_chunks(paths, chunk_size=CHUNK_SIZE):
+    '''
+    Stream the files as chunks of about chunk_size bytes, split on line ends.
+    '''
+    for path in paths:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                if not chunk.endswith(b"\n"):
+                    chunk += f.readline()
+                yield chunk
+
+
+class CsvWriter:
+    '''
+    One CSV file per command in `directory`, appended chunk by chunk.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._files = {}
+
+    def write(self, tables):
+        for name, table in tables.items():
+            entry = self._files.get(name)
+            if entry is None:
+                f = open(os.path.join(self.directory, name + '.csv'), 'w', newline='')
+                writer = csv.writer(f)
+                writer.writerow(table.keys())
+                entry = self._files[name] = (f, writer)
+            entry[1].writerows(zip(*table.values()))
+
+    def close(self):
+        for f, _ in self._files.values():
+            f.close()
+
+
+class NpzWriter:
+    '''
+    Columns collected over all chunks, saved as "<command>.<field>" arrays.
+    '''
+    def __init__(self, path):
+        if np is None:
+            raise ImportError('npz output requires numpy')
+        self.path = path
+        self._tables = {}
+
+    def write(self, tables):
+        for name, table in tables.items():
+            columns = self._tables.setdefault(name, {field: [] for field in table})
+            for field, values in table.items():
+                columns[field].extend(values)
+
+    def close(self):
+        arrays = {}
+        for name, table in self._tables.items():
+            for field, values in table.items():
+                arrays[name + '.' + field] = np.asarray(values)
+        np.savez(self.path, **arrays)
+
+
+def _merge_stats(total, stats):
+    for key in ('lines', 'decoded', 'skipped'):
+        total[key] += stats[key]
+    for code, count in stats['errors'].items():
+        total['errors'][code] = total['errors'].get(code, 0) + count
+
+
+def run(paths, writer, workers=None, chunk_size=CHUNK_SIZE, command=None):
+    '''
+    Parse the log files into `writer`.
+
+    Chunks are decoded on `workers` processes (in this process if 1) with
+    at most two chunks per worker in flight; results are written in file
+    order.
+
+    Returns:
+        Stats dict: lines, decoded, skipped, errors, seconds, lines_per_second
+    '''
+    workers = workers or os.cpu_count() or 1
+    total = {'lines': 0, 'decoded': 0, 'skipped': 0, 'errors': {}}
+    start = time.perf_counter()
+    if workers == 1:
+        for chunk in iter_chunks(paths, chunk_size):
+            tables, stats = parse_chunk(chunk, command)
+            writer.write(tables)
+            _merge_stats(total, stats)
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            in_flight = deque()
+            for chunk in iter_chunks(paths, chunk_size):
+                in_flight.append(pool.submit(parse_chunk, chunk, command))
+                if len(in_flight) >= 2 * workers:
+                    tables, stats = in_flight.popleft().result()
+                    writer.write(tables)
+                    _merge_stats(total, stats)
+            while in_flight:
+                tables, stats = in_flight.popleft().result()
+                writer.write(tables)
+                _merge_stats(total, stats)
+    writer.close()
+    elapsed = time.perf_counter() - start
+    total['seconds'] = elapsed
+    total['lines_per_second'] = total['lines'] / elapsed if elapsed > 0 else 0.0
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk parse modem response logs')
+    parser.add_argument('logs', nargs='+', help='Log files')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Directory (csv) or .npz file (npz)')
+    parser.add_argument('-f', '--format', choices=('csv', 'npz'), default='csv')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Worker processes (default: CPU count)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Chunk size in bytes')
+    parser.add_argument('--command', default=None,
+                        help='Decode every line with this LPGAN_API_Rx decoder')
+    args = parser.parse_args(argv)
+
+    if args.command is not None and not hasattr(LPGAN_API_Rx, args.command):
+        parser.error('unknown command: ' + args.command)
+    if args.format == 'npz':
+        if np is None:
+            parser.error('npz output requires numpy')
+        writer = NpzWriter(args.output)
+    else:
+        writer = CsvWriter(args.output)
+
+    stats = run(args.logs, writer, args.workers, args.chunk_size, args.command)
+    print(f"{stats['lines']:,} lines ({stats['decoded']:,} decoded, {stats['skipped']:,} skipped) "
+          f"in {stats['seconds']:.2f} s: {stats['lines_per_second']:,.0f} lines/s", file=sys.stderr)
+    for code, count in sorted(stats['errors'].items(), key=str):
+        print(f"  error {code}: {count:,}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
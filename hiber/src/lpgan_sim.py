@@ -0,0 +1,514 @@
+'''
+Software stand-in for an LPGAN (Hiber) modem.
+
+SimulatedModem answers every command LPGAN_API_Tx produces in the
+API(code: a; b; c) format.  It can be driven directly, through the
+in-memory SimulatedSerial (a pyserial-like object that can replace
+Hiber._ser), over a Linux pty with PtyModem or over TCP, like a remote
+serial server, with TcpModem.  ArduinoBridge is the reference for the
+framed Arduino passthrough.
+
+Response delay, link throughput (baudrate) and error injection are all
+configurable, so the full Hiber stack can be benchmarked and tested with no
+hardware attached.
+'''
+import os
+import re
+import time
+import random
+import select
+import socket
+import datetime
+import threading
+
+from hiber import ERROR_CODES, ArdFrame, ArdFrameDecoder, ARD_MODEM, ARD_WAKEUP, ARD_PAYLOAD, ARD_RESPONSE
+
+
+_COMMAND_RE = re.compile(r'^(\w+)(?:\((.*)\))?$')
+_ARG_RE = re.compile(r'"([^"]*)"|([^,]+)')
+
+
+class SimulatedModem:
+    '''
+    Command interpreter with modem state.
+
+    Args:
+        delay: Seconds between the end of a command and the start of its
+            response
+        baudrate: Link speed used to pace response bytes (10 bits/byte);
+            None for no pacing
+        error_rate: Probability that a response is replaced by an error
+        error_codes: Codes picked from for random errors
+        seed: Seed for the error injection RNG
+        boot_time: Seconds after creation during which commands are ignored
+        min_command_gap: Commands arriving closer together than this are
+            answered with 125 (buffer overflow)
+    '''
+    def __init__(self, delay=0.0, baudrate=None, error_rate=0.0,
+                 error_codes=("125", "525", "636"), seed=None, boot_time=0.0,
+                 min_command_gap=0.0):
+        self.delay = delay
+        self.boot_time = boot_time
+        self.min_command_gap = min_command_gap
+        self.baudrate = baudrate
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.wakeup_pin = False
+        self.commands = []
+        # Payloads received after set_payload, oldest first
+        self.payloads = []
+
+        self.firmware_version = "cn-release-v1.0.0-1-gd193bbe4"
+        self.hw_type = ("GAMMA", 2)
+        self.fw_version = "1"
+        self.modem_number = "27AA 0DD8"
+        self.gps_enabled = False
+        self.payload_over_debug = False
+        self.payload_bytes = 0
+        self.latitude = 0.0
+        self.longitude = 0.0
+        self.altitude = 0.0
+        self.alarm_id = 3
+        self.alarm_period = 600
+        self.pass_period = 5400
+        self.fix_period = 86400
+
+        self._rng = random.Random(seed)
+        self._forced_errors = []
+        self._epoch = time.monotonic()
+        self._clock = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        self._clock_epoch = self._epoch
+        self._last_fix = self._epoch
+        self._last_command = None
+        self._rx = bytearray()
+        self._payload = bytearray()
+        self._payload_remaining = 0
+
+    def inject_error(self, code, count=1):
+        '''
+        Answer the next `count` commands with error `code`.
+        '''
+        if str(code) not in ERROR_CODES:
+            raise ValueError('Unknown error code')
+        self._forced_errors.extend([str(code)] * count)
+
+    def transfer_time(self, response):
+        '''
+        Seconds the response spends on the link.
+        '''
+        if not self.baudrate:
+            return 0.0
+        return len(response) * 10.0 / self.baudrate
+
+    def now(self):
+        return self._clock + datetime.timedelta(seconds=time.monotonic() - self._clock_epoch)
+
+    def _countdown(self, period):
+        return period - int(time.monotonic() - self._epoch) % period
+
+    def feed(self, data):
+        '''
+        Process raw bytes from the link.
+
+        Splits command lines and hands them to handle().  After an
+        acknowledged set_payload(n) the next n bytes are payload data; they
+        are collected into `payloads` instead.
+
+        Args:
+            data: Bytes as written by the host
+        Returns:
+            List of response lines (str)
+        '''
+        rx = self._rx
+        rx += data
+        responses = []
+        while rx:
+            if self._payload_remaining:
+                chunk = rx[:self._payload_remaining]
+                del rx[:len(chunk)]
+                self._payload += chunk
+                self._payload_remaining -= len(chunk)
+                if not self._payload_remaining:
+                    self.payloads.append(bytes(self._payload))
+                    self._payload.clear()
+                continue
+            end = rx.find(b"\n")
+            if end < 0:
+                break
+            line = rx[:end + 1].decode("ascii", "replace")
+            del rx[:end + 1]
+            response = self.handle(line)
+            if response is not None:
+                responses.append(response)
+        return responses
+
+    def handle(self, line):
+        '''
+        Process one command line.
+
+        Args:
+            line: Command as str, with or without CRLF and Arduino "Modem:"
+                framing
+        Returns:
+            Response line (str, CRLF terminated), or None when the line
+            gets no response (blank lines, Arduino "Wakeup:" commands,
+            anything during boot)
+        '''
+        line = line.strip()
+        if line.startswith("Modem:"):
+            line = line[6:].strip()
+        elif line.startswith("Wakeup:"):
+            self.wakeup_pin = line[7:].strip().lower() in ("1", "true")
+            return None
+        if not line or time.monotonic() - self._epoch < self.boot_time:
+            return None
+        self.commands.append(line)
+
+        now = time.monotonic()
+        last, self._last_command = self._last_command, now
+        if last is not None and now - last < self.min_command_gap:
+            return self._response("125")
+        if self._forced_errors:
+            return self._response(self._forced_errors.pop(0))
+        if self.error_rate and self._rng.random() < self.error_rate:
+            return self._response(self._rng.choice(self.error_codes))
+
+        match = _COMMAND_RE.match(line)
+        if match is None:
+            return self._response("140")
+        name, args = match.groups()
+        args = [] if not args else [q or a.strip() for q, a in _ARG_RE.findall(args)]
+        handler = getattr(self, "_cmd_" + name, None)
+        if handler is None:
+            return self._response("425")
+        try:
+            return handler(*args)
+        except TypeError:
+            return self._response("426")
+        except ValueError:
+            return self._response("625")
+
+    @staticmethod
+    def _response(code, *fields, trailing=""):
+        if fields:
+            return f"API({code}: {'; '.join(str(f) for f in fields)}){trailing}\r\n"
+        return f"API({code}){trailing}\r\n"
+
+    def _location(self):
+        return self._response(
+            "600",
+            f"{self.latitude:0.6f}",
+            f"{self.longitude:0.6f}",
+            int(time.monotonic() - self._last_fix),
+            self._countdown(self.fix_period),
+            f"{self.altitude:0.6f}",
+        )
+
+    def _cmd_set_gps_mode(self, enabled):
+        self.gps_enabled = (enabled == "true")
+        return self._response("600", int(self.gps_enabled))
+
+    def _cmd_do_gps_fix(self, input_string=None):
+        self._last_fix = time.monotonic()
+        return self._response("600")
+
+    def _cmd_get_firmware_version(self):
+        return self._response("600", self.firmware_version)
+
+    def _cmd_get_modem_info(self):
+        number = int(self.modem_number.replace(" ", ""), 16)
+        return self._response(
+            "600", self.hw_type[0], self.hw_type[1], self.fw_version,
+            self.modem_number, number
+        )
+
+    def _cmd_set_modem_number(self, modem_number):
+        if not re.match(r'^[0-9A-Fa-f]{4} [0-9A-Fa-f]{4}$', modem_number):
+            raise ValueError(modem_number)
+        self.modem_number = modem_number.upper()
+        return self._response("600")
+
+    def _cmd_get_location(self):
+        return self._location()
+
+    def _cmd_set_location(self, latitude, longitude, altitude):
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.altitude = float(altitude)
+        self._last_fix = time.monotonic()
+        return self._location()
+
+    def _cmd_get_datetime(self):
+        return self._response("600", self.now().strftime("%Y-%m-%dT%H:%M:%SZ"))
+
+    def _cmd_set_datetime(self, dt):
+        self._clock = datetime.datetime.strptime(dt, "%Y-%m-%dT%H:%M:%SZ")
+        self._clock_epoch = time.monotonic()
+        return self._response("600", dt, trailing=f" Current date: {dt}")
+
+    def _cmd_get_next_alarm(self):
+        return self._response("600", self.alarm_id, self._countdown(self.alarm_period))
+
+    def _cmd_get_next_pass(self):
+        return self._response("600", self._countdown(self.pass_period))
+
+    def _cmd_go_to_sleep(self):
+        seconds = self._countdown(self.alarm_period)
+        if self.wakeup_pin:
+            return self._response("603", seconds, self.alarm_id)
+        if seconds <= 2:
+            return self._response("635", seconds, self.alarm_id)
+        return self._response("602", seconds, self.alarm_id)
+
+    def _cmd_toggle_payload_over_debug(self, is_enabled):
+        self.payload_over_debug = (is_enabled == "true")
+        return self._response("600", int(self.payload_over_debug))
+
+    def _cmd_set_payload(self, payload):
+        self.payload_bytes = int(payload)
+        self._payload_remaining = self.payload_bytes
+        return self._response("600", self.payload_bytes)
+
+
+class SimulatedSerial:
+    '''
+    In-memory pyserial stand-in connected to a SimulatedModem.
+
+    Supports the subset of serial.Serial that Hiber uses: open/close,
+    write, read, readline, in_waiting, timeout and reset_input_buffer.
+    Responses become readable only after the modem delay plus their
+    transfer time, one after another like on a real link.
+    '''
+    def __init__(self, modem=None, port='SIM', timeout=10):
+        self.modem = modem or SimulatedModem()
+        self.port = port
+        self.baudrate = self.modem.baudrate or 19200
+        self.timeout = timeout
+        self.is_open = False
+        self.bytes_written = 0
+        self._scheduled = []
+        self._rx = bytearray()
+        self._link_free_at = 0.0
+        self._cond = threading.Condition()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        now = time.monotonic()
+        with self._cond:
+            self.bytes_written += len(data)
+            for response in self.modem.feed(data):
+                start = max(now + self.modem.delay, self._link_free_at)
+                ready = start + self.modem.transfer_time(response)
+                self._link_free_at = ready
+                self._scheduled.append((ready, response.encode()))
+            self._cond.notify_all()
+        return len(data)
+
+    def _release(self):
+        now = time.monotonic()
+        while self._scheduled and self._scheduled[0][0] <= now:
+            self._rx += self._scheduled.pop(0)[1]
+
+    def _wait(self, ready, deadline):
+        while True:
+            self._release()
+            if ready():
+                return True
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                return False
+            wake = deadline
+            if self._scheduled and (wake is None or self._scheduled[0][0] < wake):
+                wake = self._scheduled[0][0]
+            self._cond.wait(None if wake is None else max(0.0, wake - now))
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        return time.monotonic() + self.timeout
+
+    @property
+    def in_waiting(self):
+        with self._cond:
+            self._release()
+            return len(self._rx)
+
+    def read(self, size=1):
+        with self._cond:
+            self._wait(lambda: len(self._rx) >= size, self._deadline())
+            data = bytes(self._rx[:size])
+            del self._rx[:size]
+            return data
+
+    def readline(self):
+        with self._cond:
+            self._wait(lambda: b"\n" in self._rx, self._deadline())
+            end = self._rx.find(b"\n") + 1 or len(self._rx)
+            data = bytes(self._rx[:end])
+            del self._rx[:end]
+            return data
+
+    def reset_input_buffer(self):
+        with self._cond:
+            self._release()
+            self._rx.clear()
+
+
+class ArduinoBridge:
+    '''
+    Reference Arduino passthrough in framed mode (see hiber.ArdFrame).
+
+    Every complete frame is unpacked: wakeup records set the modem's pin,
+    payload records go to the modem unchanged, modem commands are handled
+    in order and their response lines go back together in one frame.
+    '''
+    def __init__(self, modem=None):
+        self.modem = modem or SimulatedModem()
+        self.decoder = ArdFrameDecoder()
+        self.frames = 0
+
+    def feed(self, data):
+        '''
+        Returns:
+            Response frames (bytes, possibly empty) for the frames completed by `data`
+        '''
+        out = []
+        for records in self.decoder.feed(data):
+            self.frames += 1
+            responses = []
+            for kind, payload in records:
+                if kind == ARD_WAKEUP:
+                    self.modem.wakeup_pin = payload == b"\x01"
+                elif kind == ARD_PAYLOAD:
+                    self.modem.feed(payload)
+                elif kind == ARD_MODEM:
+                    response = self.modem.handle(payload.decode())
+                    if response is not None:
+                        responses.append((ARD_RESPONSE, response.rstrip("\r\n").encode()))
+            if responses:
+                out.append(ArdFrame.encode(responses))
+        return b"".join(out)
+
+
+class PtyModem:
+    '''
+    SimulatedModem served on the master side of a Linux pty.
+
+    Open `port` (the slave device path) with serial.Serial to talk to it.
+    With framed=True it talks the framed Arduino passthrough protocol
+    through an ArduinoBridge.
+    '''
+    def __init__(self, modem=None, framed=False):
+        import tty
+
+        self.modem = modem or SimulatedModem()
+        self.bridge = ArduinoBridge(self.modem) if framed else None
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._running = threading.Event()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+
+    def start(self):
+        self._running.set()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _serve(self):
+        while self._running.is_set():
+            readable, _, _ = select.select([self._master], [], [], 0.05)
+            if not readable:
+                continue
+            data = os.read(self._master, 4096)
+            if self.bridge is not None:
+                response = self.bridge.feed(data)
+                if response:
+                    time.sleep(self.modem.delay + self.modem.transfer_time(response))
+                    os.write(self._master, response)
+                continue
+            for response in self.modem.feed(data):
+                time.sleep(self.modem.delay + self.modem.transfer_time(response))
+                os.write(self._master, response.encode())
+
+
+class TcpModem:
+    '''
+    SimulatedModem behind a local TCP serial server.
+
+    `port` is the "socket://127.0.0.1:N" URL to hand to Hiber.  Every client
+    talks to the same modem; `connections` counts accepted connections.
+    '''
+    def __init__(self, modem=None, host='127.0.0.1'):
+        self.modem = modem or SimulatedModem()
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, 0))
+        self._server.listen()
+        self.port = 'socket://%s:%d' % self._server.getsockname()
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._running = threading.Event()
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._clients = []
+
+    def start(self):
+        self._running.set()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running.clear()
+        self._thread.join()
+        self._server.close()
+        for thread in self._clients:
+            thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _accept(self):
+        while self._running.is_set():
+            readable, _, _ = select.select([self._server], [], [], 0.05)
+            if not readable:
+                continue
+            conn, _ = self._server.accept()
+            self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(conn,), daemon=True)
+            self._clients.append(thread)
+            thread.start()
+
+    def _serve(self, conn):
+        with conn:
+            while self._running.is_set():
+                readable, _, _ = select.select([conn], [], [], 0.05)
+                if not readable:
+                    continue
+                data = conn.recv(4096)
+                if not data:
+                    return
+                # One modem behind the server: input is handled in turn
+                with self._lock:
+                    responses = self.modem.feed(data)
+                for response in responses:
+                    time.sleep(self.modem.delay + self.modem.transfer_time(response))
+                    conn.sendall(response.encode())
@@ -0,0 +1,278 @@
+'''
+Per-command instrumentation for the Hiber command path.
+
+CommandMetrics keeps, per LPGAN command, latency histograms for
+write -> first response byte and write -> full response line, response,
+timeout and error-code counters, plus bytes written to and read from the
+link.  Hiber only touches it when metrics are enabled (one `is None`
+check per command otherwise).  Snapshots export as JSON or Prometheus text.
+'''
+import json
+import time
+import threading
+from bisect import bisect_left
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    '''
+    Fixed-bucket histogram; counts[i] holds observations <= bounds[i]
+    (and > bounds[i - 1]), the last slot everything above.
+    '''
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''
+        [(upper bound, cumulative count), ...] ending with (inf, count).
+        '''
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def as_dict(self):
+        return {
+            'buckets': list(self.bounds),
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class _CommandStats:
+    __slots__ = ('first_byte', 'full_line', 'responses', 'timeouts', 'errors')
+
+    def __init__(self, bounds):
+        self.first_byte = Histogram(bounds)
+        self.full_line = Histogram(bounds)
+        self.responses = 0
+        self.timeouts = 0
+        self.errors = {}
+
+
+def response_code(line):
+    '''
+    Status code of an API(...) line without a full parse, or None.
+    '''
+    if line[:4] in ('API(', b'API('):
+        digits = line[4:7]
+        if digits.isdigit():
+            return int(digits)
+    return None
+
+
+class CommandMetrics:
+    '''
+    Args:
+        buckets: Histogram upper bounds in seconds
+        clock: Monotonic clock
+    '''
+    def __init__(self, buckets=DEFAULT_BUCKETS, clock=time.perf_counter):
+        self.buckets = tuple(buckets)
+        self.clock = clock
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # Set by MeteredLink: time of the last write and of the first byte
+        # read after it
+        self.last_write = None
+        self.first_byte = None
+        self._lock = threading.Lock()
+        self._commands = {}
+
+    def wrap(self, link):
+        '''
+        MeteredLink around `link` that reports to these metrics.
+        '''
+        return MeteredLink(link, self)
+
+    def observe(self, name, sent, line, first_byte=None, done=None):
+        '''
+        Record one command/response exchange.
+
+        Args:
+            name: LPGAN command name
+            sent: Clock time the command was written
+            line: Response line ('' or b'' on timeout)
+            first_byte: Clock time of the first response byte (if known)
+            done: Clock time the full line was read (default now)
+        '''
+        if done is None:
+            done = self.clock()
+        with self._lock:
+            stats = self._commands.get(name)
+            if stats is None:
+                stats = self._commands[name] = _CommandStats(self.buckets)
+            if not line:
+                stats.timeouts += 1
+                return
+            stats.responses += 1
+            stats.full_line.observe(done - sent)
+            if first_byte is not None and sent <= first_byte <= done:
+                stats.first_byte.observe(first_byte - sent)
+            code = response_code(line)
+            if code is not None and code != 600 and code != 602:
+                stats.errors[code] = stats.errors.get(code, 0) + 1
+
+    def snapshot(self):
+        '''
+        Plain dict of all counters (JSON serialisable).
+        '''
+        with self._lock:
+            commands = {
+                name: {
+                    'responses': stats.responses,
+                    'timeouts': stats.timeouts,
+                    'errors': {str(code): n for code, n in sorted(stats.errors.items())},
+                    'first_byte_seconds': stats.first_byte.as_dict(),
+                    'full_line_seconds': stats.full_line.as_dict(),
+                }
+                for name, stats in sorted(self._commands.items())
+            }
+        return {'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out, 'commands': commands}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def to_prometheus(self, prefix='hiber'):
+        '''
+        Snapshot in the Prometheus text exposition format.
+        '''
+        lines = []
+
+        def header(name, kind, text):
+            lines.append('# HELP %s_%s %s' % (prefix, name, text))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+
+        header('bytes_out_total', 'counter', 'Bytes written to the modem link.')
+        lines.append('%s_bytes_out_total %d' % (prefix, self.bytes_out))
+        header('bytes_in_total', 'counter', 'Bytes read from the modem link.')
+        lines.append('%s_bytes_in_total %d' % (prefix, self.bytes_in))
+
+        with self._lock:
+            commands = sorted(self._commands.items())
+            header('command_responses_total', 'counter', 'Responses received per command.')
+            for name, stats in commands:
+                lines.append('%s_command_responses_total{command="%s"} %d' % (prefix, name, stats.responses))
+            header('command_timeouts_total', 'counter', 'Commands that got no response in time.')
+            for name, stats in commands:
+                lines.append('%s_command_timeouts_total{command="%s"} %d' % (prefix, name, stats.timeouts))
+            header('command_errors_total', 'counter', 'Error responses per command and code.')
+            for name, stats in commands:
+                for code, n in sorted(stats.errors.items()):
+                    lines.append('%s_command_errors_total{command="%s",code="%d"} %d' % (prefix, name, code, n))
+            header('command_latency_seconds', 'histogram',
+                   'Time from command write to first byte / full response line.')
+            for name, stats in commands:
+                for phase, hist in (('first_byte', stats.first_byte), ('full_line', stats.full_line)):
+                    labels = 'command="%s",phase="%s"' % (name, phase)
+                    for bound, count in hist.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append('%s_command_latency_seconds_bucket{%s,le="%s"} %d' % (prefix, labels, le, count))
+                    lines.append('%s_command_latency_seconds_sum{%s} %r' % (prefix, labels, hist.sum))
+                    lines.append('%s_command_latency_seconds_count{%s} %d' % (prefix, labels, hist.count))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._commands.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.last_write = None
+            self.first_byte = None
+
+
+class MeteredLink:
+    '''
+    Transport adapter counting bytes and timing the first response byte.
+
+    readline() reads the first byte on its own so its arrival time is
+    known, then the rest of the line within what is left of the link's
+    timeout.
+
+    Args:
+        link: Underlying transport
+        metrics: CommandMetrics
+    '''
+    def __init__(self, link, metrics):
+        self.link = link
+        self.metrics = metrics
+
+    @property
+    def port(self):
+        return self.link.port
+
+    @property
+    def timeout(self):
+        return self.link.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.link.timeout = value
+
+    @property
+    def is_open(self):
+        return self.link.is_open
+
+    @property
+    def in_waiting(self):
+        return self.link.in_waiting
+
+    def open(self):
+        self.link.open()
+
+    def close(self):
+        self.link.close()
+
+    def write(self, data):
+        metrics = self.metrics
+        metrics.first_byte = None
+        metrics.last_write = metrics.clock()
+        n = self.link.write(data)
+        metrics.bytes_out += len(data)
+        return n
+
+    def read(self, size=1):
+        data = self.link.read(size)
+        if data:
+            metrics = self.metrics
+            if metrics.first_byte is None:
+                metrics.first_byte = metrics.clock()
+            metrics.bytes_in += len(data)
+        return data
+
+    def readline(self):
+        link = self.link
+        timeout = link.timeout
+        start = time.monotonic()
+        first = self.read(1)
+        if not first or first == b"\n":
+            return first
+        if not timeout:
+            rest = link.readline()
+        else:
+            # The whole line gets one timeout, not one per read
+            link.timeout = max(0.0, timeout - (time.monotonic() - start))
+            try:
+                rest = link.readline()
+            finally:
+                link.timeout = timeout
+        self.metrics.bytes_in += len(rest)
+        return first + rest
+
+    def reset_input_buffer(self):
+        self.link.reset_input_buffer()
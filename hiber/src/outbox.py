@@ -0,0 +1,248 @@
+'''
+Store-and-forward payload outbox.
+
+Messages are kept in SQLite until the modem has acknowledged them, so data
+produced between satellite passes survives restarts.  Each message has a
+priority and a deduplication key.  PassScheduler asks the modem for the
+next pass, sleeps until just before it, and fills the pass's transmit
+budget with the highest-priority pending messages.
+'''
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+
+log = logging.getLogger(__name__)
+
+Message = namedtuple('Message', ['id', 'priority', 'created', 'payload', 'attempts'])
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key BLOB NOT NULL UNIQUE,
+    priority INTEGER NOT NULL,
+    created REAL NOT NULL,
+    payload BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    acked REAL,
+    ack_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS pending_order ON messages (priority DESC, created, id)
+    WHERE acked IS NULL;
+'''
+
+
+class Outbox:
+    '''
+    Durable, prioritised, deduplicated payload queue.
+
+    Args:
+        path: SQLite database file (':memory:' for a throwaway outbox)
+        clock: Wall clock for created/acked times
+    '''
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_SCHEMA)
+
+    def put(self, payload, priority=0, key=None):
+        '''
+        Queue a payload.
+
+        Args:
+            payload: Payload bytes
+            priority: Higher is sent first
+            key: Deduplication key (default: SHA-256 of the payload)
+        Returns:
+            Message id, or None if a message with the same key exists
+        '''
+        payload = bytes(payload)
+        if not payload:
+            raise ValueError("payload must not be empty")
+        if key is None:
+            key = hashlib.sha256(payload).digest()
+        elif isinstance(key, str):
+            key = key.encode()
+        with self._lock:
+            cursor = self._db.execute(
+                'INSERT OR IGNORE INTO messages (dedup_key, priority, created, payload, size) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, priority, self._clock(), payload, len(payload)),
+            )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def pending(self, limit=-1):
+        '''
+        Unacknowledged messages, highest priority (then oldest) first.
+        '''
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, priority, created, payload, attempts FROM messages '
+                'WHERE acked IS NULL ORDER BY priority DESC, created, id LIMIT ?',
+                (limit,),
+            ).fetchall()
+        return [Message(*row) for row in rows]
+
+    def select(self, budget, max_attempts=None):
+        '''
+        Fill a transmit budget greedily in priority order.
+
+        Messages that do not fit in what is left of the budget are
+        skipped, so smaller lower-priority messages can still use it.
+
+        Args:
+            budget: Bytes available in the pass
+            max_attempts: Skip messages that failed this many times
+        Returns:
+            List of Message
+        '''
+        chosen = []
+        left = budget
+        with self._lock:
+            rows = self._db.execute(
+                'SELECT id, priority, created, size, attempts FROM messages '
+                'WHERE acked IS NULL AND size <= ? ORDER BY priority DESC, created, id',
+                (budget,),
+            )
+            ids = []
+            for id_, priority, created, size, attempts in rows:
+                if size > left or (max_attempts is not None and attempts >= max_attempts):
+                    continue
+                ids.append(id_)
+                left -= size
+                if not left:
+                    break
+            for id_ in ids:
+                chosen.append(Message(*self._db.execute(
+                    'SELECT id, priority, created, payload, attempts FROM messages WHERE id = ?',
+                    (id_,),
+                ).fetchone()))
+        return chosen
+
+    def ack(self, message_id, ack_bytes):
+        '''
+        Record the modem's acknowledgement of a message.
+        '''
+        with self._lock:
+            self._db.execute(
+                'UPDATE messages SET acked = ?, ack_bytes = ? WHERE id = ?',
+                (self._clock(), ack_bytes, message_id),
+            )
+
+    def fail(self, message_id):
+        '''
+        Count a failed attempt; the message stays pending.
+        '''
+        with self._lock:
+            self._db.execute('UPDATE messages SET attempts = attempts + 1 WHERE id = ?', (message_id,))
+
+    def acked(self, message_id):
+        '''
+        (acked time, ack_bytes) of a message, or None while pending.
+        '''
+        with self._lock:
+            row = self._db.execute(
+                'SELECT acked, ack_bytes FROM messages WHERE id = ? AND acked IS NOT NULL',
+                (message_id,),
+            ).fetchone()
+        return row
+
+    def prune(self, before):
+        '''
+        Delete messages acknowledged before `before` (their keys stop
+        deduplicating).  Returns the number deleted.
+        '''
+        with self._lock:
+            return self._db.execute('DELETE FROM messages WHERE acked < ?', (before,)).rowcount
+
+    def stats(self):
+        with self._lock:
+            pending, pending_bytes = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM messages WHERE acked IS NULL'
+            ).fetchone()
+            acked, = self._db.execute('SELECT COUNT(*) FROM messages WHERE acked IS NOT NULL').fetchone()
+        return {'pending': pending, 'pending_bytes': pending_bytes, 'acked': acked}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class PassScheduler:
+    '''
+    Sends outbox messages around satellite passes.
+
+    Args:
+        hiber: Hiber used for get_next_pass, set_payload and go_to_sleep
+        outbox: Outbox
+        budget: Bytes to hand to the modem per pass
+        lead_time: Seconds before the pass to wake up and load payloads
+        max_attempts: Give up on a message after this many failures
+        wakeup_pin: Drive the Arduino wakeup pin around each upload
+            (payloads behind an Arduino need Hiber(arduino='framed'))
+        sleep: Sleep function (seconds)
+    '''
+    def __init__(self, hiber, outbox, budget, lead_time=60.0, max_attempts=5,
+                 wakeup_pin=False, sleep=time.sleep):
+        self.hiber = hiber
+        self.outbox = outbox
+        self.budget = budget
+        self.lead_time = lead_time
+        self.max_attempts = max_attempts
+        self.wakeup_pin = wakeup_pin
+        self._sleep = sleep
+
+    def seconds_until_wakeup(self):
+        '''
+        Seconds until payloads should be loaded for the next pass.
+        '''
+        seconds = self.hiber.get_next_pass(refresh=True).seconds_left_until_pass
+        return max(0.0, seconds - self.lead_time)
+
+    def run_pass(self):
+        '''
+        Load the highest-value pending messages that fit the budget.
+
+        Returns:
+            List of acknowledged message ids
+        '''
+        messages = self.outbox.select(self.budget, self.max_attempts)
+        if not messages:
+            return []
+        sent = []
+        if self.wakeup_pin:
+            self.hiber.ard_wakeup(True)
+        try:
+            for message in messages:
+                try:
+                    ack = self.hiber.set_payload(message.payload)
+                except ValueError as e:
+                    log.warning("payload %d not accepted: %s", message.id, e)
+                    self.outbox.fail(message.id)
+                    continue
+                self.outbox.ack(message.id, ack.payload_bytes)
+                sent.append(message.id)
+        finally:
+            if self.wakeup_pin:
+                self.hiber.ard_wakeup(False)
+        try:
+            self.hiber.go_to_sleep()
+        except Warning as e:
+            log.info("modem stays awake: %s", e)
+        return sent
+
+    def run_once(self):
+        '''
+        Wait for the next pass window, then run_pass().
+        '''
+        delay = self.seconds_until_wakeup()
+        if delay > 0:
+            self._sleep(delay)
+        return self.run_pass()
@@ -0,0 +1,127 @@
+'''
+Adaptive write pacing for the Hiber command path.
+
+The modem (and the Arduino passthrough in front of it) answers 125/525
+(buffer overflow) when commands arrive faster than it can take them.
+WritePacer keeps a per-link gap between command writes and adapts it
+AIMD-style: every clean response shrinks the gap by a fixed step, every
+overflow doubles it.  Commands that failed with a transient code are retried
+with bounded exponential backoff.
+'''
+import time
+from collections import deque
+
+
+TRANSIENT_CODES = ("125", "525")
+# Response prefixes of the transient codes, so callers can check a line
+# without a full parse
+TRANSIENT_PREFIXES = tuple("API(" + code for code in TRANSIENT_CODES)
+
+
+class WritePacer:
+    '''
+    Args:
+        min_gap: Smallest gap between command writes (seconds)
+        max_gap: Largest gap the pacer backs off to (seconds)
+        step: Additive gap decrease per clean response (seconds)
+        initial_gap: Starting gap (default min_gap)
+        max_retries: Retries per command for transient errors
+        backoff: First retry delay (seconds), doubled per retry
+        max_backoff: Cap on the retry delay (seconds)
+        rate_window: Seconds of writes the throughput rate covers
+    '''
+    def __init__(self, min_gap=0.0, max_gap=1.0, step=0.005, initial_gap=None,
+                 max_retries=3, backoff=0.05, max_backoff=1.0, rate_window=1.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.min_gap = min_gap
+        self.max_gap = max_gap
+        self.step = step
+        self.gap = min_gap if initial_gap is None else initial_gap
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.overflows = 0
+        self.retries = 0
+        self.bytes_written = 0
+        self.rate_window = rate_window
+        self._clock = clock
+        self._sleep = sleep
+        self._last_write = None
+        self._first_write = None
+        # (time, bytes) of the writes within rate_window, and their sum
+        self._recent = deque()
+        self._recent_bytes = 0
+
+    @staticmethod
+    def is_transient(line):
+        '''
+        True if the response line carries a transient (overflow) code.
+        '''
+        return line.startswith(TRANSIENT_PREFIXES)
+
+    def wait(self):
+        '''
+        Sleep until the current gap since the last write has passed.
+        '''
+        if self._last_write is None:
+            return
+        delay = self._last_write + self.gap - self._clock()
+        if delay > 0:
+            self._sleep(delay)
+
+    def on_write(self, nbytes):
+        now = self._clock()
+        if self._first_write is None:
+            self._first_write = now
+        self._last_write = now
+        self.bytes_written += nbytes
+        self._recent.append((now, nbytes))
+        self._recent_bytes += nbytes
+        self._expire(now)
+
+    def _expire(self, now):
+        recent = self._recent
+        start = now - self.rate_window
+        while recent and recent[0][0] < start:
+            self._recent_bytes -= recent.popleft()[1]
+
+    @property
+    def throughput(self):
+        '''
+        Bytes per second written over the last rate_window seconds.
+        '''
+        if self._first_write is None:
+            return 0.0
+        now = self._clock()
+        self._expire(now)
+        span = min(self.rate_window, now - self._first_write)
+        if span <= 0:
+            return 0.0
+        return self._recent_bytes / span
+
+    def on_success(self):
+        self.gap = max(self.min_gap, self.gap - self.step)
+
+    def on_overflow(self):
+        self.overflows += 1
+        self.gap = min(self.max_gap, max(self.gap * 2, self.step))
+
+    def retry_delay(self, attempt):
+        '''
+        Backoff before retry number `attempt` (0 based).
+        '''
+        return min(self.max_backoff, self.backoff * (2 ** attempt))
+
+    def before_retry(self, attempt):
+        self.retries += 1
+        self._sleep(self.retry_delay(attempt))
+
+    def stats(self):
+        return {
+            'gap': self.gap,
+            'overflows': self.overflows,
+            'retries': self.retries,
+            'bytes_written': self.bytes_written,
+            'throughput': self.throughput,
+        }
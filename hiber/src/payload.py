@@ -0,0 +1,287 @@
+'''
+Compact binary payloads for set_payload.
+
+A Schema lists the fields of a reading.  A single reading is bit-packed:
+each field takes exactly its width, with floats stored as fixed-point
+integers.  A series of readings is stored column by column as zigzag
+varint deltas of the same integers, which is small for slowly changing
+sensor data and compresses well; the body can also be deflated.
+
+Payload layout:
+    kind (u8) | schema id (u8) | body
+kind is KIND_RECORD or KIND_SERIES, or'ed with COMPRESSED when the body is
+raw deflate.  The ground side decodes with Schema.decode or, for several
+schemas, PayloadDecoder.
+'''
+import zlib
+
+
+KIND_RECORD = 0x01
+KIND_SERIES = 0x02
+COMPRESSED = 0x80
+
+
+def zigzag(value):
+    return -2 * value - 1 if value < 0 else 2 * value
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def write_varint(out, value):
+    '''
+    Append unsigned LEB128 `value` to bytearray `out`.
+    '''
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    '''
+    Returns:
+        (value, next offset)
+    '''
+    value = shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("truncated varint")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+class UInt:
+    '''
+    Unsigned integer of `bits` bits.
+    '''
+    def __init__(self, name, bits):
+        self.name = name
+        self.bits = bits
+        self._max = (1 << bits) - 1
+
+    def encode(self, value):
+        value = int(value)
+        if not 0 <= value <= self._max:
+            raise ValueError("%s out of range: %r" % (self.name, value))
+        return value
+
+    def decode(self, code):
+        return code
+
+
+class Int(UInt):
+    '''
+    Signed integer of `bits` bits (stored with an offset).
+    '''
+    def __init__(self, name, bits):
+        super().__init__(name, bits)
+        self._offset = 1 << (bits - 1)
+
+    def encode(self, value):
+        return super().encode(int(value) + self._offset)
+
+    def decode(self, code):
+        return code - self._offset
+
+
+class Bool(UInt):
+    def __init__(self, name):
+        super().__init__(name, 1)
+
+    def encode(self, value):
+        return 1 if value else 0
+
+    def decode(self, code):
+        return bool(code)
+
+
+class Fixed(UInt):
+    '''
+    Float in [lo, hi] stored as a multiple of `resolution`.
+
+    None and NaN are stored as the all-ones code and decode to None.
+
+    Args:
+        name: Field name
+        lo, hi: Value range
+        resolution: Step between representable values
+    '''
+    def __init__(self, name, lo, hi, resolution):
+        steps = int(round((hi - lo) / resolution))
+        super().__init__(name, (steps + 1).bit_length())
+        self.lo = lo
+        self.hi = hi
+        self.resolution = resolution
+
+    def encode(self, value):
+        if value is None or value != value:
+            return self._max
+        if not self.lo <= value <= self.hi:
+            raise ValueError("%s out of range: %r" % (self.name, value))
+        return int(round((value - self.lo) / self.resolution))
+
+    def decode(self, code):
+        if code == self._max:
+            return None
+        return round(self.lo + code * self.resolution, 10)
+
+
+class Schema:
+    '''
+    Ordered fields of one reading.
+
+    Readings are dicts or response records (anything with record['field']).
+
+    Args:
+        fields: Field objects (UInt, Int, Bool, Fixed)
+        schema_id: Identifies the schema in the payload header (0-255)
+    '''
+    def __init__(self, fields, schema_id=0):
+        self.fields = tuple(fields)
+        self.schema_id = schema_id
+        self.bits = sum(field.bits for field in self.fields)
+
+    def _codes(self, reading):
+        return [field.encode(reading[field.name]) for field in self.fields]
+
+    def pack(self, reading):
+        '''
+        One bit-packed reading.
+        '''
+        acc = 0
+        for field, code in zip(self.fields, self._codes(reading)):
+            acc = (acc << field.bits) | code
+        nbytes = (self.bits + 7) // 8
+        acc <<= nbytes * 8 - self.bits
+        return bytes((KIND_RECORD, self.schema_id)) + acc.to_bytes(nbytes, 'big')
+
+    def _unpack_record(self, body):
+        nbytes = (self.bits + 7) // 8
+        if len(body) != nbytes:
+            raise ValueError("record body must be %d bytes" % nbytes)
+        acc = int.from_bytes(body, 'big') >> (nbytes * 8 - self.bits)
+        values = {}
+        for field in reversed(self.fields):
+            values[field.name] = field.decode(acc & field._max)
+            acc >>= field.bits
+        return {field.name: values[field.name] for field in self.fields}
+
+    def pack_series(self, readings, compress=False):
+        '''
+        Several readings as per-field delta/varint columns.
+
+        Args:
+            readings: Sequence of readings, oldest first
+            compress: Deflate the body when that makes it smaller
+        '''
+        rows = [self._codes(reading) for reading in readings]
+        body = bytearray()
+        write_varint(body, len(rows))
+        for column in range(len(self.fields)):
+            previous = 0
+            for row in rows:
+                code = row[column]
+                write_varint(body, zigzag(code - previous))
+                previous = code
+        kind = KIND_SERIES
+        if compress:
+            deflate = zlib.compressobj(9, zlib.DEFLATED, -15)
+            packed = deflate.compress(bytes(body)) + deflate.flush()
+            if len(packed) < len(body):
+                body = packed
+                kind |= COMPRESSED
+        return bytes((kind, self.schema_id)) + bytes(body)
+
+    def _unpack_series(self, body):
+        count, offset = read_varint(body, 0)
+        columns = []
+        for field in self.fields:
+            codes = []
+            previous = 0
+            for _ in range(count):
+                delta, offset = read_varint(body, offset)
+                previous += unzigzag(delta)
+                codes.append(previous)
+            columns.append([field.decode(code) for code in codes])
+        if offset != len(body):
+            raise ValueError("trailing bytes in series")
+        names = [field.name for field in self.fields]
+        return [dict(zip(names, values)) for values in zip(*columns)]
+
+    def pack_fit(self, readings, budget, compress=True):
+        '''
+        Pack as many of the oldest readings as fit in `budget` bytes.
+
+        Returns:
+            (payload, number of readings packed); (b'', 0) if none fit
+        '''
+        best = (b'', 0)
+        lo, hi = 1, len(readings)
+        while lo <= hi:
+            mid = (lo + hi) // 2
+            payload = self.pack_series(readings[:mid], compress)
+            if len(payload) <= budget:
+                best = (payload, mid)
+                lo = mid + 1
+            else:
+                hi = mid - 1
+        return best
+
+    def decode(self, payload):
+        '''
+        Ground-side decoder.
+
+        Returns:
+            dict for a single reading, list of dicts for a series
+        '''
+        if len(payload) < 2:
+            raise ValueError("payload too short")
+        kind, schema_id = payload[0], payload[1]
+        if schema_id != self.schema_id:
+            raise ValueError("payload is for schema %d" % schema_id)
+        body = bytes(payload[2:])
+        if kind & COMPRESSED:
+            try:
+                body = zlib.decompress(body, -15)
+            except zlib.error as e:
+                raise ValueError("corrupt compressed body: %s" % e) from None
+            kind &= ~COMPRESSED
+        if kind == KIND_RECORD:
+            return self._unpack_record(body)
+        if kind == KIND_SERIES:
+            return self._unpack_series(body)
+        raise ValueError("unknown payload kind %d" % kind)
+
+
+class PayloadDecoder:
+    '''
+    Decodes payloads of several schemas by their schema id.
+    '''
+    def __init__(self, schemas):
+        self.schemas = {schema.schema_id: schema for schema in schemas}
+
+    def decode(self, payload):
+        '''
+        Returns:
+            (schema, decoded reading or readings)
+        '''
+        if len(payload) < 2:
+            raise ValueError("payload too short")
+        schema = self.schemas.get(payload[1])
+        if schema is None:
+            raise ValueError("unknown schema %d" % payload[1])
+        return schema, schema.decode(payload)
+
+
+# Location as reported by get_location, to about 1 m horizontally
+LOCATION_SCHEMA = Schema([
+    Fixed('latitude', -90.0, 90.0, 1e-5),
+    Fixed('longitude', -180.0, 180.0, 1e-5),
+    Fixed('altitude', -1000.0, 15000.0, 0.5),
+], schema_id=1)
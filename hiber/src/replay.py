@@ -0,0 +1,164 @@
+'''
+Offline replay of Hiber traffic captures.
+
+replay() streams a capture (see capture.py) through the LPGAN_API_Rx
+decoders: command names are taken from the Tx side and matched in order
+with the API(...) response lines on the Rx side, the same way
+Hiber.pipeline pairs them.  ReplayTransport instead feeds the captured
+responses back to a live Hiber, so an incident can be rerun through the
+full command path.
+'''
+import re
+from collections import namedtuple, deque
+
+from hiber import LPGAN_API_Rx, ArdFrameDecoder, ARD_MODEM, ARD_RESPONSE
+from capture import TX, FLAG_FRAMED, read_header, iter_records
+
+
+ReplayEvent = namedtuple('ReplayEvent', ['timestamp', 'command', 'line', 'result', 'error'])
+
+_COMMAND_NAME_RE = re.compile(rb'^\s*(?:Modem:)?\s*(\w+)')
+
+
+def command_name(line):
+    '''
+    LPGAN command name of an encoded command line, or None.
+    '''
+    match = _COMMAND_NAME_RE.match(line)
+    if match is None:
+        return None
+    name = match.group(1).decode()
+    if not hasattr(LPGAN_API_Rx, name) or name.startswith('parse'):
+        return None
+    return name
+
+
+class _Lines:
+    '''
+    Splits one direction of a capture into lines, decoding frames first
+    for captures of the framed Arduino passthrough.
+    '''
+    def __init__(self, framed, kind):
+        self._decoder = ArdFrameDecoder() if framed else None
+        self._kind = kind
+        self._buf = bytearray()
+
+    def feed(self, data):
+        if self._decoder is not None:
+            return [line for records in self._decoder.feed(data)
+                    for kind, line in records if kind == self._kind]
+        buf = self._buf
+        buf += data
+        end = buf.rfind(b"\n")
+        if end < 0:
+            return []
+        lines = buf[:end].split(b"\n")
+        del buf[:end + 1]
+        return [bytes(line.rstrip(b"\r")) for line in lines]
+
+
+def _decode(timestamp, name, line):
+    text = line.decode('ascii', 'replace')
+    decoder = getattr(LPGAN_API_Rx, name) if name is not None else LPGAN_API_Rx.parse
+    try:
+        return ReplayEvent(timestamp, name, text, decoder(text), None)
+    except (ValueError, IndexError) as e:
+        return ReplayEvent(timestamp, name, text, None, e)
+
+
+def replay(path):
+    '''
+    Decode a capture file, lazily.
+
+    Args:
+        path: Capture file written by TrafficCapture
+    Yields:
+        ReplayEvent(timestamp, command, line, result, error) for every Rx
+        line.  API(...) lines get the command they answered (None if no
+        command was pending) and its decoded record, or the decoder
+        exception in `error`.  Other lines (notifications, debug text)
+        have command, result and error set to None.
+    '''
+    framed = bool(read_header(path).flags & FLAG_FRAMED)
+    tx = _Lines(framed, ARD_MODEM)
+    rx = _Lines(framed, ARD_RESPONSE)
+    pending = deque()
+    # Most command lines repeat verbatim; remember their names
+    names = {}
+    for timestamp, direction, data in iter_records(path):
+        if direction == TX:
+            for line in tx.feed(data):
+                try:
+                    name = names[line]
+                except KeyError:
+                    if len(names) >= 4096:
+                        names.clear()
+                    name = names[line] = command_name(line)
+                if name is not None:
+                    pending.append(name)
+            continue
+        for line in rx.feed(data):
+            if not line:
+                continue
+            if line.startswith(b"API("):
+                yield _decode(timestamp, pending.popleft() if pending else None, line)
+            else:
+                yield ReplayEvent(timestamp, None, line.decode('ascii', 'replace'), None, None)
+
+
+class ReplayTransport:
+    '''
+    pyserial-like link that answers with the Rx bytes of a capture.
+
+    Each write() releases the Rx data captured between the matching Tx
+    record and the next one; reads never block.  Use it in place of
+    Hiber._ser (or pass it as the port) to rerun an incident.
+
+    Args:
+        path: Capture file written by TrafficCapture (unframed)
+    '''
+    def __init__(self, path, port='REPLAY', timeout=0):
+        self.port = port
+        self.timeout = timeout
+        self.is_open = False
+        self.written = []
+        self._segments = deque()
+        self._buf = bytearray()
+        segment = self._buf
+        for _, direction, data in iter_records(path):
+            if direction == TX:
+                segment = bytearray()
+                self._segments.append(segment)
+            else:
+                segment += data
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        self.written.append(bytes(data))
+        if self._segments:
+            self._buf += self._segments.popleft()
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self._buf)
+
+    def read(self, size=1):
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def readline(self):
+        end = self._buf.find(b"\n")
+        end = len(self._buf) if end < 0 else end + 1
+        line = bytes(self._buf[:end])
+        del self._buf[:end]
+        return line
+
+    def reset_input_buffer(self):
+        self._buf.clear()
@@ -0,0 +1,90 @@
+'''
+Thread-safe, single-flight front end for a shared Hiber.
+
+Identical read-only queries issued while one is already on the wire are
+merged: every caller waits on the same serial transaction and gets the same
+decoded result.  All serial I/O, including mutating commands such as
+set_location, runs one transaction at a time.
+'''
+import threading
+from concurrent.futures import Future
+
+
+class SharedHiber:
+    '''
+    Args:
+        hiber: Hiber instance to share between threads
+    '''
+    def __init__(self, hiber):
+        self.hiber = hiber
+        self.coalesced = 0
+        self.transactions = 0
+        self._io_lock = threading.Lock()
+        self._flights_lock = threading.Lock()
+        self._flights = {}
+
+    def _transaction(self, func, *args):
+        with self._io_lock:
+            self.transactions += 1
+            return func(*args)
+
+    def _single_flight(self, key, func, *args):
+        with self._flights_lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._flights[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = self._transaction(func, *args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+
+    # Queries: concurrent identical calls share one transaction
+    def get_location(self):
+        return self._single_flight('get_location', self.hiber.get_location)
+
+    def get_next_pass(self):
+        return self._single_flight('get_next_pass', self.hiber.get_next_pass)
+
+    def get_next_alarm(self):
+        return self._single_flight('get_next_alarm', self.hiber.get_next_alarm)
+
+    def get_datetime(self):
+        return self._single_flight('get_datetime', self.hiber._command, 'get_datetime')
+
+    def get_firmware_version(self):
+        return self._single_flight(
+            'get_firmware_version', self.hiber._command, 'get_firmware_version'
+        )
+
+    def get_modem_info(self):
+        return self._single_flight('get_modem_info', self.hiber._command, 'get_modem_info')
+
+    # Mutating commands: strictly serialized, never merged
+    def set_location(self, latitude, longitude, altitude):
+        return self._transaction(self.hiber.set_location, latitude, longitude, altitude)
+
+    def set_datetime(self, dt):
+        return self._transaction(self.hiber.set_datetime, dt)
+
+    def go_to_sleep(self):
+        return self._transaction(self.hiber.go_to_sleep)
+
+    def command(self, name, *args):
+        '''
+        Any other LPGAN command, serialized with everything else.
+        '''
+        return self._transaction(self.hiber._command, name, *args)
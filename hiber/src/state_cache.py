@@ -0,0 +1,104 @@
+'''
+TTL cache for countdown-style modem queries.
+
+get_next_pass, get_next_alarm and get_location answer with countdowns or
+counters, so a recent answer can be extrapolated with a monotonic clock
+instead of asking the modem again.
+'''
+import time
+
+
+DEFAULT_TTL = {
+    'get_next_pass': 60.0,
+    'get_next_alarm': 60.0,
+    'get_location': 30.0,
+}
+
+NO_FIX = -2147483648
+
+
+def _next_pass(record, elapsed):
+    seconds = record.seconds_left_until_pass - elapsed
+    if seconds <= 0:
+        return None
+    return record._replace(seconds_left_until_pass=seconds)
+
+
+def _next_alarm(record, elapsed):
+    seconds = record.seconds_left_until_alarm - elapsed
+    if seconds <= 0:
+        return None
+    return record._replace(seconds_left_until_alarm=seconds)
+
+
+def _location(record, elapsed):
+    until_next = record.seconds_until_next_fix
+    if until_next != NO_FIX:
+        until_next -= elapsed
+        if until_next <= 0:
+            # A fix is due; the position may have changed
+            return None
+    return record._replace(
+        seconds_since_last_fix=record.seconds_since_last_fix + elapsed,
+        seconds_until_next_fix=until_next,
+    )
+
+
+class StateCache:
+    '''
+    Last response per query, adjusted for elapsed time on read.
+
+    An entry is served until its TTL runs out or its countdown reaches zero,
+    whichever comes first.
+
+    Args:
+        ttl: Dict of query name -> seconds, merged over DEFAULT_TTL
+        clock: Monotonic clock (seconds)
+    '''
+    EXTRAPOLATE = {
+        'get_next_pass': _next_pass,
+        'get_next_alarm': _next_alarm,
+        'get_location': _location,
+    }
+
+    def __init__(self, ttl=None, clock=time.monotonic):
+        self.ttl = dict(DEFAULT_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = {}
+
+    def get(self, name):
+        '''
+        Cached result for query `name`, or None on a miss.
+        '''
+        entry = self._entries.get(name)
+        if entry is not None:
+            record, stored = entry
+            elapsed = self._clock() - stored
+            if elapsed <= self.ttl[name]:
+                record = self.EXTRAPOLATE[name](record, int(elapsed))
+                if record is not None:
+                    self.hits += 1
+                    return record
+            del self._entries[name]
+        self.misses += 1
+        return None
+
+    def put(self, name, record):
+        if name in self.EXTRAPOLATE:
+            self._entries[name] = (record, self._clock())
+
+    def invalidate(self, *names):
+        '''
+        Drop the named entries, or every entry when no name is given.
+        '''
+        if not names:
+            self._entries.clear()
+        for name in names:
+            self._entries.pop(name, None)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
@@ -0,0 +1,135 @@
+import pytest
+import asyncio
+
+from async_hiber import AsyncHiber
+
+
+RESPONSES = {
+    b'get_next_pass': b'API(600: 1298)\r\n',
+    b'get_location': b'API(600: 54.333229; 4.212332; -157938633; -2147483648; 0.000000)\r\n',
+    b'get_next_alarm': b'API(225)\r\n',
+}
+
+
+async def fake_modem(reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        command = line.strip()
+        if command.startswith(b'Modem:'):
+            command = command[6:]
+            await reader.readline()
+        await asyncio.sleep(0.05)
+        writer.write(RESPONSES[command])
+        await writer.drain()
+    writer.close()
+
+
+def counting_modem(delay):
+    '''
+    Fake modem that boots with a banner and answers get_next_pass with
+    1001, 1002, ... after `delay` seconds; serve.count holds the number of
+    lines received.
+    '''
+    async def serve(reader, writer):
+        writer.write(b'Hiber API v1.0 booted\r\n')
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            serve.count += 1
+            await asyncio.sleep(delay)
+            writer.write(b'API(600: %d)\r\n' % (1000 + serve.count))
+            await writer.drain()
+        writer.close()
+    serve.count = 0
+    return serve
+
+
+def run_with_modems(count, coro, arduino=False, handler=fake_modem):
+    async def main():
+        server = await asyncio.start_server(handler, '127.0.0.1', 0)
+        host, port = server.sockets[0].getsockname()[:2]
+        modems = []
+        for i in range(count):
+            reader, writer = await asyncio.open_connection(host, port)
+            modems.append(AsyncHiber.from_streams(reader, writer, arduino=arduino))
+        try:
+            return await coro(modems)
+        finally:
+            for h in modems:
+                await h.close()
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(main())
+
+
+def test_async_hiber_class_should_raise_exception_for_invalid_com_port():
+    with pytest.raises(ValueError):
+        AsyncHiber('C1', 19200)
+
+def test_async_hiber_should_accept_the_same_ports_as_hiber():
+    for port in ('COM3', '/dev/ttyUSB0', 'socket://localhost:7000'):
+        assert port == AsyncHiber(port, 19200).port
+
+def test_async_hiber_get_next_pass_should_decode_response():
+    async def run(modems):
+        return await modems[0].get_next_pass()
+
+    assert 1298 == run_with_modems(1, run)['seconds_left_until_pass']
+
+def test_async_hiber_should_raise_for_error_response():
+    async def run(modems):
+        await modems[0].get_next_alarm()
+
+    with pytest.raises(ValueError):
+        run_with_modems(1, run)
+
+def test_async_hiber_should_frame_arduino_commands():
+    async def run(modems):
+        return await modems[0].get_location()
+
+    assert 54.333229 == run_with_modems(1, run, arduino=True)['latitude']
+
+def test_async_hiber_should_overlap_io_across_modems():
+    async def run(modems):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        results = await asyncio.gather(*[h.get_next_pass() for h in modems])
+        return loop.time() - start, results
+
+    elapsed, results = run_with_modems(10, run)
+
+    assert 10 == len(results)
+    assert elapsed < 0.4
+
+def test_async_hiber_should_skip_banner_and_drop_late_responses():
+    async def run(modems):
+        h = modems[0]
+        h.timeout = 0.05
+        with pytest.raises(asyncio.TimeoutError):
+            await h.get_next_pass()
+        h.timeout = 2
+        second = await h.get_next_pass()
+        third = await h.get_next_pass()
+        return second, third
+
+    second, third = run_with_modems(1, run, handler=counting_modem(0.2))
+
+    assert 1002 == second.seconds_left_until_pass
+    assert 1003 == third.seconds_left_until_pass
+
+def test_async_hiber_wait_ready_should_drain_probe_answers_on_a_slow_link():
+    async def run(modems):
+        h = modems[0]
+        ready = await h.wait_ready(timeout=3.0, probe_interval=0.05)
+        await asyncio.sleep(0.3)
+        return ready, await h.get_next_pass()
+
+    modem = counting_modem(0.2)
+    ready, result = run_with_modems(1, run, handler=modem)
+
+    assert ready
+    assert 1 < modem.count
+    assert 1000 + modem.count == result.seconds_left_until_pass
@@ -0,0 +1,62 @@
+import pytest
+
+from hiber import Hiber
+from transport import MemoryTransport
+from lpgan_sim import SimulatedModem
+from capture import (
+    TX, RX, FLAG_FRAMED, MAX_CHUNK, TrafficCapture, read_header, iter_records,
+)
+
+
+def test_capture_should_round_trip_records(tmp_path):
+    path = str(tmp_path / 'link.hcap')
+    with TrafficCapture(path) as capture:
+        capture.record(TX, b'get_next_pass\r\n')
+        capture.record(RX, b'')
+        capture.record(RX, b'API(600: 1298)\r\n')
+
+    records = list(iter_records(path))
+    assert [(TX, b'get_next_pass\r\n'), (RX, b'API(600: 1298)\r\n')] == \
+        [(r.direction, r.data) for r in records]
+    assert records[0].timestamp <= records[1].timestamp
+    assert 0 == read_header(path).flags
+
+def test_capture_should_split_long_chunks(tmp_path):
+    path = str(tmp_path / 'long.hcap')
+    with TrafficCapture(path) as capture:
+        capture.record(RX, b'x' * (MAX_CHUNK + 10))
+
+    assert [MAX_CHUNK, 10] == [len(r.data) for r in iter_records(path)]
+
+def test_iter_records_should_stop_at_truncated_record(tmp_path):
+    path = str(tmp_path / 'cut.hcap')
+    with TrafficCapture(path) as capture:
+        capture.record(TX, b'get_next_pass\r\n')
+        capture.record(RX, b'API(600: 1298)\r\n')
+    with open(path, 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 3)
+
+    assert [TX] == [r.direction for r in iter_records(path)]
+
+def test_iter_records_should_reject_other_files(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'not a capture at all')
+    with pytest.raises(ValueError):
+        list(iter_records(str(path)))
+
+def test_hiber_should_capture_link_traffic(tmp_path):
+    path = str(tmp_path / 'hiber.hcap')
+    h = Hiber(MemoryTransport(SimulatedModem().handle), capture=path)
+    h.get_next_pass()
+    h.close()
+
+    records = list(iter_records(path))
+    assert (TX, b'get_next_pass\r\n') == (records[0].direction, records[0].data)
+    assert RX == records[1].direction
+    assert records[1].data.startswith(b'API(600: ')
+
+def test_framed_capture_should_set_flag(tmp_path):
+    path = str(tmp_path / 'framed.hcap')
+    Hiber(MemoryTransport(lambda line: None), arduino='framed', capture=path).close()
+
+    assert FLAG_FRAMED == read_header(path).flags
@@ -0,0 +1,105 @@
+import time
+import pytest
+import datetime as dt
+
+from clock_sync import ClockSync
+from lpgan_sim import SimulatedModem
+from testutil import FakeClock, sim_hiber
+
+
+WALL_REF = 1600000000.0
+
+def make_sync(**kwargs):
+    clock = FakeClock()
+    return ClockSync(clock=clock, wall_clock=lambda: WALL_REF + clock.now, **kwargs), clock
+
+def utc(seconds):
+    # Naive UTC datetime, as the modem reports it
+    return dt.datetime.fromtimestamp(seconds, dt.timezone.utc).replace(tzinfo=None)
+
+def modem_time(seconds):
+    return utc(int(WALL_REF + seconds))
+
+
+@pytest.fixture(autouse=True)
+def local_timezone(monkeypatch):
+    '''
+    Run every test with the host five hours behind UTC.
+    '''
+    if not hasattr(time, 'tzset'):
+        pytest.skip('time.tzset not available')
+    monkeypatch.setenv('TZ', 'EST+5')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_clock_sync_should_measure_offset_at_round_trip_midpoint():
+    sync, clock = make_sync()
+    # Modem 20 s ahead, 2 s round trip: response stamped at host time 1 s
+    offset = sync.add_sample(0.0, 2.0, modem_time(21.0))
+
+    assert 20.0 <= offset <= 21.0
+    assert sync.needs_correction(at=2.0)
+
+def test_clock_sync_should_estimate_drift_across_samples():
+    sync, clock = make_sync(threshold=15, min_span=60)
+    for t in range(0, 1000, 100):
+        sync.add_sample(float(t), t + 0.1, modem_time(t + 0.05 + t * 0.01))
+
+    assert 0.009 < sync.drift < 0.011
+    assert not sync.needs_correction(at=900.0)
+    assert sync.needs_correction(at=1600.0)
+
+def test_clock_sync_corrected_time_should_add_one_way_latency():
+    sync, clock = make_sync()
+    sync.add_sample(0.0, 4.0, modem_time(100.0))
+    clock.now = 10.0
+
+    assert utc(WALL_REF + 12.0) == sync.corrected_time()
+
+def test_clock_sync_should_read_modem_time_as_utc():
+    assert 5 * 3600 == time.timezone
+    sync, clock = make_sync()
+    offset = sync.add_sample(0.0, 0.0, modem_time(0.0))
+
+    assert 0.0 <= offset <= 1.0
+
+def test_clock_sync_should_restart_offset_after_correction():
+    sync, clock = make_sync()
+    sync.add_sample(0.0, 0.1, modem_time(100.0))
+    sync.corrected()
+
+    assert 0.0 == sync.offset()
+    assert 1 == sync.corrections
+
+def test_hiber_should_correct_modem_clock_only_when_offset_is_large():
+    modem = SimulatedModem()
+    h = sim_hiber(modem)
+
+    h._modem_get_time()
+    assert 0 == h.clock_sync.corrections
+    assert abs(h.clock_sync.offset()) < 2
+
+    modem._clock += dt.timedelta(seconds=120)
+    h.clock_sync.reset()
+    h._modem_get_time()
+    assert 1 == h.clock_sync.corrections
+    assert abs((modem.now() - utc(time.time())).total_seconds()) < 2
+
+def test_clock_sync_should_follow_a_stepped_host_clock():
+    clock = FakeClock()
+    step = [0.0]
+    sync = ClockSync(clock=clock, wall_clock=lambda: WALL_REF + clock.now + step[0])
+    sync.add_sample(0.0, 0.2, modem_time(0.0))
+
+    # NTP moves the host clock an hour ahead; the modem is now an hour behind
+    step[0] = 3600.0
+    clock.now = 10.0
+    offset = sync.add_sample(10.0, 10.2, modem_time(10.0))
+
+    assert -3601.0 <= offset <= -3599.0
+    assert 1 == len(sync.samples)
+    assert sync.needs_correction()
+    assert utc(round(WALL_REF + 3610.1)) == sync.corrected_time()
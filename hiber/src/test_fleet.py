@@ -0,0 +1,127 @@
+import os
+import math
+import time
+import pytest
+import threading
+
+from lpgan_sim import PtyModem
+import fleet
+from fleet import StatusTable, FleetManager, STATUS_COLUMNS, _poll_loop
+
+
+def run_poll_loop(shard, polls, until, reconnect_interval=0.05):
+    table = StatusTable(len(shard))
+    stop = threading.Event()
+    worker = threading.Thread(target=_poll_loop, args=(
+        table.name, len(shard), shard, polls, {}, stop, reconnect_interval))
+    worker.start()
+    try:
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            status = table.snapshot()
+            if until(status):
+                break
+            time.sleep(0.05)
+        return status
+    finally:
+        stop.set()
+        worker.join(10)
+        table.close()
+        table.unlink()
+
+def counting_hiber(monkeypatch, start=True):
+    opened = []
+
+    class FakeHiber:
+        def __init__(self, port, **kwargs):
+            opened.append(port)
+            self.closed = False
+
+        def start(self):
+            return start
+
+        def close(self):
+            self.closed = True
+
+        def get_next_pass(self):
+            raise ValueError("port not open")
+
+    monkeypatch.setattr(fleet, 'Hiber', FakeHiber)
+    return opened
+
+
+def test_status_table_should_publish_rows_across_attachments():
+    table = StatusTable(2)
+    try:
+        reader = StatusTable.attach(table.name, 2)
+        table.write(1, {'seconds_left_until_pass': 1298, 'polls': 1})
+
+        row = reader.read(1)
+        assert 1298 == row['seconds_left_until_pass']
+        assert math.isnan(row['latitude'])
+        assert all(math.isnan(value) for value in reader.read(0).values())
+        assert set(STATUS_COLUMNS) == set(row)
+        reader.close()
+    finally:
+        table.close()
+        table.unlink()
+
+def test_fleet_should_shard_ports_round_robin():
+    fleet = FleetManager(['COM1', 'COM2', 'COM3'], workers=2)
+
+    assert [[(0, 'COM1'), (2, 'COM3')], [(1, 'COM2')]] == fleet.shards()
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='pty not available')
+def test_fleet_should_poll_pty_modems_into_status_table():
+    modems = [PtyModem().start() for _ in range(3)]
+    try:
+        polls = {'get_next_pass': 0.05, 'get_location': 0.05, 'get_next_alarm': 0.05}
+        with FleetManager([m.port for m in modems], workers=2, polls=polls) as fleet:
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                status = fleet.status()
+                if all(row['polls'] >= 6 for row in status):
+                    break
+                time.sleep(0.05)
+
+            assert [m.port for m in modems] == [row['port'] for row in status]
+            for row in status:
+                assert 1.0 == row['online']
+                assert 0 == row['errors']
+                assert 0 < row['seconds_left_until_pass']
+                assert 3 == row['alarm_id']
+                assert 0.0 == row['latitude']
+    finally:
+        for modem in modems:
+            modem.stop()
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='pty not available')
+def test_poll_loop_should_keep_polling_when_a_port_cannot_be_opened():
+    modem = PtyModem().start()
+    shard = [(0, '/dev/ttyNOPE0'), (1, modem.port)]
+    try:
+        missing, present = run_poll_loop(shard, {'get_next_pass': 0.05},
+                                         lambda s: s[1]['polls'] >= 3 and s[0]['errors'] >= 2)
+
+        assert 0.0 == missing['online']
+        assert missing['errors'] >= 2
+        assert 0 == missing['polls']
+        assert 1.0 == present['online']
+        assert present['polls'] >= 3
+    finally:
+        modem.stop()
+
+def test_poll_loop_should_reconnect_a_modem_that_does_not_start(monkeypatch):
+    opened = counting_hiber(monkeypatch, start=False)
+    status, = run_poll_loop([(0, 'COM1')], {'get_next_pass': 0.01}, lambda s: len(opened) >= 3)
+
+    assert len(opened) >= 3
+    assert 0 == status['polls']
+    assert 0.0 == status['online']
+
+def test_poll_loop_should_reconnect_after_repeated_poll_failures(monkeypatch):
+    opened = counting_hiber(monkeypatch)
+    status, = run_poll_loop([(0, 'COM1')], {'get_next_pass': 0.01}, lambda s: len(opened) >= 2)
+
+    assert len(opened) >= 2
+    assert status['errors'] >= fleet.MAX_POLL_FAILURES
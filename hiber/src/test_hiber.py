@@ -1,7 +1,11 @@
 import pytest
 import datetime as dt
+import time
+import threading
 
-from hiber import Hiber
+from hiber import Hiber, LineReader, LineDispatcher, RESPONSE, NOTIFICATION, DEBUG
+from hiber import ArdFrame, ArdFrameDecoder, ARD_MODEM, ARD_WAKEUP, ARD_RESPONSE
+from transport import MemoryTransport
 
 
 
@@ -23,3 +27,259 @@ def test_hiber_class_should_init_with_correct_com_and_baudrate():
 
     assert h._ser.port == 'COM1'
     assert h._ser.baudrate == 57600
+
+
+class FakeSerial:
+    '''Answers each written command with a canned response, logging I/O.'''
+    def __init__(self, responses):
+        self.responses = responses
+        self.pending = []
+        self.events = []
+
+    def write(self, data):
+        commands = []
+        for command in data.decode().split('\r\n'):
+            if command.startswith('Modem:'):
+                command = command[6:]
+            if command:
+                commands.append(command)
+                self.pending.append(self.responses[command.split('(')[0]])
+        self.events.append(('write', commands))
+        return len(data)
+
+    def readline(self):
+        self.events.append(('read',))
+        if not self.pending:
+            return b''
+        return self.pending.pop(0)
+
+
+PIPELINE_RESPONSES = {
+    'get_next_pass': b'API(600: 1298)\r\n',
+    'get_next_alarm': b'API(600: 3; 39)\r\n',
+    'get_location': b'API(600: 0.000000; 0.000000; 136121891; -2147483648; 0.000000)\r\n',
+    'set_gps_mode': b'API(525)\r\n',
+}
+
+def test_pipeline_should_match_responses_in_command_order():
+    h = Hiber('COM1', 19200)
+    h._ser = FakeSerial(PIPELINE_RESPONSES)
+
+    results = h.pipeline([('get_next_pass', ()), ('get_next_alarm', ()), ('get_location', ())], window=2)
+
+    assert 1298 == results[0]['seconds_left_until_pass']
+    assert 3 == results[1]['alarm_id']
+    assert 136121891 == results[2]['seconds_since_last_fix']
+    assert h._ser.events == [
+        ('write', ['get_next_pass', 'get_next_alarm']),
+        ('read',),
+        ('write', ['get_location']),
+        ('read',),
+        ('read',),
+    ]
+
+def test_pipeline_should_drain_all_responses_before_raising():
+    h = Hiber('COM1', 19200, pipeline_window=3)
+    h._ser = FakeSerial(PIPELINE_RESPONSES)
+
+    with pytest.raises(ValueError):
+        h.pipeline([('set_gps_mode', (True,)), ('get_next_pass', ())])
+
+    assert [] == h._ser.pending
+
+
+class FakeStreamSerial:
+    '''Byte stream with in_waiting/read, answering commands after a delay.'''
+    def __init__(self, responses, delay=0.0):
+        self.responses = responses
+        self.delay = delay
+        self.timeout = 10
+        self._data = bytearray()
+        self._ready_at = []
+        self._lock = threading.Lock()
+
+    def _release(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._ready_at and self._ready_at[0][0] <= now:
+                self._data += self._ready_at.pop(0)[1]
+
+    @property
+    def in_waiting(self):
+        self._release()
+        return len(self._data)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + self.timeout
+        while not self.in_waiting and time.monotonic() < deadline:
+            time.sleep(0.001)
+        with self._lock:
+            data = bytes(self._data[:size])
+            del self._data[:size]
+        return data
+
+    def write(self, data):
+        command = data.decode().strip().split('(')[0]
+        with self._lock:
+            self._ready_at.append((time.monotonic() + self.delay, self.responses[command]))
+        return len(data)
+
+    def inject(self, data):
+        with self._lock:
+            self._data += data
+
+
+def test_line_reader_should_frame_lines_split_across_reads():
+    reader = LineReader(None)
+    reader.feed(b'API(600: 12')
+    reader.feed(b'98)\r')
+    reader.feed(b'\nHiber API v1\r\n\r\nAPI(6')
+
+    assert b'API(600: 1298)' == reader.frames.get_nowait()
+    assert b'Hiber API v1' == reader.frames.get_nowait()
+    assert reader.frames.empty()
+
+def test_hiber_with_reader_should_skip_stray_lines():
+    h = Hiber('COM1', 19200)
+    h._ser = FakeStreamSerial(PIPELINE_RESPONSES)
+    h.start_reader(poll_interval=0.01)
+    try:
+        h._ser.inject(b'Hiber API boot\r\n')
+        assert 1298 == h.get_next_pass()['seconds_left_until_pass']
+        assert 3 == h._command('get_next_alarm')['alarm_id']
+    finally:
+        h.stop_reader()
+
+def test_hiber_with_reader_should_time_out_on_its_own_deadline():
+    h = Hiber('COM1', 19200)
+    h._ser = FakeStreamSerial(PIPELINE_RESPONSES, delay=1.0)
+    h.timeout = 0.1
+    h.start_reader(poll_interval=0.01)
+    try:
+        with pytest.raises(ValueError):
+            h.get_next_pass()
+    finally:
+        h.stop_reader()
+
+
+def test_line_dispatcher_should_classify_lines():
+    assert RESPONSE == LineDispatcher.classify(b'API(600: 1298)')
+    assert NOTIFICATION == LineDispatcher.classify(b'Hiber API v1.0 booted')
+    assert DEBUG == LineDispatcher.classify(b'payload: 0a0b0c')
+
+def test_line_dispatcher_should_split_trailing_text_from_response():
+    d = LineDispatcher()
+    debug = []
+    d.register(DEBUG, debug.append)
+
+    d.dispatch(b'API(600: 2019-02-25T16:13:38Z) Current date: 2019-02-25T16:13:38Z')
+
+    assert b'API(600: 2019-02-25T16:13:38Z)' == d.responses.get_nowait()
+    assert [b'Current date: 2019-02-25T16:13:38Z'] == debug
+
+def test_hiber_should_route_unsolicited_lines_to_callbacks():
+    h = Hiber('COM1', 19200)
+    h._ser = FakeStreamSerial(PIPELINE_RESPONSES)
+    banners = []
+    h.on(NOTIFICATION, banners.append)
+    h.start_reader(poll_interval=0.01)
+    try:
+        h._ser.inject(b'Hiber API boot\r\n')
+        assert 1298 == h.get_next_pass()['seconds_left_until_pass']
+    finally:
+        h.stop_reader()
+
+    assert [b'Hiber API boot'] == banners
+
+
+#------------------------------
+# Framed Arduino passthrough
+#------------------------------
+def test_ard_frame_should_round_trip_records():
+    frame = ArdFrame.commands(b'get_location\r\nget_next_pass\r\n', wakeup=True)
+    frames = ArdFrameDecoder().feed(frame)
+
+    assert 0xA5 == frame[0]
+    assert [[(ARD_WAKEUP, b'\x01'), (ARD_MODEM, b'get_location'), (ARD_MODEM, b'get_next_pass')]] == frames
+
+def test_ard_frame_decoder_should_handle_split_input_and_resync():
+    good = ArdFrame.encode([(ARD_RESPONSE, b'API(600: 1298)')])
+    bad = bytearray(good)
+    bad[-1] ^= 0xFF
+    decoder = ArdFrameDecoder()
+
+    data = b'noise' + bytes(bad) + good
+    frames = []
+    for i in range(len(data)):
+        frames += decoder.feed(data[i:i + 1])
+
+    assert [[(ARD_RESPONSE, b'API(600: 1298)')]] == frames
+    assert 2 <= decoder.errors
+
+def test_ard_frame_decoder_should_not_wait_on_a_corrupt_length():
+    good = ArdFrame.encode([(ARD_RESPONSE, b'API(600: 1298)')])
+    decoder = ArdFrameDecoder()
+
+    assert [[(ARD_RESPONSE, b'API(600: 1298)')]] == decoder.feed(b'\xa5\xff\xff' + good)
+    assert 1 <= decoder.errors
+
+def test_ard_frame_should_reject_long_records():
+    with pytest.raises(ValueError):
+        ArdFrame.encode([(ARD_MODEM, b'x' * 256)])
+    with pytest.raises(ValueError):
+        ArdFrame.encode([(ARD_MODEM, b'x' * 255)] * 5)
+
+def test_ard_wakeup_should_write_ascii_command():
+    h = Hiber(MemoryTransport(lambda line: None), arduino=True)
+    h.ard_wakeup(True)
+    h.ard_wakeup(False)
+
+    assert b'Wakeup:1\r\nWakeup:0\r\n' == bytes(h._ser.written)
+    with pytest.raises(ValueError):
+        h.ard_wakeup(1)
+
+def test_framed_link_should_batch_pipeline_into_one_frame():
+    def arduino(frame):
+        lines = [data for kind, data in ArdFrameDecoder().feed(frame)[0] if kind == ARD_MODEM]
+        return ArdFrame.encode([(ARD_RESPONSE, b'API(600: 1298)') for _ in lines])
+
+    link = FakeFramedArduino(arduino)
+    h = Hiber(link, arduino='framed')
+    h.ard_wakeup(True, defer=True)
+    results = h.pipeline([('get_next_pass', ())] * 3, window=3)
+
+    assert [1298] * 3 == [r.seconds_left_until_pass for r in results]
+    assert 1 == len(link.frames)
+    assert (ARD_WAKEUP, b'\x01') == ArdFrameDecoder().feed(link.frames[0])[0][0]
+
+
+class FakeFramedArduino:
+    '''
+    Link that answers each written frame with arduino(frame).
+    '''
+    def __init__(self, arduino):
+        self.arduino = arduino
+        self.frames = []
+        self.timeout = 1
+        self.port = 'FAKE'
+        self._rx = bytearray()
+
+    def write(self, data):
+        self.frames.append(bytes(data))
+        self._rx += self.arduino(bytes(data))
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self._rx)
+
+    def read(self, size=1):
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def readline(self):
+        return self.read(len(self._rx))
+
+    def reset_input_buffer(self):
+        self._rx.clear()
@@ -0,0 +1,59 @@
+import math
+
+from history import TelemetryHistory
+from hiber import LPGAN_API_Rx
+from testutil import sim_hiber
+
+
+def values(segments):
+    return [value for segment in segments for value in segment]
+
+
+def test_history_should_store_samples_with_nan_for_missing_fields():
+    h = TelemetryHistory(4)
+    h.record(LPGAN_API_Rx.get_next_pass('API(600: 1298)'), timestamp=10.0)
+
+    window = h.window()
+    assert [10.0] == values(window['timestamp'])
+    assert [1298.0] == values(window['seconds_left_until_pass'])
+    assert math.isnan(values(window['latitude'])[0])
+
+def test_history_should_evict_oldest_samples_when_full():
+    h = TelemetryHistory(3)
+    for t in range(5):
+        h.record({'alarm_id': t}, timestamp=float(t))
+
+    window = h.window()
+    assert 3 == len(h)
+    assert [2.0, 3.0, 4.0] == values(window['timestamp'])
+    assert 2 == len(window['timestamp'])
+
+def test_history_window_should_select_by_time_and_count():
+    h = TelemetryHistory(4)
+    for t in range(6):
+        h.record({'alarm_id': t}, timestamp=float(t))
+
+    assert [3.0, 4.0] == values(h.window(since=2.5, until=4.0)['timestamp'])
+    assert [4.0, 5.0] == values(h.window(last=2)['alarm_id'])
+    assert [] == values(h.window(since=10.0)['timestamp'])
+
+def test_history_window_should_not_copy_buffers():
+    h = TelemetryHistory(4)
+    h.record({'alarm_id': 1}, timestamp=1.0)
+    segment = h.window()['alarm_id'][0]
+
+    h.clear()
+    h.record({'alarm_id': 7}, timestamp=2.0)
+
+    assert 7.0 == segment[0]
+
+def test_hiber_should_record_polled_values_when_history_enabled():
+    hiber = sim_hiber(history=16)
+    hiber.set_location(47.686449, -122.254220, 1.5)
+    hiber.get_next_pass()
+    hiber.get_next_alarm()
+
+    window = hiber.history.window()
+    assert 3 == len(hiber.history)
+    assert 47.686449 == values(window['latitude'])[0]
+    assert 3.0 == values(window['alarm_id'])[2]
@@ -0,0 +1,66 @@
+import json
+import time
+
+from hiber import Hiber
+from identity_cache import IdentityCache
+from lpgan_sim import SimulatedModem
+from testutil import sim_hiber
+
+
+def test_identity_cache_should_skip_firmware_query_on_warm_restart(tmp_path):
+    path = tmp_path / 'identity.json'
+    cold = sim_hiber(identity_cache=str(path))
+    cold.initalization()
+
+    warm = sim_hiber(identity_cache=str(path))
+    warm.initalization()
+
+    assert 'get_firmware_version' in cold._ser.modem.commands
+    assert 'get_firmware_version' not in warm._ser.modem.commands
+    assert 'cn-release-v1.0.0-1-gd193bbe4' == warm.modem.firmware_version
+    assert '27AA 0DD8' in json.loads(path.read_text())
+
+def test_identity_cache_should_miss_when_identity_changes(tmp_path):
+    path = tmp_path / 'identity.json'
+    sim_hiber(identity_cache=str(path)).initalization()
+
+    modem = SimulatedModem()
+    modem.fw_version = '2'
+    h = sim_hiber(modem, identity_cache=str(path))
+    h.initalization()
+
+    assert 'get_firmware_version' in modem.commands
+
+def test_identity_cache_should_ignore_unreadable_file(tmp_path):
+    path = tmp_path / 'identity.json'
+    path.write_text('not json')
+
+    assert None == IdentityCache(str(path)).lookup({'MODEM_NO_STR': '27AA 0DD8'})
+
+def test_start_should_return_as_soon_as_modem_answers():
+    h = sim_hiber(SimulatedModem(boot_time=0.3), open=False)
+
+    start = time.monotonic()
+
+    assert h.start(ready_timeout=2.0, probe_interval=0.05)
+    assert time.monotonic() - start < 1.0
+    assert 0 == h._ser.in_waiting
+    assert 0 < h.get_next_pass()['seconds_left_until_pass']
+
+def test_start_should_drain_probe_answers_on_a_link_slower_than_the_probes():
+    h = sim_hiber(SimulatedModem(delay=0.25), open=False)
+
+    assert h.start(ready_timeout=3.0, probe_interval=0.05)
+    time.sleep(0.6)
+    assert 0 == h._ser.in_waiting
+    assert 0 < h.get_next_pass()['seconds_left_until_pass']
+
+def test_start_should_give_up_at_deadline():
+    h = sim_hiber(SimulatedModem(boot_time=5.0), open=False)
+
+    assert not h.start(ready_timeout=0.2, probe_interval=0.05)
+
+def test_start_should_return_false_when_port_does_not_open():
+    h = Hiber('/dev/ttyNOPE0', 19200)
+
+    assert not h.start(ready_timeout=0.2, probe_interval=0.05)
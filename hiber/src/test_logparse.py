@@ -0,0 +1,96 @@
+import csv
+import pytest
+
+from logparse import guess_command, parse_chunk, iter_chunks, run, main, CsvWriter
+
+
+LOG = (
+    b"get_next_pass: API(600: 1298)\r\n"
+    b"get_next_alarm: API(600: 3; 39)\r\n"
+    b"Hiber API v1.0\r\n"
+    b"API(600: 0.000000; 0.000000; 136121891; -2147483648; 0.000000)\r\n"
+    b"API(600: GAMMA; 2; 1; 27AA 0DD8; 665456088)\r\n"
+    b"API(600: 2019-02-25T16:14:40Z)\r\n"
+    b"API(425)\r\n"
+    b"get_next_pass API(600: 1200)\r\n"
+    b"API(600: 20)\r\n"
+)
+
+
+def test_guess_command_should_use_response_shape():
+    assert None == guess_command(600, ('1298',))
+    assert None == guess_command(600, ('3', '39'))
+    assert 'get_datetime' == guess_command(600, ('2019-02-25T16:14:40Z',))
+    assert 'get_firmware_version' == guess_command(600, ('cn-release-v1.0.0',))
+    assert 'get_location' == guess_command(600, ('0.0', '0.0', '1', '-1', '0.0'))
+    assert 'get_modem_info' == guess_command(600, ('GAMMA', '2', '1', '27AA 0DD8', '6'))
+    assert 'go_to_sleep' == guess_command(602, ('36', '3'))
+    assert None == guess_command(600, ())
+    assert None == guess_command(603, ())
+
+def test_parse_chunk_should_build_columns_per_command():
+    tables, stats = parse_chunk(LOG)
+
+    assert [1298, 1200] == tables['get_next_pass']['seconds_left_until_pass']
+    assert [3] == tables['get_next_alarm']['alarm_id']
+    assert ['27AA 0DD8'] == tables['get_modem_info']['MODEM_NO_STR']
+    assert {'lines': 8, 'decoded': 6, 'skipped': 2, 'errors': {425: 1}} == stats
+
+def test_parse_chunk_should_only_use_decoder_names():
+    tables, stats = parse_chunk(b"parse: API(600: 2019-02-25T16:14:40Z)\r\n"
+                                b"parse_api_message: API(600: 1298)\r\n")
+
+    assert ['2019-02-25T16:14:40Z'] == tables['get_datetime']['datetime']
+    assert {'get_datetime'} == set(tables)
+    assert 1 == stats['skipped']
+
+def test_parse_chunk_should_honour_forced_command():
+    tables, _ = parse_chunk(b"API(600: 20)\r\n", command='set_payload')
+    assert {'set_payload': {'payload_bytes': [20]}} == tables
+
+def test_iter_chunks_should_split_on_line_ends(tmp_path):
+    path = tmp_path / 'a.log'
+    path.write_bytes(LOG)
+    chunks = list(iter_chunks([str(path)], chunk_size=20))
+
+    assert LOG == b''.join(chunks)
+    assert all(chunk.endswith(b'\n') for chunk in chunks)
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_run_should_write_csv_tables(tmp_path, workers):
+    paths = []
+    for i in range(3):
+        path = tmp_path / ('%d.log' % i)
+        path.write_bytes(LOG * 50)
+        paths.append(str(path))
+    out = tmp_path / 'out'
+    stats = run(paths, CsvWriter(str(out)), workers=workers, chunk_size=256)
+
+    assert 3 * 50 * 8 == stats['lines']
+    assert 3 * 50 == stats['errors'][425]
+    assert 0 < stats['lines_per_second']
+    with open(out / 'get_next_pass.csv') as f:
+        rows = list(csv.reader(f))
+    assert ['seconds_left_until_pass'] == rows[0]
+    assert ['1298', '1200'] * 150 == [row[0] for row in rows[1:]]
+
+def test_main_should_report_throughput(tmp_path, capsys):
+    path = tmp_path / 'a.log'
+    path.write_bytes(LOG)
+    assert 0 == main([str(path), '-o', str(tmp_path / 'out'), '-w', '1'])
+
+    err = capsys.readouterr().err
+    assert 'lines/s' in err
+    assert 'error 425: 1' in err
+
+def test_run_should_write_npz_arrays(tmp_path):
+    np = pytest.importorskip('numpy')
+    from logparse import NpzWriter
+
+    path = tmp_path / 'a.log'
+    path.write_bytes(LOG)
+    out = str(tmp_path / 'out.npz')
+    run([str(path)], NpzWriter(out), workers=1)
+
+    arrays = np.load(out)
+    assert [1298, 1200] == arrays['get_next_pass.seconds_left_until_pass'].tolist()
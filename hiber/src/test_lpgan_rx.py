@@ -3,7 +3,11 @@ import pytest
 import datetime as dt
 
 
-from hiber import LPGAN_API_Rx
+from hiber import (
+    LPGAN_API_Rx, ModemState, ErrorCode, ERROR_CODES, ERROR_TABLE, error_for, HiberError,
+    ResponseFormatError, ParseError, ConversionError, CommandError, ModemRuntimeError,
+    TransientError, BufferOverflowError, SleepRefusedError,
+)
 
 #------------------------------
 # Parsing Rx strings 
@@ -183,4 +187,150 @@ def test_set_payload_should_return_valid_count():
 
 def test_set_payload_should_raise_excpetion_for_error():
     with pytest.raises(ValueError):
-        LPGAN_API_Rx.set_payload('API(127: 127)\r\n') 
\ No newline at end of file
+        LPGAN_API_Rx.set_payload('API(127: 127)\r\n') 
+
+#------------------------------
+# Response parser
+#------------------------------
+def test_parse_should_return_int_code_and_field_tuple():
+    result = LPGAN_API_Rx.parse('API(600: 20; 40;60)\r\n')
+
+    assert 600 == result.code
+    assert ('20', '40', '60') == result.fields
+
+def test_parse_should_strip_whitespace_around_fields_like_the_original_parser():
+    assert (600, ('a', 'b')) == LPGAN_API_Rx.parse('API(600: a; b )')
+    assert ['600', ['a', 'b']] == LPGAN_API_Rx.parse_api_message('API(600: a; b )')
+    assert (600, (b'a', b'b')) == LPGAN_API_Rx.parse(b'API(600:a;  b )')
+
+def test_parse_should_keep_str_and_bytes_fields_apart():
+    assert ('1298',) == LPGAN_API_Rx.parse('API(600: 1298)').fields
+    assert (b'1298',) == LPGAN_API_Rx.parse(b'API(600: 1298)').fields
+    assert (b'1298',) == LPGAN_API_Rx.parse(bytearray(b'API(600: 1298)')).fields
+
+@pytest.mark.parametrize('line,expected', [
+    ('API(600: a;b;  c; \td)', (600, ('a', 'b', 'c', 'd'))),
+    ('API(600: 27AA 0DD8; 6 )', (600, ('27AA 0DD8', '6'))),
+    ('API(600:)', (600, ('',))),
+    ('API( 525 )', (525, ())),
+])
+def test_parse_should_handle_irregular_separators_and_spacing(line, expected):
+    assert expected == LPGAN_API_Rx.parse(line)
+    assert (expected[0], tuple(f.encode() for f in expected[1])) == LPGAN_API_Rx.parse(line.encode())
+
+def test_parse_should_return_empty_fields_for_code_only():
+    assert (136, ()) == LPGAN_API_Rx.parse('API(136)\r\n')
+
+def test_parse_should_accept_bytes_and_memoryview():
+    api = b'API(600: 2019-02-25T16:13:38Z) Current date: 2019-02-25T16:13:38Z\r\n'
+
+    assert (600, (b'2019-02-25T16:13:38Z',)) == LPGAN_API_Rx.parse(api)
+    assert (600, (b'2019-02-25T16:13:38Z',)) == LPGAN_API_Rx.parse(memoryview(api))
+
+@pytest.mark.parametrize('line', [b'Invalid entry', 'API(600: 1', 'API(-1)', b'API(6x0: 1)'])
+def test_parse_should_fail_for_bad_return_string(line):
+    with pytest.raises(ValueError):
+        LPGAN_API_Rx.parse(line)
+
+
+def test_decoders_should_list_every_command_decoder():
+    methods = {name for name in vars(LPGAN_API_Rx)
+               if not name.startswith('_') and not name.startswith('parse') and name != 'DECODERS'}
+    assert methods == LPGAN_API_Rx.DECODERS
+
+
+#------------------------------
+# Response records
+#------------------------------
+def test_records_should_support_attribute_key_and_dict_access():
+    result = LPGAN_API_Rx.get_next_alarm('API(600: 3; 39)\r\n')
+
+    assert 3 == result.alarm_id
+    assert 39 == result['seconds_left_until_alarm']
+    assert {'alarm_id': 3, 'seconds_left_until_alarm': 39} == dict(result)
+    assert {'alarm_id': 3, 'seconds_left_until_alarm': 39} == result._asdict()
+
+def test_records_should_raise_key_error_for_unknown_field():
+    result = LPGAN_API_Rx.get_next_pass('API(600: 1298)')
+    with pytest.raises(KeyError):
+        result['latitude']
+
+def test_records_should_not_have_instance_dict():
+    result = LPGAN_API_Rx.get_location('API(600: 0.000000; 0.000000; 136121891; -2147483648; 0.000000)')
+    assert not hasattr(result, '__dict__')
+
+def test_modem_state_should_update_from_records():
+    state = ModemState()
+    state.update(LPGAN_API_Rx.get_modem_info('API(600: GAMMA; 2; 1; 27AA 0DD8; 665456088)'))
+
+    assert '27AA 0DD8' == state.MODEM_NO_STR
+    assert 665456088 == state['MODEM_NO_INT']
+    assert None == state.as_dict()['latitude']
+    with pytest.raises(KeyError):
+        state['unknown'] = 1
+
+
+#------------------------------
+# Error codes and exceptions
+#------------------------------
+def test_error_table_should_cover_every_error_code():
+    assert sorted(int(code) for code in ERROR_CODES) == sorted(ERROR_TABLE)
+    assert ErrorCode.UNKNOWN_COMMAND == 425
+
+def test_errors_should_carry_code_command_and_line():
+    with pytest.raises(CommandError) as e:
+        LPGAN_API_Rx.get_next_pass('API(425)\r\n')
+
+    assert ErrorCode.UNKNOWN_COMMAND == e.value.code
+    assert 'get_next_pass' == e.value.command
+    assert 'API(425)\r\n' == e.value.line
+    assert 'Unknown command' == str(e.value)
+
+def test_errors_should_be_grouped_by_range():
+    assert isinstance(error_for(126), ParseError)
+    assert isinstance(error_for(225), ConversionError)
+    assert isinstance(error_for(325), ConversionError)
+    assert isinstance(error_for(426), CommandError)
+    assert isinstance(error_for(625), ModemRuntimeError)
+    assert isinstance(error_for(625), ValueError)
+
+def test_overflow_errors_should_be_transient():
+    assert isinstance(error_for(125), BufferOverflowError)
+    assert isinstance(error_for(125), ParseError)
+    assert isinstance(error_for(525), TransientError)
+    assert not isinstance(error_for(625), TransientError)
+
+def test_unknown_error_code_should_not_raise_key_error():
+    with pytest.raises(ParseError) as e:
+        LPGAN_API_Rx.get_location('API(199)')
+    assert 199 == e.value.code
+
+    with pytest.raises(HiberError):
+        LPGAN_API_Rx.parse_api_message('API(999)', error_handling=True)
+
+def test_go_to_sleep_refusals_should_be_warnings():
+    for api in ('API(603: 36; 3)', 'API(635: 1; 3)'):
+        with pytest.raises(SleepRefusedError) as e:
+            LPGAN_API_Rx.go_to_sleep(api)
+        assert isinstance(e.value, Warning)
+        assert isinstance(e.value, ValueError)
+
+def test_invalid_line_should_raise_response_format_error():
+    with pytest.raises(ResponseFormatError) as e:
+        LPGAN_API_Rx.get_next_pass('Hiber API v1.0')
+    assert e.value.code is None
+    assert 'Hiber API v1.0' == e.value.line
+
+def test_records_should_behave_like_the_old_dict_results():
+    result = LPGAN_API_Rx.get_next_alarm('API(600: 3; 39)')
+    old = {'alarm_id': 3, 'seconds_left_until_alarm': 39}
+
+    assert 'alarm_id' in result
+    assert 3 not in result
+    assert ['alarm_id', 'seconds_left_until_alarm'] == list(result)
+    assert 39 == result.get('seconds_left_until_alarm')
+    assert None == result.get('latitude')
+    assert old == result and not old != result
+    assert old == dict(result.items()) == result._asdict()
+    assert (3, 39) == result.values()
+    assert 3 == result[0] == result.alarm_id
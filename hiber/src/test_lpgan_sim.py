@@ -0,0 +1,199 @@
+import io
+import os
+import time
+import pytest
+import datetime as dt
+
+import serial
+
+from hiber import Hiber, LPGAN_API_Tx, LPGAN_API_Rx
+from lpgan_sim import SimulatedModem, PtyModem, ArduinoBridge
+from hiber import ArdFrame, ArdFrameDecoder, ARD_MODEM, ARD_WAKEUP, ARD_RESPONSE
+from testutil import sim_hiber
+
+
+COMMANDS = [
+    ('set_gps_mode', (True,)),
+    ('do_gps_fix', ('12345,223452',)),
+    ('get_firmware_version', ()),
+    ('get_modem_info', ()),
+    ('set_modem_number', ('ABCD 1234',)),
+    ('get_location', ()),
+    ('set_location', (52.333233, 4.212332, 1.5)),
+    ('get_datetime', ()),
+    ('set_datetime', (dt.datetime(2019, 10, 25, 10, 59, 48),)),
+    ('get_next_alarm', ()),
+    ('get_next_pass', ()),
+    ('go_to_sleep', ()),
+    ('toggle_payload_over_debug', (True,)),
+    ('set_payload', (20,)),
+]
+
+
+@pytest.mark.parametrize('name,args', COMMANDS)
+def test_simulated_modem_should_answer_every_tx_command(name, args):
+    modem = SimulatedModem()
+    response = modem.handle(getattr(LPGAN_API_Tx, name)(*args))
+
+    getattr(LPGAN_API_Rx, name)(response)
+
+def test_simulated_modem_should_keep_state_between_commands():
+    modem = SimulatedModem()
+    modem.handle(LPGAN_API_Tx.set_location(52.333233, 4.212332, 1.5))
+    result = LPGAN_API_Rx.get_location(modem.handle(LPGAN_API_Tx.get_location()))
+
+    assert 52.333233 == result['latitude']
+    assert 1.5 == result['altitude']
+
+def test_simulated_modem_should_answer_unknown_command_with_error():
+    assert 'API(425)\r\n' == SimulatedModem().handle('reboot\r\n')
+
+def test_simulated_modem_should_inject_errors():
+    modem = SimulatedModem()
+    modem.inject_error(525)
+
+    with pytest.raises(ValueError):
+        LPGAN_API_Rx.get_next_pass(modem.handle(LPGAN_API_Tx.get_next_pass()))
+    LPGAN_API_Rx.get_next_pass(modem.handle(LPGAN_API_Tx.get_next_pass()))
+
+def test_simulated_modem_should_ignore_arduino_framing_and_wakeup():
+    modem = SimulatedModem()
+
+    assert None == modem.handle('Wakeup:1\r\n')
+    assert modem.wakeup_pin
+    assert modem.handle('Modem:go_to_sleep\r\n').startswith('API(603')
+
+def test_hiber_should_initialize_against_simulated_serial():
+    h = sim_hiber(arduino=True)
+    h.initalization()
+    h.set_location(47.686449, -122.254220, 1.5)
+
+    assert '27AA 0DD8' == h.modem['MODEM_NO_STR']
+    assert 47.686449 == h.modem['latitude']
+
+def test_hiber_should_stream_payload_in_chunks():
+    modem = SimulatedModem()
+    h = sim_hiber(modem)
+    data = bytearray(range(256)) * 2
+
+    transfer = h.upload_payload(memoryview(data), chunk_size=100)
+
+    assert [bytes(data)] == modem.payloads
+    assert 512 == transfer.ack.payload_bytes == transfer.bytes_sent
+    assert 6 == transfer.chunks
+    assert transfer.throughput > 0
+
+def test_hiber_should_stream_payload_from_file(tmp_path):
+    path = tmp_path / 'payload.bin'
+    path.write_bytes(b'header' + bytes(range(200)))
+    modem = SimulatedModem()
+    h = sim_hiber(modem, pacing=True)
+
+    with open(path, 'rb') as f:
+        f.seek(6)
+        transfer = h.upload_payload(f, chunk_size=64)
+
+    assert [bytes(range(200))] == modem.payloads
+    assert 4 == transfer.chunks
+    assert 200 == h.pacer.bytes_written - len(b'set_payload("200")\r\n')
+
+def test_hiber_should_reject_short_payload_sources():
+    modem = SimulatedModem()
+    h = sim_hiber(modem)
+
+    with pytest.raises(ValueError):
+        h.upload_payload(b'abc', size=4)
+    with pytest.raises(ValueError):
+        h.upload_payload(io.BytesIO(b'abc'), size=4)
+    assert [] == modem.payloads
+
+def test_hiber_should_give_each_payload_chunk_its_wire_time():
+    modem = SimulatedModem()
+    h = sim_hiber(modem)
+    h.baudrate = 9600
+
+    transfer = h.upload_payload(bytes(192), chunk_size=64)
+
+    # Two gaps of 64 bytes * 10 bits / 9600 baud before the 2nd and 3rd chunk
+    assert transfer.seconds >= 2 * 64 * 10 / 9600
+    assert [bytes(192)] == modem.payloads
+
+def test_hiber_should_refuse_payload_through_line_arduino():
+    modem = SimulatedModem()
+    h = sim_hiber(modem, arduino=True)
+
+    with pytest.raises(ValueError):
+        h.upload_payload(b'\x01\x02\x03')
+    assert 0 == modem.payload_bytes
+    h.get_next_pass()
+
+def test_timeout_should_not_shift_later_responses():
+    modem = SimulatedModem(delay=0.3)
+    modem.pass_period = 5000
+    h = sim_hiber(modem)
+    h.start_reader(poll_interval=0.01)
+    try:
+        h.timeout = 0.1
+        with pytest.raises(ValueError):
+            h.get_next_alarm()
+        h.timeout = 2
+        assert h.get_next_pass().seconds_left_until_pass > 4000
+        assert 47.686449 != h.get_location().latitude
+        h.set_location(47.686449, -122.25422, 1.5)
+        assert 47.686449 == h.get_location(refresh=True).latitude
+    finally:
+        h.stop_reader()
+
+def test_simulated_serial_should_pace_responses_by_delay_and_baudrate():
+    h = sim_hiber(SimulatedModem(delay=0.05, baudrate=9600))
+    start = time.monotonic()
+    h.get_next_pass()
+
+    assert time.monotonic() - start >= 0.05 + 16 * 10 / 9600
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='pty not available')
+def test_hiber_should_talk_to_pty_modem():
+    with PtyModem() as pty:
+        h = Hiber(serial.Serial(pty.port, 19200, timeout=2))
+        try:
+            assert 0 < h.get_next_pass()['seconds_left_until_pass']
+        finally:
+            h._ser.close()
+
+def test_arduino_bridge_should_answer_each_frame_with_one_frame():
+    bridge = ArduinoBridge()
+    frame = ArdFrame.encode([(ARD_WAKEUP, b'\x01'), (ARD_MODEM, b'get_next_pass'), (ARD_MODEM, b'go_to_sleep')])
+    response = ArdFrameDecoder().feed(bridge.feed(frame))
+
+    assert bridge.modem.wakeup_pin
+    assert 1 == len(response)
+    assert [ARD_RESPONSE, ARD_RESPONSE] == [kind for kind, _ in response[0]]
+    assert response[0][1][1].startswith(b'API(603')
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='pty not available')
+def test_hiber_should_talk_framed_passthrough_over_pty():
+    with PtyModem(framed=True) as pty:
+        h = Hiber(pty.port, 19200, arduino='framed')
+        assert h.start(ready_timeout=2.0)
+        try:
+            h.ard_wakeup(False)
+            results = h.pipeline([('get_next_pass', ()), ('get_modem_info', ()), ('go_to_sleep', ())], window=3)
+            assert '27AA 0DD8' == results[1]['MODEM_NO_STR']
+            assert not pty.modem.wakeup_pin
+        finally:
+            h.close()
+
+@pytest.mark.skipif(not hasattr(os, 'openpty'), reason='pty not available')
+def test_hiber_should_upload_payload_through_framed_passthrough():
+    data = b'\r\n\x01\x02\n\x03' * 50
+    with PtyModem(framed=True) as pty:
+        h = Hiber(pty.port, 19200, arduino='framed')
+        assert h.start(ready_timeout=2.0)
+        try:
+            transfer = h.upload_payload(data)
+            assert len(data) == transfer.bytes_sent
+            h.upload_payload(data, chunk_size=len(data))
+            h.get_next_pass()
+            assert [data, data] == pty.modem.payloads
+        finally:
+            h.close()
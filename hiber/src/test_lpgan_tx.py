@@ -1,7 +1,7 @@
 import pytest
 import datetime as dt
 
-from hiber import LPGAN_API_Tx
+from hiber import LPGAN_API_Tx, LPGAN_API_TxBytes
 
 
 #------------------------------
@@ -130,3 +130,49 @@ def test_set_payload_fails_for_non_integer_input():
         LPGAN_API_Tx.set_payload(payload_length)
 
 
+
+
+#------------------------------
+# Bytes encoder
+#------------------------------
+TX_ARGS = {
+    'set_gps_mode': (False,),
+    'do_gps_fix': ('12345,223452',),
+    'get_firmware_version': (),
+    'get_modem_info': (),
+    'set_modem_number': ('ABCD 1234',),
+    'get_location': (),
+    'set_location': (52.333233, 4.212332, 0.0),
+    'get_datetime': (),
+    'set_datetime': (dt.datetime(2019, 10, 25, 10, 59, 48),),
+    'get_next_alarm': (),
+    'get_next_pass': (),
+    'go_to_sleep': (),
+    'toggle_payload_over_debug': (True,),
+    'set_payload': (20,),
+}
+
+@pytest.mark.parametrize('name,args', TX_ARGS.items())
+def test_bytes_encoder_should_match_string_encoder(name, args):
+    expected = getattr(LPGAN_API_Tx, name)(*args).encode()
+    assert expected == getattr(LPGAN_API_TxBytes, name)(*args)
+
+def test_bytes_encoder_should_fail_for_non_numeric_location():
+    with pytest.raises(ValueError):
+        LPGAN_API_TxBytes.set_location('A3', 4.212332, 0.0)
+
+def test_bytes_encoder_should_fail_for_invalid_modem_number():
+    with pytest.raises(ValueError):
+        LPGAN_API_TxBytes.set_modem_number('ABCD1234')
+
+def test_bytes_encoder_should_frame_arduino_commands():
+    assert b'Modem:get_location\r\n\r\n' == LPGAN_API_TxBytes.ard_frame(LPGAN_API_TxBytes.get_location())
+
+def test_encode_batch_should_join_commands_into_one_buffer():
+    commands = [('get_next_pass', ()), ('set_payload', (20,))]
+
+    assert b'get_next_pass\r\nset_payload("20")\r\n' == LPGAN_API_TxBytes.encode_batch(commands)
+    assert (
+        b'Modem:get_next_pass\r\n\r\nModem:set_payload("20")\r\n\r\n'
+        == LPGAN_API_TxBytes.encode_batch(commands, arduino=True)
+    )
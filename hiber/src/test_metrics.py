@@ -0,0 +1,114 @@
+import json
+import time
+import logging
+import pytest
+
+from hiber import Hiber
+from transport import MemoryTransport
+from lpgan_sim import SimulatedModem
+from metrics import Histogram, CommandMetrics, MeteredLink, response_code
+
+
+def metered_hiber(modem=None, **kwargs):
+    return Hiber(MemoryTransport((modem or SimulatedModem()).handle, timeout=0), metrics=True, **kwargs)
+
+class SlowLink:
+    # First byte after `delay`; the rest of the line never arrives
+    def __init__(self, delay, timeout):
+        self.delay = delay
+        self.timeout = timeout
+        self.readline_timeouts = []
+
+    def read(self, size=1):
+        time.sleep(self.delay)
+        return b'A'
+
+    def readline(self):
+        self.readline_timeouts.append(self.timeout)
+        time.sleep(self.timeout)
+        return b''
+
+def test_histogram_should_bucket_and_accumulate():
+    hist = Histogram((0.01, 0.1))
+    for value in (0.005, 0.01, 0.05, 3.0):
+        hist.observe(value)
+
+    assert [2, 1, 1] == hist.counts
+    assert [(0.01, 2), (0.1, 3), (float('inf'), 4)] == hist.cumulative()
+    assert 4 == hist.count
+
+def test_response_code_should_read_code_without_parsing():
+    assert 600 == response_code('API(600: 1)')
+    assert 425 == response_code(b'API(425)')
+    assert None == response_code('Hiber API boot')
+
+def test_metrics_should_time_commands_and_count_bytes():
+    h = metered_hiber()
+    h.get_next_pass()
+    h.get_next_pass()
+
+    snap = h.metrics.snapshot()
+    stats = snap['commands']['get_next_pass']
+    assert 2 == stats['responses']
+    assert 2 == stats['full_line_seconds']['count']
+    assert 2 == stats['first_byte_seconds']['count']
+    assert 2 * len(b'get_next_pass\r\n') == snap['bytes_out']
+    assert 0 < snap['bytes_in']
+
+def test_metrics_should_count_error_codes_and_timeouts():
+    modem = SimulatedModem()
+    h = metered_hiber(modem)
+    modem.inject_error(625, 2)
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            h.get_next_pass()
+
+    silent = Hiber(MemoryTransport(lambda line: None, timeout=0), metrics=True)
+    with pytest.raises(ValueError):
+        silent.get_location()
+
+    assert {'625': 2} == h.metrics.snapshot()['commands']['get_next_pass']['errors']
+    assert 1 == silent.metrics.snapshot()['commands']['get_location']['timeouts']
+
+def test_metrics_should_cover_pipelined_commands():
+    h = metered_hiber(pipeline_window=3)
+    h.pipeline([('get_next_pass', ()), ('get_next_alarm', ()), ('get_next_pass', ())])
+
+    commands = h.metrics.snapshot()['commands']
+    assert 2 == commands['get_next_pass']['full_line_seconds']['count']
+    assert 1 == commands['get_next_alarm']['responses']
+
+def test_metrics_should_export_prometheus_and_json():
+    h = metered_hiber()
+    h.get_next_pass()
+    text = h.metrics.to_prometheus()
+
+    assert '# TYPE hiber_command_latency_seconds histogram' in text
+    assert 'hiber_command_responses_total{command="get_next_pass"} 1' in text
+    assert 'hiber_command_latency_seconds_bucket{command="get_next_pass",phase="full_line",le="+Inf"} 1' in text
+    assert 1 == json.loads(h.metrics.to_json())['commands']['get_next_pass']['responses']
+
+def test_hiber_without_metrics_should_not_wrap_link():
+    transport = MemoryTransport(SimulatedModem().handle)
+    h = Hiber(transport)
+
+    assert h.metrics is None
+    assert h._ser is transport
+
+def test_initialization_should_log_instead_of_print(caplog, capsys):
+    h = metered_hiber()
+    with caplog.at_level(logging.INFO, logger='hiber'):
+        h.initalization()
+
+    assert '' == capsys.readouterr().out
+    assert any('Modem Get Time' in message for message in caplog.messages)
+
+def test_metered_readline_should_keep_the_link_timeout_for_the_whole_line():
+    link = SlowLink(delay=0.1, timeout=0.2)
+    metered = MeteredLink(link, CommandMetrics())
+
+    start = time.monotonic()
+    assert b'A' == metered.readline()
+    assert time.monotonic() - start < 0.3
+    assert link.readline_timeouts[0] <= 0.1
+    assert 0.2 == link.timeout
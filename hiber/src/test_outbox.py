@@ -0,0 +1,85 @@
+from lpgan_sim import SimulatedModem
+from outbox import Outbox, PassScheduler
+from testutil import sim_hiber
+
+
+def test_outbox_should_deduplicate_payloads_and_keys(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+
+    assert outbox.put(b'reading-1') is not None
+    assert outbox.put(b'reading-1') is None
+    assert outbox.put(b'reading-2', key='sensor-7') is not None
+    assert outbox.put(b'reading-3', key='sensor-7') is None
+    assert 2 == outbox.stats()['pending']
+
+def test_outbox_should_order_by_priority_then_age(tmp_path):
+    ticks = iter(range(100))
+    outbox = Outbox(str(tmp_path / 'outbox.db'), clock=lambda: next(ticks))
+    outbox.put(b'low', priority=0)
+    outbox.put(b'high-old', priority=5)
+    outbox.put(b'high-new', priority=5)
+
+    assert [b'high-old', b'high-new', b'low'] == [m.payload for m in outbox.pending()]
+
+def test_select_should_fill_budget_skipping_messages_that_do_not_fit(tmp_path):
+    outbox = Outbox(':memory:')
+    outbox.put(b'a' * 60, priority=9)
+    outbox.put(b'b' * 50, priority=8)
+    outbox.put(b'c' * 30, priority=7)
+    outbox.put(b'd' * 200, priority=10)
+
+    assert [b'a' * 60, b'c' * 30] == [m.payload for m in outbox.select(100)]
+
+def test_select_should_skip_messages_after_max_attempts():
+    outbox = Outbox(':memory:')
+    first = outbox.put(b'first')
+    outbox.put(b'second')
+    outbox.fail(first)
+    outbox.fail(first)
+
+    assert [b'second'] == [m.payload for m in outbox.select(100, max_attempts=2)]
+
+def test_outbox_should_survive_reopen_and_keep_acks(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    outbox = Outbox(path)
+    sent = outbox.put(b'sent')
+    outbox.put(b'kept')
+    outbox.ack(sent, 4)
+    outbox.close()
+
+    outbox = Outbox(path)
+    assert [b'kept'] == [m.payload for m in outbox.pending()]
+    assert 4 == outbox.acked(sent)[1]
+    assert outbox.put(b'sent') is None
+    assert 1 == outbox.prune(before=float('inf'))
+    assert outbox.put(b'sent') is not None
+
+def test_scheduler_should_wait_for_pass_and_upload(tmp_path):
+    modem = SimulatedModem()
+    h = sim_hiber(modem)
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    outbox.put(b'\x00\x01\n\x02' * 10, priority=1)
+    outbox.put(b'x' * 100, priority=0)
+    outbox.put(b'urgent', priority=9)
+    sleeps = []
+
+    scheduler = PassScheduler(h, outbox, budget=64, lead_time=30, sleep=sleeps.append)
+    sent = scheduler.run_once()
+
+    assert 1 == len(sleeps)
+    assert 0 < sleeps[0] <= modem.pass_period - 30
+    assert [b'urgent', b'\x00\x01\n\x02' * 10] == modem.payloads
+    assert 2 == len(sent)
+    assert {'pending': 1, 'pending_bytes': 100, 'acked': 2} == outbox.stats()
+    assert 'go_to_sleep' == modem.commands[-1]
+
+def test_scheduler_should_count_failed_uploads():
+    modem = SimulatedModem()
+    h = sim_hiber(modem)
+    outbox = Outbox(':memory:')
+    message = outbox.put(b'payload')
+    modem.inject_error(625)
+
+    assert [] == PassScheduler(h, outbox, budget=64).run_pass()
+    assert 1 == outbox.pending()[0].attempts
+    assert outbox.acked(message) is None
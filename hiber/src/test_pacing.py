@@ -0,0 +1,90 @@
+import pytest
+
+from pacing import WritePacer
+from lpgan_sim import SimulatedModem
+from testutil import FakeClock, sim_hiber
+
+
+def test_pacer_should_double_gap_on_overflow_and_shrink_additively():
+    pacer = WritePacer(min_gap=0.0, step=0.01)
+    pacer.on_overflow()
+    pacer.on_overflow()
+    assert 0.02 == pytest.approx(pacer.gap)
+
+    pacer.on_success()
+    assert 0.01 == pytest.approx(pacer.gap)
+    pacer.on_success()
+    pacer.on_success()
+    assert 0.0 == pacer.gap
+
+def test_pacer_should_wait_out_the_gap_between_writes():
+    clock = FakeClock()
+    pacer = WritePacer(initial_gap=0.1, clock=clock, sleep=clock.sleep)
+    pacer.wait()
+    pacer.on_write(10)
+    clock.now += 0.04
+    pacer.wait()
+
+    assert [pytest.approx(0.06)] == clock.slept
+
+def test_pacer_retry_delay_should_be_bounded():
+    pacer = WritePacer(backoff=0.1, max_backoff=0.5)
+    assert [0.1, 0.2, 0.4, 0.5] == [pacer.retry_delay(i) for i in range(4)]
+
+def test_pacer_should_recognise_transient_codes():
+    assert WritePacer.is_transient('API(125)\r\n')
+    assert WritePacer.is_transient('API(525)')
+    assert not WritePacer.is_transient('API(600: 1)')
+
+def test_hiber_should_retry_transient_errors():
+    modem = SimulatedModem()
+    modem.inject_error(125, count=2)
+    h = sim_hiber(modem, pacing=WritePacer(backoff=0.001))
+
+    assert 0 < h.get_next_pass()['seconds_left_until_pass']
+    assert 2 == h.pacer.retries
+    assert 2 == h.pacer.overflows
+
+def test_hiber_should_raise_after_retries_run_out():
+    modem = SimulatedModem()
+    modem.inject_error(525, count=5)
+    h = sim_hiber(modem, pacing=WritePacer(max_retries=2, backoff=0.001))
+
+    with pytest.raises(ValueError):
+        h.get_next_pass()
+
+def test_paced_pipeline_should_recover_from_overflows():
+    modem = SimulatedModem(min_command_gap=0.02)
+    h = sim_hiber(modem, pacing=WritePacer(step=0.001, max_retries=10, backoff=0.001))
+
+    results = h.pipeline([('get_next_pass', ())] * 6, window=1)
+
+    assert all(r['seconds_left_until_pass'] > 0 for r in results)
+    assert h.pacer.overflows > 0
+    assert h.pacer.gap >= 0.01
+
+def test_pipeline_should_back_off_before_retrying():
+    modem = SimulatedModem()
+    modem.inject_error(125, count=2)
+    clock = FakeClock()
+    h = sim_hiber(modem, pacing=WritePacer(backoff=0.1, clock=clock, sleep=clock.sleep))
+
+    results = h.pipeline([('get_next_pass', ())], window=1)
+
+    assert 0 < results[0]['seconds_left_until_pass']
+    assert 2 == h.pacer.retries
+    assert [pytest.approx(0.1), pytest.approx(0.2)] == [s for s in clock.slept if s >= 0.1]
+
+def test_pacer_throughput_should_cover_recent_writes_only():
+    clock = FakeClock()
+    pacer = WritePacer(rate_window=1.0, clock=clock, sleep=clock.sleep)
+    pacer.on_write(1000)
+    clock.now += 0.5
+    pacer.on_write(1000)
+    assert 4000 == pytest.approx(pacer.throughput)
+
+    clock.now += 10
+    pacer.on_write(100)
+    clock.now += 1.0
+    assert 100 == pytest.approx(pacer.throughput)
+    assert 2100 == pacer.bytes_written
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from hiber import LPGAN_API_Rx
+from payload import (Schema, UInt, Int, Bool, Fixed, PayloadDecoder, LOCATION_SCHEMA,
+                     COMPRESSED, KIND_SERIES, zigzag, unzigzag, write_varint, read_varint)
+
+
+SENSOR_SCHEMA = Schema([
+    UInt('timestamp', 32),
+    Fixed('temperature', -40.0, 85.0, 0.01),
+    Int('depth', 12),
+    Bool('alarm'),
+], schema_id=2)
+
+def readings(n):
+    rng = random.Random(n)
+    return [
+        {'timestamp': 1600000000 + 60 * i, 'temperature': round(12.5 + rng.uniform(-1, 1), 2),
+         'depth': -100 + i % 3, 'alarm': i % 50 == 0}
+        for i in range(n)
+    ]
+
+def test_varint_and_zigzag_should_round_trip():
+    out = bytearray()
+    values = [0, 1, 127, 128, 300, 2 ** 40]
+    for value in values:
+        write_varint(out, value)
+    offset = 0
+    for value in values:
+        decoded, offset = read_varint(out, offset)
+        assert value == decoded
+    assert offset == len(out)
+    assert [0, 1, 2, 3, 4] == [zigzag(v) for v in (0, -1, 1, -2, 2)]
+    assert all(unzigzag(zigzag(v)) == v for v in range(-1000, 1000))
+
+def test_pack_should_bit_pack_a_location_record():
+    location = LPGAN_API_Rx.get_location('API(600: 47.686400; 8.543700; 12; 3588; 434.000000)')
+    payload = LOCATION_SCHEMA.pack(location)
+
+    # 25 + 26 + 15 bits -> 9 bytes, plus the 2 byte header
+    assert 11 == len(payload)
+    decoded = LOCATION_SCHEMA.decode(payload)
+    assert decoded['latitude'] == pytest.approx(47.6864)
+    assert decoded['longitude'] == pytest.approx(8.5437)
+    assert decoded['altitude'] == 434
+
+def test_fixed_should_store_missing_values_and_reject_out_of_range():
+    schema = Schema([Fixed('value', 0.0, 10.0, 0.5)])
+    assert {'value': None} == schema.decode(schema.pack({'value': float('nan')}))
+    with pytest.raises(ValueError):
+        schema.pack({'value': 10.5})
+
+def test_series_should_round_trip_and_beat_per_record_packing():
+    data = readings(200)
+    payload = SENSOR_SCHEMA.pack_series(data)
+    decoded = SENSOR_SCHEMA.decode(payload)
+
+    assert len(data) == len(decoded)
+    for original, result in zip(data, decoded):
+        assert original['timestamp'] == result['timestamp']
+        assert original['temperature'] == pytest.approx(result['temperature'])
+        assert original['depth'] == result['depth']
+        assert original['alarm'] == result['alarm']
+    assert len(payload) < len(data) * len(SENSOR_SCHEMA.pack(data[0]))
+
+def test_compression_should_only_be_used_when_smaller():
+    data = readings(200)
+    compressed = SENSOR_SCHEMA.pack_series(data, compress=True)
+    assert compressed[0] == KIND_SERIES | COMPRESSED
+    assert len(compressed) < len(SENSOR_SCHEMA.pack_series(data))
+    assert SENSOR_SCHEMA.decode(compressed) == SENSOR_SCHEMA.decode(SENSOR_SCHEMA.pack_series(data))
+
+    single = SENSOR_SCHEMA.pack_series(data[:1], compress=True)
+    assert single[0] == KIND_SERIES
+
+def test_pack_fit_should_pack_as_many_readings_as_the_budget_allows():
+    data = readings(500)
+    payload, count = SENSOR_SCHEMA.pack_fit(data, 64)
+
+    assert len(payload) <= 64
+    assert 0 < count < len(data)
+    assert len(SENSOR_SCHEMA.pack_series(data[:count + 1])) > 64 or \
+        len(SENSOR_SCHEMA.pack_series(data[:count + 1], compress=True)) > 64
+    assert count == len(SENSOR_SCHEMA.decode(payload))
+    assert (b'', 0) == SENSOR_SCHEMA.pack_fit(data, 2)
+
+def test_payload_decoder_should_dispatch_on_schema_id():
+    decoder = PayloadDecoder([LOCATION_SCHEMA, SENSOR_SCHEMA])
+    schema, values = decoder.decode(SENSOR_SCHEMA.pack_series(readings(3)))
+    assert schema is SENSOR_SCHEMA
+    assert 3 == len(values)
+
+    with pytest.raises(ValueError):
+        decoder.decode(bytes((KIND_SERIES, 99, 0)))
+    with pytest.raises(ValueError):
+        LOCATION_SCHEMA.decode(SENSOR_SCHEMA.pack(readings(1)[0]))
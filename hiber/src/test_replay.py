@@ -0,0 +1,55 @@
+from hiber import Hiber, ArdFrame, ARD_RESPONSE, CommandError
+from transport import MemoryTransport
+from lpgan_sim import SimulatedModem
+from capture import TX, RX, TrafficCapture
+from replay import replay, command_name, ReplayTransport
+
+
+def write_capture(path, records, framed=False):
+    with TrafficCapture(path, framed=framed) as capture:
+        for direction, data in records:
+            capture.record(direction, data)
+
+def test_command_name_should_strip_arduino_framing():
+    assert 'get_location' == command_name(b'Modem:get_location\r\n')
+    assert 'set_gps_mode' == command_name(b'set_gps_mode(1)\r\n')
+    assert None == command_name(b'Wakeup:1\r\n')
+    assert None == command_name(b'parse\r\n')
+
+def test_replay_should_pair_responses_with_commands(tmp_path):
+    path = str(tmp_path / 'incident.hcap')
+    write_capture(path, [
+        (TX, b'get_next_pass\r\nget_location\r\n'),
+        (RX, b'Hiber API boot\r\nAPI(600: 12'),
+        (RX, b'98)\r\nAPI(425)\r\n'),
+        (TX, b'get_datetime\r\n'),
+        (RX, b'API(600: 2019-02-25T16:14:40Z)\r\nAPI(600)\r\n'),
+    ])
+    events = list(replay(path))
+
+    assert [None, 'get_next_pass', 'get_location', 'get_datetime', None] == [e.command for e in events]
+    assert 'Hiber API boot' == events[0].line
+    assert 1298 == events[1].result.seconds_left_until_pass
+    assert isinstance(events[2].error, CommandError)
+    assert '2019-02-25T16:14:40Z' == events[3].result.datetime
+    assert (600, ()) == events[4].result
+
+def test_replay_should_decode_framed_captures(tmp_path):
+    path = str(tmp_path / 'framed.hcap')
+    write_capture(path, [
+        (TX, ArdFrame.commands(b'get_next_pass\r\n', wakeup=True)),
+        (RX, ArdFrame.encode([(ARD_RESPONSE, b'API(600: 1298)')])),
+    ], framed=True)
+
+    [event] = replay(path)
+    assert ('get_next_pass', 1298) == (event.command, event.result.seconds_left_until_pass)
+
+def test_replay_transport_should_rerun_a_captured_session(tmp_path):
+    path = str(tmp_path / 'session.hcap')
+    live = Hiber(MemoryTransport(SimulatedModem().handle), capture=path)
+    expected = [live.get_next_pass(), live._command('get_modem_info')]
+    live.close()
+
+    rerun = Hiber(ReplayTransport(path))
+    assert expected == [rerun.get_next_pass(), rerun._command('get_modem_info')]
+    assert [b'get_next_pass\r\n', b'get_modem_info\r\n'] == rerun._ser.written
@@ -0,0 +1,57 @@
+import threading
+
+from shared_hiber import SharedHiber
+from lpgan_sim import SimulatedModem
+from testutil import sim_hiber
+
+
+def shared(delay=0.1):
+    return SharedHiber(sim_hiber(SimulatedModem(delay=delay)))
+
+
+def run_threads(count, target):
+    results = [None] * count
+    start = threading.Barrier(count)
+
+    def worker(i):
+        start.wait()
+        results[i] = target()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_concurrent_identical_queries_should_share_one_transaction():
+    s = shared()
+    results = run_threads(8, s.get_next_pass)
+
+    assert 1 == s.hiber._ser.modem.commands.count('get_next_pass')
+    assert 7 == s.coalesced
+    assert all(r == results[0] for r in results)
+
+def test_mutating_commands_should_not_be_merged():
+    s = shared(delay=0.01)
+    run_threads(4, lambda: s.set_location(47.686449, -122.254220, 1.5))
+
+    assert 4 == s.transactions
+    assert 0 == s.coalesced
+
+def test_failed_query_should_raise_for_every_waiting_caller():
+    s = shared()
+    s.hiber._ser.modem.inject_error(525)
+    errors = []
+
+    def query():
+        try:
+            s.get_next_alarm()
+        except ValueError as e:
+            errors.append(e)
+
+    run_threads(4, query)
+
+    assert 4 == len(errors)
+    assert 1 == s.transactions
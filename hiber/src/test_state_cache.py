@@ -0,0 +1,58 @@
+from hiber import LPGAN_API_Rx
+from state_cache import StateCache
+from testutil import FakeClock, sim_hiber
+
+
+def test_cache_should_extrapolate_next_pass_countdown():
+    clock = FakeClock(100.0)
+    cache = StateCache(clock=clock)
+    cache.put('get_next_pass', LPGAN_API_Rx.get_next_pass('API(600: 1298)'))
+    clock.now += 10.5
+
+    assert 1288 == cache.get('get_next_pass').seconds_left_until_pass
+    assert 1 == cache.hits
+
+def test_cache_should_extrapolate_location_fix_ages():
+    clock = FakeClock(100.0)
+    cache = StateCache(clock=clock)
+    cache.put('get_location', LPGAN_API_Rx.get_location('API(600: 1.0; 2.0; 100; -2147483648; 0.0)'))
+    clock.now += 5
+
+    result = cache.get('get_location')
+    assert 105 == result.seconds_since_last_fix
+    assert -2147483648 == result.seconds_until_next_fix
+
+def test_cache_should_miss_after_ttl_or_countdown_expiry():
+    clock = FakeClock(100.0)
+    cache = StateCache(ttl={'get_next_pass': 5}, clock=clock)
+    cache.put('get_next_pass', LPGAN_API_Rx.get_next_pass('API(600: 1298)'))
+    cache.put('get_next_alarm', LPGAN_API_Rx.get_next_alarm('API(600: 3; 4)'))
+    clock.now += 6
+
+    assert None == cache.get('get_next_pass')
+    assert None == cache.get('get_next_alarm')
+    assert 2 == cache.misses
+
+def test_cache_should_invalidate_entries():
+    cache = StateCache()
+    cache.put('get_next_pass', LPGAN_API_Rx.get_next_pass('API(600: 1298)'))
+    cache.invalidate('get_next_pass')
+
+    assert None == cache.get('get_next_pass')
+
+def test_hiber_cache_should_skip_modem_round_trips():
+    h = sim_hiber(cache=True)
+    h.get_next_pass()
+    h.get_next_pass()
+    h.get_next_pass(refresh=True)
+
+    assert 2 == h._ser.modem.commands.count('get_next_pass')
+    assert {'hits': 1, 'misses': 1, 'entries': 1} == h.cache.stats()
+
+def test_hiber_cache_should_invalidate_on_set_datetime():
+    h = sim_hiber(cache=True)
+    h.get_next_alarm()
+    h.set_datetime(h._ser.modem.now().replace(microsecond=0))
+    h.get_next_alarm()
+
+    assert 2 == h._ser.modem.commands.count('get_next_alarm')
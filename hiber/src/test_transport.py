@@ -0,0 +1,97 @@
+import pytest
+
+from hiber import Hiber
+from lpgan_sim import SimulatedModem, TcpModem
+from transport import (
+    valid_port, open_transport, SocketTransport, MemoryTransport, ConnectionPool,
+)
+
+
+def test_valid_port_should_accept_com_dev_and_socket_ports():
+    assert valid_port('COM3')
+    assert valid_port('/dev/ttyUSB0')
+    assert valid_port('/dev/pts/4')
+    assert valid_port('socket://10.0.0.7:7000')
+    assert not valid_port('C1')
+    assert not valid_port('COM12a')
+    assert not valid_port('socket://host')
+    assert not valid_port([])
+
+def test_hiber_should_build_serial_for_dev_ports():
+    h = Hiber('/dev/ttyUSB0', 9600)
+
+    assert '/dev/ttyUSB0' == h._ser.port
+    assert 9600 == h._ser.baudrate
+
+def test_open_transport_should_not_connect_sockets_until_open():
+    transport = open_transport('socket://127.0.0.1:1')
+
+    assert isinstance(transport, SocketTransport)
+    assert not transport.is_open
+
+def test_hiber_should_talk_to_memory_transport():
+    h = Hiber(MemoryTransport(SimulatedModem().handle))
+    result = h.get_next_pass()
+
+    assert 0 < result['seconds_left_until_pass']
+    assert b'get_next_pass\r\n' == bytes(h._ser.written)
+
+def test_hiber_should_reject_objects_that_are_not_transports():
+    with pytest.raises(ValueError):
+        Hiber(object())
+
+def test_hiber_should_talk_to_tcp_serial_server():
+    with TcpModem() as server:
+        h = Hiber(server.port, 19200)
+        assert h.start(ready_timeout=2.0)
+        try:
+            assert 0 < h.get_next_pass()['seconds_left_until_pass']
+            assert '27AA 0DD8' == h._command('get_modem_info')['MODEM_NO_STR']
+        finally:
+            h.close()
+        assert not h._ser.is_open
+
+def test_socket_transport_readline_should_time_out():
+    with TcpModem() as server:
+        transport = open_transport(server.port, timeout=0.05)
+        transport.open()
+        try:
+            assert b'' == transport.readline()
+            assert 0 == transport.in_waiting
+        finally:
+            transport.close()
+
+def test_pool_should_reuse_connections_across_hiber_instances():
+    pool = ConnectionPool()
+    with TcpModem() as server:
+        for _ in range(3):
+            h = Hiber(server.port, 19200, pool=pool)
+            assert 0 < h.get_next_pass()['seconds_left_until_pass']
+            h.close()
+
+        assert 1 == server.connections
+        assert {'created': 1, 'reused': 2, 'idle': 1} == pool.stats()
+        pool.close()
+        assert 0 == pool.stats()['idle']
+
+def test_pool_should_hand_out_separate_connections_while_leased():
+    pool = ConnectionPool()
+    with TcpModem() as server:
+        first = Hiber(server.port, 19200, pool=pool)
+        second = Hiber(server.port, 19200, pool=pool)
+
+        assert first._ser is not second._ser
+        first.close()
+        second.close()
+        assert 2 == pool.stats()['idle']
+        pool.close()
+
+def test_pool_should_drop_connections_closed_by_the_server():
+    pool = ConnectionPool()
+    with TcpModem() as server:
+        Hiber(server.port, 19200, pool=pool).close()
+        assert 1 == pool.stats()['idle']
+    # The server closed the idle socket; it must not be handed out again
+    with pytest.raises(OSError):
+        pool.acquire(server.port)
+    assert {'created': 1, 'reused': 0, 'idle': 0} == pool.stats()
@@ -0,0 +1,36 @@
+'''
+Helpers shared by the test modules.
+'''
+from hiber import Hiber
+from lpgan_sim import SimulatedModem, SimulatedSerial
+
+
+class FakeClock:
+    '''
+    Monotonic clock that only moves when a test advances `now` or sleeps.
+    '''
+    def __init__(self, now=0.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def sim_hiber(modem=None, open=True, **kwargs):
+    '''
+    Hiber talking to a SimulatedModem over a SimulatedSerial link.
+
+    Args:
+        modem: SimulatedModem to answer; a default one if None
+        open: Open the link, as start() would
+        kwargs: Passed on to Hiber
+    '''
+    link = SimulatedSerial(modem or SimulatedModem())
+    if open:
+        link.open()
+    return Hiber(link, **kwargs)
@@ -0,0 +1,327 @@
+'''
+Transports for the Hiber link.
+
+Hiber talks to whatever sits in `Hiber._ser` through the pyserial subset it
+uses: open, close, write, read, readline, in_waiting, reset_input_buffer
+and a `timeout` attribute.  serial.Serial covers COM ports and /dev/tty*
+devices (including pty slaves); SocketTransport covers TCP serial servers
+("socket://host:port"); MemoryTransport answers in-process.  ConnectionPool
+keeps sockets to remote serial servers open between Hiber instances.
+'''
+import re
+import time
+import socket
+import select
+import threading
+
+import serial
+
+
+PORT_RE = re.compile(r'^(COM\d+|/dev/[\w./-]+|socket://[\w.-]+:\d+)$')
+_SOCKET_URL_RE = re.compile(r'^socket://([\w.-]+):(\d+)$')
+
+
+def valid_port(port):
+    '''
+    True for "COMn", "/dev/..." and "socket://host:port" port names.
+    '''
+    return isinstance(port, str) and PORT_RE.match(port) is not None
+
+
+def parse_socket_url(url):
+    '''
+    Split "socket://host:port" into (host, port).
+    '''
+    match = _SOCKET_URL_RE.match(url)
+    if match is None:
+        raise ValueError('Invalid socket URL')
+    return match.group(1), int(match.group(2))
+
+
+def open_transport(port, baudrate=19200, timeout=10, pool=None):
+    '''
+    Transport for a validated port name (not yet opened for serial ports).
+
+    Args:
+        port: "COMn", "/dev/..." or "socket://host:port"
+        baudrate: Serial baudrate (ignored for sockets)
+        timeout: Read timeout (seconds)
+        pool: ConnectionPool to take socket connections from
+    Returns:
+        serial.Serial or SocketTransport
+    '''
+    if port.startswith('socket://'):
+        if pool is not None:
+            return pool.acquire(port, timeout)
+        host, tcp_port = parse_socket_url(port)
+        return SocketTransport(host, tcp_port, timeout)
+    ser = serial.Serial()
+    ser.port = port
+    ser.baudrate = baudrate
+    ser.bytesize = 8
+    ser.parity = 'N'
+    ser.stopbits = 1
+    ser.timeout = timeout
+    return ser
+
+
+class SocketTransport:
+    '''
+    Raw TCP connection to a serial server, with pyserial-style reads.
+
+    Args:
+        host: Server host name or address
+        port: Server TCP port
+        timeout: Read timeout (seconds); None blocks, 0 polls
+        connect_timeout: Timeout for establishing the connection
+    '''
+    def __init__(self, host, port, timeout=10, connect_timeout=5.0):
+        self.host = host
+        self.tcp_port = port
+        self.port = 'socket://%s:%d' % (host, port)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool = None
+        self._sock = None
+        self._buf = bytearray()
+
+    @property
+    def is_open(self):
+        return self._sock is not None
+
+    def open(self):
+        if self._sock is not None:
+            return
+        sock = socket.create_connection((self.host, self.tcp_port), self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setblocking(False)
+        self._sock = sock
+        self._buf.clear()
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        self._buf.clear()
+
+    def _fill(self, wait):
+        '''
+        Receive whatever is available within `wait` seconds.
+        '''
+        if self._sock is None:
+            raise serial.SerialException('Socket not open')
+        readable, _, _ = select.select([self._sock], [], [], max(wait, 0.0))
+        if not readable:
+            return False
+        data = self._sock.recv(4096)
+        if not data:
+            self.close()
+            raise serial.SerialException('Connection closed by serial server')
+        self._buf += data
+        return True
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        return time.monotonic() + self.timeout
+
+    def _remaining(self, deadline):
+        if deadline is None:
+            return 1.0
+        return deadline - time.monotonic()
+
+    def write(self, data):
+        if self._sock is None:
+            raise serial.SerialException('Socket not open')
+        view = memoryview(data)
+        while view:
+            select.select([], [self._sock], [])
+            sent = self._sock.send(view)
+            view = view[sent:]
+        return len(data)
+
+    def _drain(self):
+        while self._sock is not None and self._fill(0):
+            pass
+
+    @property
+    def in_waiting(self):
+        self._drain()
+        return len(self._buf)
+
+    def read(self, size=1):
+        deadline = self._deadline()
+        while len(self._buf) < size:
+            remaining = self._remaining(deadline)
+            self._fill(remaining)
+            if remaining <= 0:
+                break
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def readline(self):
+        deadline = self._deadline()
+        while True:
+            end = self._buf.find(b"\n")
+            if end >= 0:
+                line = bytes(self._buf[:end + 1])
+                del self._buf[:end + 1]
+                return line
+            remaining = self._remaining(deadline)
+            self._fill(remaining)
+            if remaining <= 0 and self._buf.find(b"\n") < 0:
+                line = bytes(self._buf)
+                self._buf.clear()
+                return line
+
+    def reset_input_buffer(self):
+        self._drain()
+        self._buf.clear()
+
+
+class MemoryTransport:
+    '''
+    In-process transport: every line written is answered by `handler`.
+
+    Args:
+        handler: Callable(line str) -> response str/bytes or None, e.g.
+            lpgan_sim.SimulatedModem().handle
+        timeout: Kept for pyserial compatibility; reads never block
+    '''
+    def __init__(self, handler, port='MEMORY', timeout=10):
+        self.handler = handler
+        self.port = port
+        self.timeout = timeout
+        self.is_open = False
+        self.written = bytearray()
+        self._buf = bytearray()
+        self._pending = bytearray()
+
+    def open(self):
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def write(self, data):
+        self.written += data
+        self._pending += data
+        while True:
+            end = self._pending.find(b"\n")
+            if end < 0:
+                break
+            line = self._pending[:end + 1].decode()
+            del self._pending[:end + 1]
+            response = self.handler(line)
+            if response is None:
+                continue
+            if isinstance(response, str):
+                response = response.encode()
+            self._buf += response
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        return len(self._buf)
+
+    def read(self, size=1):
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        return data
+
+    def readline(self):
+        end = self._buf.find(b"\n")
+        end = len(self._buf) if end < 0 else end + 1
+        line = bytes(self._buf[:end])
+        del self._buf[:end]
+        return line
+
+    def reset_input_buffer(self):
+        self._buf.clear()
+
+
+class ConnectionPool:
+    '''
+    Open socket connections to serial servers, reused across Hiber instances.
+
+    A connection is leased to one Hiber at a time (a serial link carries a
+    single conversation); Hiber.close() hands it back instead of closing it.
+    At most `max_idle` idle connections are kept per server.
+
+    Args:
+        max_idle: Idle connections kept per URL
+        connect_timeout: Timeout for new connections (seconds)
+    '''
+    def __init__(self, max_idle=4, connect_timeout=5.0):
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self.created = 0
+        self.reused = 0
+        self._lock = threading.Lock()
+        self._idle = {}
+
+    def acquire(self, url, timeout=10):
+        '''
+        Open connection to `url`, reusing an idle one when available.
+
+        Returns:
+            SocketTransport (already open), owned by the caller until release()
+        '''
+        conn = self._take_idle(url)
+        if conn is None:
+            host, port = parse_socket_url(url)
+            conn = SocketTransport(host, port, timeout, self.connect_timeout)
+            conn.open()
+            conn.pool = self
+            with self._lock:
+                self.created += 1
+        else:
+            conn.timeout = timeout
+        return conn
+
+    def _take_idle(self, url):
+        while True:
+            with self._lock:
+                idle = self._idle.get(url)
+                if not idle:
+                    return None
+                conn = idle.pop()
+            try:
+                # Drops anything left over from the previous user and
+                # notices connections the server has closed meanwhile
+                conn.reset_input_buffer()
+            except (OSError, serial.SerialException):
+                conn.close()
+                continue
+            with self._lock:
+                self.reused += 1
+            return conn
+
+    def release(self, conn):
+        '''
+        Return a connection; closes it if the pool is full or it is closed.
+        '''
+        if not conn.is_open:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(conn.port, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        '''
+        Close every idle connection.
+        '''
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def stats(self):
+        with self._lock:
+            idle = sum(len(conns) for conns in self._idle.values())
+        return {'created': self.created, 'reused': self.reused, 'idle': idle}